@@ -0,0 +1,223 @@
+# PreBurst Signals Telegram Bot
+#
+# Antoine Beretto
+# GitHub: @augustin999
+#
+# April 2021
+
+import threading
+import time as tm
+from pathlib import Path
+
+import numpy as np
+
+from scanner import utils
+from scanner.universe import UNIVERSE_MANAGER
+
+
+class P2Quantile:
+    """
+    Streaming estimate of the q quantile with the P² algorithm (Jain & Chlamtac, 1985):
+    five markers (min, q/2, q, (1+q)/2, max) whose heights are adjusted with a piecewise-parabolic
+    interpolation at each observation. O(1) time and memory per observation, no history kept.
+    """
+
+    def __init__(self, q: float):
+        self.q = q
+        self.count = 0
+        # Marker heights, then actual and desired positions (0-based)
+        self.heights = []
+        self.positions = [0, 1, 2, 3, 4]
+        self.desired = [0, 2*q, 4*q, 2 + 2*q, 4]
+        self.increments = [0, q/2, q, (1 + q)/2, 1]
+
+    def update(self, x: float):
+        self.count += 1
+        heights, positions = self.heights, self.positions
+        if self.count <= 5:
+            heights.append(x)
+            heights.sort()
+            return
+        if x < heights[0]:
+            heights[0] = x
+            k = 0
+        elif x >= heights[4]:
+            heights[4] = x
+            k = 3
+        else:
+            k = 0
+            while x >= heights[k + 1]:
+                k += 1
+        for i in range(k + 1, 5):
+            positions[i] += 1
+        for i in range(5):
+            self.desired[i] += self.increments[i]
+        for i in range(1, 4):
+            d = self.desired[i] - positions[i]
+            if (d >= 1 and positions[i + 1] - positions[i] > 1) or (d <= -1 and positions[i - 1] - positions[i] < -1):
+                d = 1 if d > 0 else -1
+                height = self._parabolic(i, d)
+                if not heights[i - 1] < height < heights[i + 1]:
+                    height = heights[i] + d*(heights[i + d] - heights[i]) / (positions[i + d] - positions[i])
+                heights[i] = height
+                positions[i] += d
+
+    def _parabolic(self, i: int, d: int):
+        h, n = self.heights, self.positions
+        return h[i] + d / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + d)*(h[i + 1] - h[i]) / (n[i + 1] - n[i])
+            + (n[i + 1] - n[i] - d)*(h[i] - h[i - 1]) / (n[i] - n[i - 1])
+        )
+
+    def value(self):
+        """ Current estimate, exact below 5 observations, NaN before any """
+        if self.count == 0:
+            return np.nan
+        if self.count <= 5:
+            return float(np.quantile(self.heights, self.q))
+        return self.heights[2]
+
+
+class RollingQuantile:
+    """
+    Quantile of roughly the last `window` observations from two P² sketches: every observation
+    feeds both, the estimate is read from the older one, and every `window` observations the
+    younger one (which has seen exactly the last `window`) replaces it while a fresh one starts.
+    The estimate thus always covers between `window` and 2*`window` observations, so the threshold
+    follows volatility regimes instead of averaging over the whole history.
+    """
+
+    def __init__(self, q: float, window: int):
+        self.q = q
+        self.window = window
+        self.current = P2Quantile(q)
+        self.next = P2Quantile(q)
+        self.last_open_time = None
+
+    def update(self, x: float):
+        self.current.update(x)
+        self.next.update(x)
+        if self.next.count >= self.window:
+            self.current, self.next = self.next, P2Quantile(self.q)
+
+    def value(self):
+        return self.current.value()
+
+    @property
+    def count(self):
+        return self.current.count
+
+
+class AdaptiveThresholds:
+    """
+    Adaptive BB span threshold of each (pair, timeframe) (utils.THRESHOLD_MODE = 'adaptive'): the
+    ADAPTIVE_THRESHOLD_QUANTILE rolling quantile of its own BB span, one RollingQuantile per key.
+    Spans are fed by open time, so the overlapping windows of consecutive scans only add their new candles.
+    The sketches are checkpointed to disk so that a restart keeps the history they summarize.
+    """
+
+    def __init__(
+        self,
+        quantile=utils.ADAPTIVE_THRESHOLD_QUANTILE,
+        window=utils.ADAPTIVE_THRESHOLD_WINDOW,
+        min_candles=utils.ADAPTIVE_THRESHOLD_MIN_CANDLES
+    ):
+        self.quantile = quantile
+        self.window = window
+        self.min_candles = min_candles
+        # {(pair, timeframe): RollingQuantile}
+        self.sketches = dict()
+        self.saved_at = tm.monotonic()
+        self.lock = threading.Lock()
+
+    def observe(self, pair: str, timeframe: str, open_times, spans):
+        """
+        Feed the BB spans of the candles newer than the last one seen for (pair, timeframe), NaN spans
+        are skipped (open times in ms or datetime64).
+        Returns the threshold after them, NaN while fewer than min_candles spans were seen.
+        """
+        with self.lock:
+            sketch = self.sketches.get((pair, timeframe))
+            if sketch is None:
+                sketch = self.sketches[(pair, timeframe)] = RollingQuantile(self.quantile, self.window)
+            open_times = np.asarray(open_times)
+            if open_times.dtype.kind == 'M':
+                open_times = open_times.astype('datetime64[ms]')
+            open_times = open_times.astype(np.int64)
+            spans = np.asarray(spans, dtype=np.float64)
+            start = 0 if sketch.last_open_time is None else np.searchsorted(open_times, sketch.last_open_time, side='right')
+            for open_time, span in zip(open_times[start:], spans[start:]):
+                if np.isnan(span):
+                    continue
+                sketch.update(float(span))
+                sketch.last_open_time = int(open_time)
+            return sketch.value() if sketch.count >= self.min_candles else np.nan
+
+    def threshold(self, pair: str, timeframe=utils.TIMEFRAME):
+        """ Current threshold of (pair, timeframe) without feeding it, NaN if not warm yet """
+        sketch = self.sketches.get((pair, timeframe))
+        if sketch is None or sketch.count < self.min_candles:
+            return np.nan
+        return sketch.value()
+
+    def save(self, path: Path = utils.adaptive_thresholds_path):
+        """ Checkpoint every sketch """
+        with self.lock:
+            utils.dump_pickle(self.sketches, path)
+            self.saved_at = tm.monotonic()
+
+    def checkpoint(self, interval=utils.ADAPTIVE_THRESHOLD_SAVE_INTERVAL, path: Path = utils.adaptive_thresholds_path):
+        """ Save, if the last save is older than `interval` seconds """
+        if tm.monotonic() - self.saved_at >= interval:
+            self.save(path)
+
+    @classmethod
+    def load(cls, path: Path = utils.adaptive_thresholds_path):
+        """ Restore the sketches from a checkpoint, or start empty if there is none """
+        thresholds = cls()
+        if Path(path).exists():
+            try:
+                thresholds.sketches = utils.load_pickle(path)
+            except Exception as e:
+                print(f'Error in AdaptiveThresholds.load()\nCheckpoint ignored\n{e}')
+        return thresholds
+
+
+# Restored from the checkpoint on first use (see get_adaptive_thresholds), so static mode never unpickles it
+ADAPTIVE_THRESHOLDS = None
+_lock = threading.Lock()
+
+
+def get_adaptive_thresholds():
+    """ The AdaptiveThresholds of the scans, loaded from its checkpoint the first time it is needed """
+    global ADAPTIVE_THRESHOLDS
+    with _lock:
+        if ADAPTIVE_THRESHOLDS is None:
+            ADAPTIVE_THRESHOLDS = AdaptiveThresholds.load()
+        return ADAPTIVE_THRESHOLDS
+
+
+def threshold(pair: str, timeframe: str, open_times, spans, close=None):
+    """
+    BB span threshold used by the scans for the latest candle of a pair.
+    In adaptive mode, the spans are fed to the pair's sketch and its quantile is used once warm;
+    otherwise (or until then) the UniverseManager threshold (calibrated, static or automatic).
+    """
+    if utils.THRESHOLD_MODE == 'adaptive':
+        value = get_adaptive_thresholds().observe(pair, timeframe, open_times, spans)
+        if not np.isnan(value):
+            return value
+    return UNIVERSE_MANAGER.threshold(pair, close, timeframe)
+
+
+def thresholds(pairs: list, timeframe: str, open_times, spans: np.ndarray, close: np.ndarray = None, static: np.ndarray = None):
+    """
+    threshold() of several pairs as a vector, from (pairs x candles) spans and closes aligned on open_times.
+    `static` is the UniverseManager thresholds vector when the caller already has it.
+    """
+    values = UNIVERSE_MANAGER.thresholds(pairs, close, timeframe) if static is None else static
+    if utils.THRESHOLD_MODE == 'adaptive':
+        sketches = get_adaptive_thresholds()
+        adaptive = np.array([sketches.observe(pair, timeframe, open_times, row) for pair, row in zip(pairs, spans)])
+        values = np.where(np.isnan(adaptive), values, adaptive)
+    return values
@@ -0,0 +1,145 @@
+# PreBurst Signals Telegram Bot
+#
+# Antoine Beretto
+# GitHub: @augustin999
+#
+# April 2021
+
+import asyncio
+import aiohttp
+import numpy as np
+from urllib.parse import urlencode
+
+from scanner import futures_api, utils
+from scanner.http_client import decode_json, decode_klines
+
+
+class AsyncFuturesClient:
+    """
+    asyncio client for the public market data endpoints of the Binance Futures API.
+    One connection pool is shared by every call and a semaphore caps the number of
+    requests in flight, so a single event loop can drive hundreds of pair fetches.
+
+    Usage:
+        async with AsyncFuturesClient() as client:
+            klines = await client.get_contract_klines('BTCUSDT', '4h', limit=480)
+    """
+
+    def __init__(
+        self,
+        base_url=futures_api.BASE_URL,
+        max_concurrency=utils.ASYNC_MAX_CONCURRENCY,
+        pool_size=utils.HTTP_POOL_SIZE,
+        timeout=utils.HTTP_TIMEOUT,
+        max_retries=utils.HTTP_MAX_RETRIES,
+        backoff_factor=utils.HTTP_BACKOFF_FACTOR
+    ):
+        self.base_url = base_url
+        self.max_concurrency = max_concurrency
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        # Both are bound to the running event loop, so they are created on first use
+        self.session = None
+        self.semaphore = None
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    async def open(self):
+        if self.session is None:
+            connector = aiohttp.TCPConnector(limit=self.pool_size)
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers={'Content-Type': 'application/json;charset=utf-8'}
+            )
+            self.semaphore = asyncio.Semaphore(self.max_concurrency)
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def send_public_request(self, url_path: str, payload={}, raw=False):
+        """
+        Prepare and send an unsigned request.
+        Retries with exponential backoff on 429/5xx, honouring the Retry-After header.
+        Set raw to get the undecoded response body (bytes).
+        """
+        await self.open()
+        query_string = urlencode(payload, True)
+        url = self.base_url + url_path
+        if query_string:
+            url = url + '?' + query_string
+        for attempt in range(self.max_retries + 1):
+            async with self.semaphore:
+                async with self.session.get(url) as response:
+                    if response.status not in utils.HTTP_RETRY_STATUSES or attempt == self.max_retries:
+                        content = await response.read()
+                        return content if raw else decode_json(content)
+                    retry_after = response.headers.get('Retry-After')
+            delay = float(retry_after) if retry_after else self.backoff_factor * 2**attempt
+            await asyncio.sleep(delay)
+
+    # GENERAL ENDPOINTS
+    # -----------------
+
+    async def get_server_time(self):
+        """ Returns current time in milliseconds on the Binance server """
+        response = await self.send_public_request('/fapi/v1/time')
+        return response['serverTime']
+
+    async def get_exchange_info(self):
+        """ Returns current exchange trading rules and symbols information """
+        return await self.send_public_request('/fapi/v1/exchangeInfo')
+
+    # PUBLIC ENDPOINTS
+    # -----------------
+
+    async def get_klines(self, pair: str, intervals: str, startTime=None, endTime=None, limit=1500):
+        """ Async version of futures_api.get_klines """
+        params = {'symbol': pair.upper(), 'interval': intervals, 'limit': limit}
+        if startTime != None:
+            params['startTime'] = startTime
+        if endTime != None:
+            params['endTime'] = endTime
+        content = await self.send_public_request('/fapi/v1/klines', params, raw=True)
+        return decode_klines(content)
+
+    async def get_contract_klines(self, pair: str, intervals: str, contractType='PERPETUAL', startTime=None, endTime=None, limit=1500):
+        """ Async version of futures_api.get_contract_klines """
+        params = {'pair': pair.upper(), 'interval': intervals.lower(), 'limit': limit, 'contractType': contractType}
+        if startTime != None:
+            params['startTime'] = startTime
+        if endTime != None:
+            params['endTime'] = endTime
+        content = await self.send_public_request('/fapi/v1/continuousKlines', params, raw=True)
+        return decode_klines(content)
+
+    async def get_price(self, pair: str):
+        """ Async version of futures_api.get_price """
+        ticker = await self.send_public_request('/fapi/v1/ticker/price', {'symbol': pair})
+        return np.float64(ticker['price'])
+
+    async def get_many_contract_klines(self, pairs: list, intervals: str, **kwargs):
+        """
+        Fetch the klines of every pair concurrently.
+        Returns a dict {pair: klines}, pairs whose request failed are left out and reported.
+        """
+        results = await asyncio.gather(
+            *[self.get_contract_klines(pair, intervals, **kwargs) for pair in pairs],
+            return_exceptions=True
+        )
+        klines = dict()
+        for pair, result in zip(pairs, results):
+            if isinstance(result, Exception):
+                print(f'Error in AsyncFuturesClient.get_many_contract_klines()\nFetch failed for {pair}\n{result}')
+                continue
+            klines[pair] = result
+        return klines
@@ -0,0 +1,216 @@
+# PreBurst Signals Telegram Bot
+#
+# Antoine Beretto
+# GitHub: @augustin999
+#
+# April 2021
+
+import argparse
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from scanner import indicators, ohlc_store, universe, utils
+
+
+def load_universe(pairs: list, timeframe=utils.TIMEFRAME, start=None, end=None, store: ohlc_store.OhlcStore = None):
+    """
+    Read the stored candles of several pairs and align them on their open times.
+    A timeframe missing from the store is resampled from the longest stored timeframe dividing it.
+
+    Response:
+        pairs (list), open_times (np.ndarray), close, high, low: (pairs x candles) arrays, NaN where a pair has no candle
+    """
+    store = store or ohlc_store.OHLC_STORE
+    ohlcs = dict()
+    interval = utils.TIMEFRAMES_MS[timeframe]
+    for pair in pairs:
+        sources = [
+            source for source, source_interval in utils.TIMEFRAMES_MS.items()
+            if interval % source_interval == 0 and store.months(pair, source)
+        ]
+        if not sources:
+            continue
+        source = max(sources, key=utils.TIMEFRAMES_MS.get)
+        candles = store.read_candles(pair, source, start, end).resample(timeframe)
+        if len(candles):
+            ohlcs[pair] = candles.to_frame()
+    if not ohlcs:
+        return [], np.empty(0), np.empty((0, 0)), np.empty((0, 0)), np.empty((0, 0))
+    return indicators.stack_ohlc(ohlcs)
+
+
+def forward_moves(close: np.ndarray, high: np.ndarray, low: np.ndarray, horizon: int):
+    """
+    Largest absolute move from each close over the next `horizon` candles, up or down, relative to the close.
+    (pairs x candles) array, NaN when the window runs past the data or contains a missing candle.
+    """
+    n = close.shape[-1]
+    moves = np.full(close.shape, np.nan)
+    if n <= horizon:
+        return moves
+    highest = sliding_window_view(high[:, 1:], horizon, axis=1).max(axis=2)
+    lowest = sliding_window_view(low[:, 1:], horizon, axis=1).min(axis=2)
+    reference = close[:, :n - horizon]
+    moves[:, :n - horizon] = np.maximum(highest / reference - 1, 1 - lowest / reference)
+    return moves
+
+
+def times_to_burst(close: np.ndarray, high: np.ndarray, low: np.ndarray, rows: np.ndarray, positions: np.ndarray, horizon: int, move: float):
+    """
+    Number of candles after each (row, position) trigger until the price first moves by `move` or more,
+    NaN if it does not within `horizon` candles.
+    """
+    n = close.shape[-1]
+    ahead = positions[:, None] + np.arange(1, horizon + 1)
+    inside = ahead < n
+    ahead = np.minimum(ahead, n - 1)
+    reference = close[rows, positions][:, None]
+    excursions = np.maximum(high[rows[:, None], ahead] / reference - 1, 1 - low[rows[:, None], ahead] / reference)
+    with np.errstate(invalid='ignore'):
+        bursts = (excursions >= move) & inside
+    return np.where(bursts.any(axis=1), bursts.argmax(axis=1) + 1, np.nan)
+
+
+def warmup_thresholds(close: np.ndarray, warmup=utils.BACKTEST_WARMUP):
+    """
+    Automatic threshold of each row of `close` computed from its first `warmup` candles only, so that
+    the candles it is evaluated on never leak into it, and the position of the first candle after them
+    (the row length when the row is shorter than the warm-up, its threshold being NaN then).
+    """
+    close = np.asarray(close, dtype=np.float64)
+    n = close.shape[-1]
+    valid = ~np.isnan(close)
+    counts = np.cumsum(valid, axis=1)
+    starts = np.where(counts[:, -1] >= warmup, np.argmax(counts >= warmup, axis=1) + 1, n) if n else np.zeros(len(close), dtype=int)
+    prefix = np.where(np.arange(n) < starts[:, None], close, np.nan)
+    thresholds = universe.auto_thresholds(prefix)
+    thresholds[starts >= n] = np.nan
+    return thresholds, starts
+
+
+def backtest_arrays(
+    pairs: list,
+    open_times: np.ndarray,
+    close,
+    high,
+    low,
+    thresholds: np.ndarray,
+    horizon=utils.BACKTEST_HORIZON,
+    move=utils.BACKTEST_BURST_MOVE,
+    starts: np.ndarray = None
+):
+    """
+    Backtest the pre-burst signal on aligned (pairs x candles) prices with one BB span threshold per pair.
+    A trigger is a candle entering the pre-burst zone (the scanner keeps alerting while it stays in it,
+    only the first alert is counted). For every trigger:
+        - move: largest absolute move over the next `horizon` candles
+        - hit: that move reaches `move`
+        - time_to_burst: candles until it does (NaN on a miss)
+    Triggers whose horizon runs past the data have a NaN move and are left out of the statistics.
+    When given, `starts` is the position of the first evaluated candle of each pair (eg: after the warm-up
+    its threshold was computed on), the triggers and the baseline leave out the candles before it.
+
+    Response:
+        report (pd.DataFrame): one row per pair, see backtest_report()
+        triggers (pd.DataFrame): one row per trigger
+    """
+    results = indicators.compute_indicators_batch(close, high, low, thresholds)
+    pre_burst = results['pre_burst']
+    entries = pre_burst & ~np.pad(pre_burst[:, :-1], ((0, 0), (1, 0)))
+    moves = forward_moves(close, high, low, horizon)
+    if starts is not None:
+        evaluated = np.arange(close.shape[-1]) >= np.asarray(starts)[:, None]
+        entries &= evaluated
+        moves[~evaluated] = np.nan
+    rows, positions = np.nonzero(entries)
+    with np.errstate(invalid='ignore'):
+        triggers = pd.DataFrame({
+            'pair': np.asarray(pairs, dtype=object)[rows],
+            'open_time': np.asarray(open_times)[positions],
+            'BB_span': results['BB_span'][rows, positions],
+            'move': moves[rows, positions],
+            'hit': moves[rows, positions] >= move,
+            'time_to_burst': times_to_burst(close, high, low, rows, positions, horizon, move),
+        })
+        # Baseline: the same statistics on every candle, signal or not
+        baseline = pd.DataFrame({
+            'pair': pairs,
+            'candles': np.sum(~np.isnan(close), axis=1) if starts is None else np.sum(~np.isnan(close) & evaluated, axis=1),
+            'threshold': thresholds,
+            'baseline_move': np.nanmean(moves, axis=1),
+            'baseline_hit_rate': np.nansum(moves >= move, axis=1) / np.sum(~np.isnan(moves), axis=1),
+        })
+    return backtest_report(triggers, baseline), triggers
+
+
+def backtest_report(triggers: pd.DataFrame, baseline: pd.DataFrame):
+    """
+    Per-pair report: candles, threshold, triggers, hit_rate, mean_move, median_move, mean_time_to_burst,
+    and the baseline_move / baseline_hit_rate of all candles to compare the signal with.
+    """
+    evaluated = triggers[triggers['move'].notna()]
+    statistics = evaluated.groupby('pair').agg(
+        hit_rate=('hit', 'mean'),
+        mean_move=('move', 'mean'),
+        median_move=('move', 'median'),
+        mean_time_to_burst=('time_to_burst', 'mean'),
+    )
+    report = baseline.set_index('pair')
+    report.insert(2, 'triggers', triggers.groupby('pair').size())
+    report = report.join(statistics)
+    report['triggers'] = report['triggers'].fillna(0).astype(int)
+    columns = ['candles', 'threshold', 'triggers', 'hit_rate', 'mean_move', 'median_move', 'mean_time_to_burst', 'baseline_move', 'baseline_hit_rate']
+    return report[columns]
+
+
+def run_backtest(
+    pairs: list = None,
+    timeframe=utils.TIMEFRAME,
+    start=None,
+    end=None,
+    horizon=utils.BACKTEST_HORIZON,
+    move=utils.BACKTEST_BURST_MOVE,
+    thresholds: dict = None,
+    store: ohlc_store.OhlcStore = None,
+    warmup=utils.BACKTEST_WARMUP
+):
+    """
+    Backtest the pre-burst signal over the local OHLCV store (every stored pair by default).
+    Thresholds are the calibrated ones used by the scanner, unless given as {pair: threshold}.
+    Other pairs get an automatic threshold from their first `warmup` candles (see warmup_thresholds)
+    and are only evaluated after them; the report flags them in its `auto_threshold` column.
+    Returns (report, triggers) like backtest_arrays().
+    """
+    store = store or ohlc_store.OHLC_STORE
+    pairs = pairs or store.pairs()
+    pairs, open_times, close, high, low = load_universe(pairs, timeframe, start, end, store)
+    if thresholds is None:
+        thresholds = universe.UNIVERSE_MANAGER.calibrated_thresholds(timeframe)
+    pair_thresholds = np.array([thresholds.get(pair, np.nan) for pair in pairs], dtype=np.float64)
+    auto = np.isnan(pair_thresholds)
+    starts = np.zeros(len(pairs), dtype=int)
+    if auto.any():
+        pair_thresholds[auto], starts[auto] = warmup_thresholds(close[auto], warmup)
+    report, triggers = backtest_arrays(pairs, open_times, close, high, low, pair_thresholds, horizon, move, starts)
+    report['auto_threshold'] = auto
+    return report, triggers
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Backtest the pre-burst signal on the local OHLCV store')
+    parser.add_argument('--pairs', nargs='+', default=None, help='pairs to backtest (default: every stored pair)')
+    parser.add_argument('--timeframe', default=utils.TIMEFRAME)
+    parser.add_argument('--start', default=None, help='first date, eg: 2020-01-01 (default: first stored candle)')
+    parser.add_argument('--end', default=None, help='last date (default: last stored candle)')
+    parser.add_argument('--horizon', type=int, default=utils.BACKTEST_HORIZON, help='candles after a trigger')
+    parser.add_argument('--move', type=float, default=utils.BACKTEST_BURST_MOVE, help='absolute move counted as a burst, eg: 0.05')
+    parser.add_argument('--warmup', type=int, default=utils.BACKTEST_WARMUP, help='candles an automatic threshold is computed from')
+    parser.add_argument('--output', default=None, help='CSV file to write the report to')
+    args = parser.parse_args()
+    report, triggers = run_backtest(args.pairs, args.timeframe, args.start, args.end, args.horizon, args.move, warmup=args.warmup)
+    with pd.option_context('display.max_rows', None, 'display.max_columns', None, 'display.width', 200):
+        print(report.round(4))
+    print(f'{len(triggers)} triggers, hit rate {triggers["hit"][triggers["move"].notna()].mean():.2%}')
+    if args.output:
+        report.to_csv(args.output)
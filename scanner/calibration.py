@@ -0,0 +1,174 @@
+# PreBurst Signals Telegram Bot
+#
+# Antoine Beretto
+# GitHub: @augustin999
+#
+# April 2021
+
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from scanner import backtest, indicators, ohlc_store, utils
+
+
+def interval_sums(lower: np.ndarray, upper: np.ndarray, weights: np.ndarray, values: np.ndarray):
+    """ For each value v, sum of the weights of the intervals [lower, upper) containing v """
+    order = np.argsort(lower)
+    below = np.r_[0, np.cumsum(weights[order])][np.searchsorted(lower[order], values, side='right')]
+    order = np.argsort(upper)
+    past = np.r_[0, np.cumsum(weights[order])][np.searchsorted(upper[order], values, side='right')]
+    return below - past
+
+
+def sweep_thresholds(ratio: np.ndarray, moves: np.ndarray, times: np.ndarray, thresholds: np.ndarray, move: float):
+    """
+    Trigger statistics of every threshold at once, `ratio` being the BB span of a pair for a
+    multiplier of 1 (the span is linear in the multiplier, so any multiplier m and threshold t
+    come down to the threshold t/m on this ratio).
+    A candle enters the pre-burst zone for exactly the thresholds in [ratio[t], ratio[t - 1]),
+    so each statistic is a sum over intervals, read for all thresholds with two sorted cumulative
+    sums instead of one pass over the candles per threshold.
+
+    Response:
+        dict of arrays, one value per threshold: triggers, evaluated, hits, move_sum, time_sum
+    """
+    previous = np.r_[np.inf, ratio[:-1]]
+    previous[np.isnan(previous)] = np.inf
+    entering = ~np.isnan(ratio) & (ratio < previous)
+    lower, upper = ratio[entering], previous[entering]
+    moves, times = moves[entering], times[entering]
+    evaluated = ~np.isnan(moves)
+    with np.errstate(invalid='ignore'):
+        hits = evaluated & (moves >= move)
+    return {
+        'triggers': interval_sums(lower, upper, np.ones(len(lower)), thresholds),
+        'evaluated': interval_sums(lower, upper, evaluated.astype(np.float64), thresholds),
+        'hits': interval_sums(lower, upper, hits.astype(np.float64), thresholds),
+        'move_sum': interval_sums(lower, upper, np.where(evaluated, moves, 0.0), thresholds),
+        'time_sum': interval_sums(lower, upper, np.where(hits, times, 0.0), thresholds),
+    }
+
+
+def calibrate_pair(
+    pair: str,
+    timeframe=utils.TIMEFRAME,
+    start=None,
+    end=None,
+    bb_periods=utils.CALIBRATION_BB_PERIODS,
+    bb_multipliers=utils.CALIBRATION_BB_MULTIPLIERS,
+    thresholds=utils.CALIBRATION_THRESHOLDS,
+    horizon=utils.BACKTEST_HORIZON,
+    move=utils.BACKTEST_BURST_MOVE
+):
+    """
+    Score every (BB period, BB multiplier, threshold) of the grid on the stored candles of a pair.
+    Forward moves and times to burst are computed once per pair, the rolling standard deviation
+    once per BB period, and all (multiplier, threshold) pairs are read from a single threshold sweep.
+    Returns a DataFrame with one row per grid point.
+    """
+    pairs, _, close, high, low = backtest.load_universe([pair], timeframe, start, end)
+    if not pairs:
+        return pd.DataFrame()
+    moves = backtest.forward_moves(close, high, low, horizon)[0]
+    n = close.shape[1]
+    times = backtest.times_to_burst(close, high, low, np.zeros(n, dtype=np.int64), np.arange(n), horizon, move)
+    thresholds = np.asarray(thresholds, dtype=np.float64)
+    multipliers = np.asarray(bb_multipliers, dtype=np.float64)
+    # Every (multiplier, threshold) as a threshold on the multiplier-1 span
+    effective = (thresholds[None, :] / multipliers[:, None]).ravel()
+    frames = []
+    for bb_period in bb_periods:
+        ratio = 2*indicators.rolling_std(close, bb_period)[0] / close[0]
+        statistics = sweep_thresholds(ratio, moves, times, effective, move)
+        frame = pd.DataFrame(statistics)
+        frame.insert(0, 'threshold', np.tile(thresholds, len(multipliers)))
+        frame.insert(0, 'bb_multiplier', np.repeat(multipliers, len(thresholds)))
+        frame.insert(0, 'bb_period', bb_period)
+        frames.append(frame)
+    grid = pd.concat(frames, ignore_index=True)
+    grid.insert(0, 'pair', pair)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        grid['hit_rate'] = grid['hits'] / grid['evaluated']
+        grid['mean_move'] = grid['move_sum'] / grid['evaluated']
+        grid['mean_time_to_burst'] = grid['time_sum'] / grid['hits']
+    return grid.drop(columns=['move_sum', 'time_sum'])
+
+
+def run_grid(pairs: list, timeframe=utils.TIMEFRAME, start=None, end=None, max_workers=utils.CALIBRATION_WORKERS, **grid):
+    """
+    Calibrate every pair in a process pool, each worker reading its pairs from the local store.
+    Keyword arguments (bb_periods, bb_multipliers, thresholds, horizon, move) are passed to calibrate_pair().
+    Returns the grid results of all pairs in one DataFrame.
+    """
+    with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count()) as pool:
+        futures = {pair: pool.submit(calibrate_pair, pair, timeframe, start, end, **grid) for pair in pairs}
+        results = []
+        for pair, future in futures.items():
+            try:
+                results.append(future.result())
+            except Exception as e:
+                print(f'Error in calibration.run_grid()\nCalibration failed for {pair}\n{e}')
+    return pd.concat(results, ignore_index=True) if results else pd.DataFrame()
+
+
+def select_best(results: pd.DataFrame, min_triggers=utils.CALIBRATION_MIN_TRIGGERS, bb_period=None, bb_multiplier=None):
+    """
+    Pick the Bollinger Bands settings shared by every pair (the scanner has a single BB_PERIOD and
+    BB_MULTIPLIER): the ones maximising the average over pairs of their best hit rate, unless given.
+    Then pick the threshold of each pair with those settings: best hit rate among the thresholds
+    with at least `min_triggers` evaluated triggers, the most triggers on ties.
+    Returns (bb_period, bb_multiplier, DataFrame of the selected rows indexed by pair).
+    """
+    eligible = results[results['evaluated'] >= min_triggers]
+    if bb_period is None or bb_multiplier is None:
+        best_per_pair = eligible.groupby(['bb_period', 'bb_multiplier', 'pair'])['hit_rate'].max()
+        bb_period, bb_multiplier = best_per_pair.groupby(level=['bb_period', 'bb_multiplier']).mean().idxmax()
+    selected = eligible[(eligible['bb_period'] == bb_period) & (eligible['bb_multiplier'] == bb_multiplier)]
+    selected = selected.sort_values(['hit_rate', 'evaluated'], ascending=False).groupby('pair').head(1)
+    return bb_period, bb_multiplier, selected.set_index('pair').sort_index()
+
+
+def write_calibration(timeframe: str, bb_period: int, bb_multiplier: float, thresholds: dict, path: Path = utils.calibration_path):
+    """ Save the thresholds of a timeframe to the calibration file, keeping the other timeframes """
+    calibration = utils.load_json(path) if Path(path).exists() else dict()
+    calibration[timeframe] = {
+        'bb_period': int(bb_period),
+        'bb_multiplier': float(bb_multiplier),
+        'thresholds': {pair: float(threshold) for pair, threshold in thresholds.items()},
+    }
+    utils.dump_json(calibration, path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Calibrate the pre-burst thresholds on the local OHLCV store')
+    parser.add_argument('--pairs', nargs='+', default=None, help='pairs to calibrate (default: every stored pair)')
+    parser.add_argument('--timeframe', default=utils.TIMEFRAME)
+    parser.add_argument('--start', default=None, help='first date, eg: 2020-01-01 (default: first stored candle)')
+    parser.add_argument('--end', default=None, help='last date (default: last stored candle)')
+    parser.add_argument('--horizon', type=int, default=utils.BACKTEST_HORIZON, help='candles after a trigger')
+    parser.add_argument('--move', type=float, default=utils.BACKTEST_BURST_MOVE, help='absolute move counted as a burst, eg: 0.05')
+    parser.add_argument('--keep-bands', action='store_true', help='only calibrate thresholds for the current BB_PERIOD and BB_MULTIPLIER')
+    parser.add_argument('--workers', type=int, default=utils.CALIBRATION_WORKERS)
+    parser.add_argument('--output', default=None, help='CSV file to write the whole grid results to')
+    args = parser.parse_args()
+
+    pairs = args.pairs or ohlc_store.OHLC_STORE.pairs()
+    results = run_grid(pairs, args.timeframe, args.start, args.end, args.workers, horizon=args.horizon, move=args.move)
+    if args.output:
+        results.to_csv(args.output, index=False)
+    if args.keep_bands:
+        bb_period, bb_multiplier, best = select_best(results, bb_period=utils.BB_PERIOD, bb_multiplier=utils.BB_MULTIPLIER)
+    else:
+        bb_period, bb_multiplier, best = select_best(results)
+    with pd.option_context('display.max_rows', None, 'display.max_columns', None, 'display.width', 200):
+        print(best.round(4))
+    print(f'{len(results)} grid points over {len(pairs)} pairs, BB_PERIOD = {bb_period}, BB_MULTIPLIER = {bb_multiplier}')
+    write_calibration(args.timeframe, bb_period, bb_multiplier, best['threshold'].to_dict())
+    print(f'Thresholds of {len(best)} pairs written to {utils.calibration_path}')
+    if (bb_period, bb_multiplier) != (utils.BB_PERIOD, utils.BB_MULTIPLIER):
+        print(f'Set BB_PERIOD = {bb_period} and BB_MULTIPLIER = {bb_multiplier} in scanner/utils.py for the scanner to use them')
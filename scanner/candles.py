@@ -0,0 +1,116 @@
+# PreBurst Signals Telegram Bot
+#
+# Antoine Beretto
+# GitHub: @augustin999
+#
+# April 2021
+
+import numpy as np
+import pandas as pd
+
+from scanner import utils
+
+
+class Candles:
+    """
+    Compact struct-of-arrays candle series: int64 open times plus one array per kept column.
+    Only the columns listed in utils.CANDLE_COLUMNS are kept by default, and prices can be stored
+    as float32 to halve memory. Close times are derived from open times and the timeframe
+    instead of being stored.
+    """
+
+    def __init__(self, timeframe: str, open_time: np.ndarray, columns: dict):
+        self.timeframe = timeframe
+        self.open_time = np.asarray(open_time, dtype=np.int64)
+        self.columns = columns
+
+    @classmethod
+    def from_klines(cls, klines: np.ndarray, timeframe: str, columns=None, dtype=None):
+        """ Build candles from a structured array of utils.OHLC_DTYPE, keeping only the given columns """
+        columns = columns or utils.CANDLE_COLUMNS
+        dtype = dtype or utils.CANDLE_DTYPE
+        return cls(
+            timeframe,
+            np.array(klines['open_time'], dtype=np.int64),
+            {column: np.array(klines[column], dtype=dtype) for column in columns}
+        )
+
+    @classmethod
+    def empty(cls, timeframe: str, columns=None, dtype=None):
+        columns = columns or utils.CANDLE_COLUMNS
+        dtype = dtype or utils.CANDLE_DTYPE
+        return cls(timeframe, np.empty(0, dtype=np.int64), {column: np.empty(0, dtype=dtype) for column in columns})
+
+    def __len__(self):
+        return len(self.open_time)
+
+    def __getitem__(self, key):
+        """ candles['close_price'] returns a column, candles[mask or slice] returns a Candles view """
+        if isinstance(key, str):
+            if key == 'open_time':
+                return self.open_time
+            if key == 'close_time':
+                return self.close_time
+            return self.columns[key]
+        return Candles(self.timeframe, self.open_time[key], {column: values[key] for column, values in self.columns.items()})
+
+    @property
+    def close_time(self):
+        return self.open_time + utils.TIMEFRAMES_MS[self.timeframe] - 1
+
+    @property
+    def nbytes(self):
+        return self.open_time.nbytes + sum(values.nbytes for values in self.columns.values())
+
+    def merge(self, other):
+        """ Returns the union of two series, sorted by open time, candles of `other` winning on duplicates """
+        open_time = np.concatenate([other.open_time, self.open_time])
+        # np.unique keeps the first occurrence, ie the candle coming from other
+        open_time, index = np.unique(open_time, return_index=True)
+        return Candles(self.timeframe, open_time, {
+            column: np.concatenate([other.columns[column], values])[index]
+            for column, values in self.columns.items()
+        })
+
+    def resample(self, timeframe: str):
+        """
+        Aggregate into candles of a longer timeframe: first open, highest high, lowest low, last close,
+        other columns (volumes, number of trades) summed. Only complete candles are returned: those holding
+        every base candle of their interval, so the first one is dropped if the series starts after its open,
+        the last one if it is not closed yet, and any one with a missing base candle (eg: exchange outage).
+        """
+        if timeframe == self.timeframe:
+            return self
+        interval = utils.TIMEFRAMES_MS[timeframe]
+        base_interval = utils.TIMEFRAMES_MS[self.timeframe]
+        if interval % base_interval:
+            raise ValueError(f'Cannot resample {self.timeframe} candles to {timeframe}')
+        if len(self) == 0:
+            return Candles(timeframe, self.open_time, self.columns)
+        offset = utils.BOUNDARY_OFFSETS_MS.get(timeframe, 0)
+        buckets = (self.open_time - offset) // interval * interval + offset
+        starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+        ends = np.r_[starts[1:], len(self)] - 1
+        columns = dict()
+        for column, values in self.columns.items():
+            if column == 'open_price':
+                columns[column] = values[starts]
+            elif column == 'high_price':
+                columns[column] = np.maximum.reduceat(values, starts)
+            elif column == 'low_price':
+                columns[column] = np.minimum.reduceat(values, starts)
+            elif column == 'close_price':
+                columns[column] = values[ends]
+            else:
+                columns[column] = np.add.reduceat(values, starts)
+        # Open times are unique and sorted, so a bucket is complete when it holds as many base candles as its interval
+        complete = np.diff(np.r_[starts, len(self)]) == interval // base_interval
+        return Candles(timeframe, buckets[starts][complete], {column: values[complete] for column, values in columns.items()})
+
+    def to_frame(self, columns=None):
+        """ OHLC DataFrame laid out like the scanner's, with datetime open and close times """
+        columns = columns or list(self.columns.keys())
+        frame = {'open_time': self.open_time.astype('datetime64[ms]')}
+        frame.update({column: self.columns[column] for column in columns})
+        frame['close_time'] = self.close_time.astype('datetime64[ms]')
+        return pd.DataFrame(frame)
@@ -0,0 +1,262 @@
+# PreBurst Signals Telegram Bot
+#
+# Antoine Beretto
+# GitHub: @augustin999
+#
+# April 2021
+
+import io
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+
+import matplotlib
+import matplotlib.dates as mdates
+import matplotlib.ticker as mticker
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from scanner import utils
+
+# Columns of the indicator-enriched OHLC drawn on the opportunity chart (only these are sent to the workers)
+CHART_COLUMNS = [
+    'close_time', 'open_price', 'high_price', 'low_price', 'close_price',
+    'BBh', 'BBl', 'BB_slopes_diff', 'cci', 'rsi', 'pre_burst'
+]
+
+
+def create_opportunity_plot(ohlc, pair):
+    """
+    Create a chart containing useful information about the current state of the market.
+    *** THIS FUNCTION MUST BE EDITED ACCORDING TO THE TARGETTED SIGNALS ***
+    """
+    # Build the figure without pyplot so that concurrent renders do not share global state
+    fig = Figure(figsize=(15, 8))
+    # Plot OHLC prices + Bollinger Bands + PreBurst Signals
+    ax1 = fig.add_subplot(411)
+    ax1.plot(ohlc['close_time'], ohlc['BBh'], color='red', linewidth=0.5)
+    ax1.plot(ohlc['close_time'], ohlc['BBl'], color='red', linewidth=0.5)
+    ax1.fill_between(ohlc['close_time'], y1=ohlc['BBl'], y2=ohlc['BBh'], color='pink')
+    ax1.scatter(ohlc['close_time'], ohlc['high_price'], marker='.', color='darkblue', s=10)
+    ax1.scatter(ohlc['close_time'], ohlc['low_price'], marker='.', color='red', s=10)
+    ax1.scatter(ohlc['close_time'], ohlc['open_price'], marker='.', color='orange', s=10)
+    ax1.scatter(ohlc['close_time'], ohlc['close_price'], marker='.', color='cyan', s=10)
+    ax1.scatter(ohlc[ohlc['pre_burst'] == True]['close_time'], ohlc[ohlc['pre_burst'] == True]['close_price'], marker='*', color='red', s=30)
+    ax1.set_ylabel('OHLC & BB', fontsize=18)
+    ax1.set_title(pair.upper(), fontsize=20)
+    # Plot the Bollinger Bands slopes difference
+    ax2 = fig.add_subplot(412, sharex=ax1)
+    ax2.plot(ohlc['close_time'], ohlc['BB_slopes_diff'], color='red', linewidth=0.8)
+    ax2.plot(ohlc['close_time'], [0]*len(ohlc['close_time']), color='black', linewidth=0.8)
+    ax2.fill_between(x=ohlc['close_time'], y1=[0]*len(ohlc['close_time']), y2=ohlc['BB_slopes_diff'], color='pink')
+    ax2.set_ylabel('BB slopes diff', fontsize=18)
+    # Plot the CCI
+    ax3 = fig.add_subplot(413, sharex=ax1)
+    ax3.plot(ohlc['close_time'], ohlc['cci'], color='darkblue', linewidth=0.8)
+    ax3.plot(ohlc['close_time'], [-100] * len(ohlc['close_time']), color='red', linewidth=0.8)
+    ax3.plot(ohlc['close_time'], [100] * len(ohlc['close_time']), color='red', linewidth=0.8)
+    ax3.fill_between(ohlc['close_time'], y1=[-100] * len(ohlc['close_time']), y2=[100] * len(ohlc['close_time']), color='lightblue')
+    ax3.set_ylabel('CCI', fontsize=18)
+    # Plot the RSI
+    ax4 = fig.add_subplot(414, sharex=ax1)
+    ax4.plot(ohlc['close_time'], ohlc['rsi'], color='darkblue', linewidth=0.8)
+    ax4.plot(ohlc['close_time'], [30]*len(ohlc['close_time']), color='red', linewidth=0.8)
+    ax4.plot(ohlc['close_time'], [70]*len(ohlc['close_time']), color='red', linewidth=0.8)
+    ax4.fill_between(x=ohlc['close_time'], y1=[30]*len(ohlc['close_time']), y2=[70]*len(ohlc['close_time']), color='lightblue')
+    ax4.set_ylabel('RSI', fontsize=18)
+    ax4.set_xlabel('Close time', fontsize=18)
+    fig.tight_layout()
+    return fig
+
+
+def downsample_index(n: int, max_points: int):
+    """ Positions of at most max_points evenly spaced rows out of n, always keeping the last one """
+    if max_points is None or n <= max_points:
+        return np.arange(n)
+    step = -(-n // max_points)
+    return np.arange(n - 1, -1, -step)[::-1]
+
+
+def band_vertices(x, y1, y2):
+    """ Polygon of the area between two curves, like fill_between, skipping undefined points """
+    defined = np.isfinite(y1) & np.isfinite(y2)
+    x, y1, y2 = x[defined], y1[defined], y2[defined]
+    return [np.column_stack([np.concatenate([x, x[::-1]]), np.concatenate([y1, y2[::-1]])])]
+
+
+def set_limits(ax, low, high, margin=0.05):
+    """ Autoscale an axis the way matplotlib does by default (5% margins) """
+    if not np.isfinite(low) or not np.isfinite(high):
+        return
+    padding = (high - low) * margin or abs(high) * margin or 1
+    ax.set_ylim(low - padding, high + padding)
+
+
+class OpportunityChart:
+    """
+    Pre-built version of create_opportunity_plot.
+    The figure, the axes, the constant lines and bands are created once; each render only
+    updates the data of the curves (set_data), of the scatters (set_offsets) and of the filled
+    bands (set_verts), rescales the axes and prints the PNG. Long windows are downsampled to
+    max_points candles (pre-burst markers are always all drawn).
+    """
+
+    def __init__(self, figsize=utils.CHART_FIGSIZE, dpi=utils.CHART_DPI):
+        self.fig = Figure(figsize=figsize, dpi=dpi)
+        self.canvas = FigureCanvasAgg(self.fig)
+        # Plot OHLC prices + Bollinger Bands + PreBurst Signals
+        ax1 = self.fig.add_subplot(411)
+        ax1.xaxis_date()
+        self.bbh, = ax1.plot([], [], color='red', linewidth=0.5)
+        self.bbl, = ax1.plot([], [], color='red', linewidth=0.5)
+        self.bb_band = ax1.fill_between([], [], [], color='pink')
+        self.prices = {
+            column: ax1.scatter([], [], marker='.', color=color, s=10)
+            for column, color in [('high_price', 'darkblue'), ('low_price', 'red'), ('open_price', 'orange'), ('close_price', 'cyan')]
+        }
+        self.signals = ax1.scatter([], [], marker='*', color='red', s=30)
+        ax1.set_ylabel('OHLC & BB', fontsize=18)
+        self.title = ax1.set_title('', fontsize=20)
+        # Plot the Bollinger Bands slopes difference
+        ax2 = self.fig.add_subplot(412, sharex=ax1)
+        self.slopes_diff, = ax2.plot([], [], color='red', linewidth=0.8)
+        ax2.axhline(0, color='black', linewidth=0.8)
+        self.slopes_band = ax2.fill_between([], [], [], color='pink')
+        ax2.set_ylabel('BB slopes diff', fontsize=18)
+        # Plot the CCI
+        ax3 = self.fig.add_subplot(413, sharex=ax1)
+        self.cci, = ax3.plot([], [], color='darkblue', linewidth=0.8)
+        ax3.axhspan(-100, 100, color='lightblue')
+        ax3.axhline(-100, color='red', linewidth=0.8)
+        ax3.axhline(100, color='red', linewidth=0.8)
+        ax3.set_ylabel('CCI', fontsize=18)
+        # Plot the RSI
+        ax4 = self.fig.add_subplot(414, sharex=ax1)
+        self.rsi, = ax4.plot([], [], color='darkblue', linewidth=0.8)
+        ax4.axhspan(30, 70, color='lightblue')
+        ax4.axhline(30, color='red', linewidth=0.8)
+        ax4.axhline(70, color='red', linewidth=0.8)
+        ax4.set_ylabel('RSI', fontsize=18)
+        ax4.set_xlabel('Close time', fontsize=18)
+        self.axes = [ax1, ax2, ax3, ax4]
+        # The x axis is shared: date labels are only drawn under the last panel
+        for ax in self.axes[:-1]:
+            ax.tick_params(labelbottom=False)
+        # Fixed margins: tight_layout would have to measure the tick labels at every render
+        self.fig.subplots_adjust(left=0.08, right=0.98, bottom=0.09, top=0.94, hspace=0.15)
+
+    def render(self, ohlc, pair, max_points=utils.CHART_MAX_POINTS):
+        """ Update the artists with an indicator-enriched OHLC and return the chart as PNG bytes """
+        x_all = mdates.date2num(ohlc['close_time'].values)
+        index = downsample_index(len(ohlc), max_points)
+        x = x_all[index]
+        values = {column: ohlc[column].values[index].astype(float) for column in CHART_COLUMNS[1:-1]}
+        ax1, ax2, ax3, ax4 = self.axes
+
+        self.bbh.set_data(x, values['BBh'])
+        self.bbl.set_data(x, values['BBl'])
+        self.bb_band.set_verts(band_vertices(x, values['BBl'], values['BBh']))
+        for column, scatter in self.prices.items():
+            scatter.set_offsets(np.column_stack([x, values[column]]))
+        pre_burst = ohlc['pre_burst'].values.astype(bool)
+        self.signals.set_offsets(np.column_stack([x_all[pre_burst], ohlc['close_price'].values[pre_burst]]))
+        self.title.set_text(pair.upper())
+        set_limits(ax1, np.nanmin([values['low_price'].min(), np.nanmin(values['BBl'])]), np.nanmax([values['high_price'].max(), np.nanmax(values['BBh'])]))
+
+        self.slopes_diff.set_data(x, values['BB_slopes_diff'])
+        self.slopes_band.set_verts(band_vertices(x, np.zeros(len(x)), values['BB_slopes_diff']))
+        set_limits(ax2, min(0, np.nanmin(values['BB_slopes_diff'])), max(0, np.nanmax(values['BB_slopes_diff'])))
+
+        self.cci.set_data(x, values['cci'])
+        set_limits(ax3, min(-100, np.nanmin(values['cci'])), max(100, np.nanmax(values['cci'])))
+
+        self.rsi.set_data(x, values['rsi'])
+        set_limits(ax4, min(30, np.nanmin(values['rsi'])), max(70, np.nanmax(values['rsi'])))
+
+        padding = (x_all[-1] - x_all[0]) * 0.05 or 1
+        ax1.set_xlim(x_all[0] - padding, x_all[-1] + padding)
+        # Date ticks are located once here instead of once per shared axis while drawing
+        ticks = mdates.AutoDateLocator().tick_values(mdates.num2date(x_all[0]), mdates.num2date(x_all[-1]))
+        ax1.xaxis.set_major_locator(mticker.FixedLocator(ticks))
+        ax1.xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m-%d' if x_all[-1] - x_all[0] > 3 else '%m-%d %H:%M'))
+        buffer = io.BytesIO()
+        # Telegram recompresses photos anyway: favour encoding speed over PNG size
+        self.canvas.print_png(buffer, pil_kwargs={'compress_level': 1})
+        return buffer.getvalue()
+
+
+# One set of templates per thread (and so per worker process), keyed by layout
+_templates = threading.local()
+
+
+def get_template(figsize=utils.CHART_FIGSIZE, dpi=utils.CHART_DPI):
+    """ Chart template of a layout, built on first use """
+    if not hasattr(_templates, 'charts'):
+        _templates.charts = dict()
+    key = (tuple(figsize), dpi)
+    if key not in _templates.charts:
+        _templates.charts[key] = OpportunityChart(figsize, dpi)
+    return _templates.charts[key]
+
+
+def render_opportunity_plot(ohlc, pair):
+    """ Draw the opportunity chart with the Agg backend and return it as PNG bytes """
+    if utils.CHART_TEMPLATES:
+        return get_template().render(ohlc, pair)
+    fig = create_opportunity_plot(ohlc, pair)
+    buffer = io.BytesIO()
+    FigureCanvasAgg(fig).print_png(buffer)
+    return buffer.getvalue()
+
+
+# Workers are not forked from the bot: a lock held by one of its threads at fork time (kline cache,
+# state, universe...) would stay held forever in the child. Forkserver forks them from a clean process
+START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+
+def _init_worker():
+    # Workers never open a window, whatever backend the parent process selected
+    matplotlib.use('Agg')
+
+
+class ChartRenderer:
+    """
+    Render opportunity charts in a pool of worker processes, off the scan and alert threads.
+    submit() returns at once with a Future of the PNG bytes, so the text alert can be sent
+    while the chart is being drawn. With max_workers=0 charts are rendered in the calling thread.
+    The pool is started on first use.
+    """
+
+    def __init__(self, max_workers=utils.CHART_WORKERS):
+        self.max_workers = max_workers
+        self.pool = None
+        self.lock = threading.Lock()
+
+    def submit(self, ohlc, pair: str):
+        """ Returns a Future of the PNG chart of an indicator-enriched OHLC """
+        ohlc = ohlc[CHART_COLUMNS]
+        if self.max_workers == 0:
+            future = Future()
+            try:
+                future.set_result(render_opportunity_plot(ohlc, pair))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+        with self.lock:
+            if self.pool is None:
+                self.pool = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    initializer=_init_worker,
+                    mp_context=multiprocessing.get_context(START_METHOD)
+                )
+        return self.pool.submit(render_opportunity_plot, ohlc, pair)
+
+    def shutdown(self):
+        with self.lock:
+            if self.pool is not None:
+                self.pool.shutdown()
+                self.pool = None
+
+
+CHART_RENDERER = ChartRenderer()
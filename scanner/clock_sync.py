@@ -0,0 +1,94 @@
+# PreBurst Signals Telegram Bot
+#
+# Antoine Beretto
+# GitHub: @augustin999
+#
+# April 2021
+
+import threading
+import time as tm
+
+from scanner import utils
+
+
+class ClockSync:
+    """
+    Estimate of a Binance server clock from the local clock and a cached offset.
+    The offset is measured on CLOCK_SYNC_SAMPLES server time requests, keeping the one with the
+    shortest round trip and comparing the server time to the middle of that round trip.
+    Once start() is called the offset is refreshed in a background thread every `refresh_period`
+    seconds, so reading the time never costs a request; without it, a stale offset is refreshed
+    inline on the next read.
+
+    Usage:
+        clock = ClockSync(futures_api.get_server_time)
+        clock.start()
+        timestamp = clock.timestamp()
+    """
+
+    def __init__(self, get_server_time, samples=utils.CLOCK_SYNC_SAMPLES, refresh_period=utils.CLOCK_REFRESH_PERIOD):
+        self.get_server_time = get_server_time
+        self.samples = samples
+        self.refresh_period = refresh_period
+        self.offset = None
+        self.rtt = None
+        self.last_sync = None
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def measure(self):
+        """ Returns (offset, round trip) in milliseconds of the sample with the shortest round trip """
+        best = None
+        for _ in range(self.samples):
+            start = tm.time()*1000
+            server_time = self.get_server_time()
+            end = tm.time()*1000
+            if best is None or end - start < best[1]:
+                best = (server_time - (start + end) / 2, end - start)
+        return best
+
+    def sync(self):
+        """ Measure the offset now """
+        try:
+            offset, rtt = self.measure()
+        except Exception as e:
+            # Keep the previous offset (local clock if there is none) until the next refresh
+            print(f'Error in ClockSync.sync()\nServer time unavailable\n{e}')
+            with self.lock:
+                self.offset = self.offset or 0.0
+                self.last_sync = tm.monotonic()
+            return
+        with self.lock:
+            self.offset = offset
+            self.rtt = rtt
+            self.last_sync = tm.monotonic()
+
+    def is_running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def now(self):
+        """ Current server time in milliseconds """
+        if self.offset is None or (not self.is_running() and tm.monotonic() - self.last_sync >= self.refresh_period):
+            self.sync()
+        return tm.time()*1000 + self.offset
+
+    def timestamp(self):
+        """ Current server time in integer milliseconds, as expected by signed requests """
+        return int(self.now())
+
+    def _refresh(self):
+        while not self.stop_event.wait(self.refresh_period):
+            self.sync()
+
+    def start(self):
+        """ Measure the offset and keep it fresh in a background thread """
+        if self.is_running():
+            return
+        self.sync()
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._refresh, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
@@ -11,10 +11,11 @@ import time as tm
 import hmac
 import json
 import hashlib
-import requests
 from urllib.parse import quote_from_bytes, urlencode
 
 from scanner import utils
+from scanner.clock_sync import ClockSync
+from scanner.http_client import HttpClient, decode_json, decode_klines
 
 
 def read_keys():
@@ -30,6 +31,9 @@ def read_keys():
 KEY, SECRET = read_keys()
 # KEY, SECRET = '', ''
 BASE_URL = 'https://fapi.binance.com'
+CLIENT = HttpClient(BASE_URL, KEY)
+# Binance error code for a timestamp outside of the recvWindow
+TIMESTAMP_ERROR_CODE = -1021
 
 
 # SETTING UP SIGNATURE
@@ -41,50 +45,57 @@ def hashing(query_string: str):
     return hmac_signature.hexdigest()
 
 
-def dispatch_request(http_method: str):
-    """ Prepare a request with given http method """
-    session = requests.Session()
-    session.headers.update({
-        'Content-Type': 'application/json;charset=utf-8',
-        'X-MBX-APIKEY': KEY
-    })
+def dispatch_request(http_method: str, client: HttpClient = None):
+    """ Prepare a request with given http method on the shared pooled client """
+    client = client or CLIENT
     return {
-        'GET': session.get,
-        'DELETE': session.delete,
-        'PUT': session.put,
-        'POST': session.post,
-    }.get(http_method, 'GET')
+        'GET': client.get,
+        'DELETE': client.delete,
+        'PUT': client.put,
+        'POST': client.post,
+    }.get(http_method, client.get)
 
 
-def send_signed_request(http_method: str, url_path: str, payload={}):
+def send_signed_request(http_method: str, url_path: str, payload={}, client: HttpClient = None):
     """ 
     Prepare and send a signed request.
     Use this function to obtain private user info, manage trades and track accounts.
-    """
-    query_string = urlencode(payload)
-    # Replace single quotes to double quotes
-    query_string = query_string.replace('%27', '%22')
-    if query_string:
-        query_string = "{}&timestamp={}".format(query_string, get_server_time())
-    else:
-        query_string = 'timestamp={}'.format(get_server_time())
-    url = BASE_URL + url_path + '?' + query_string + '&signature=' + hashing(query_string)
-    params = {'url': url, 'params': {}}
-    response = dispatch_request(http_method)(**params)
-    return response.json()
-
-
-def send_public_request(url_path: str, payload={}):
+    Timestamps come from the cached server clock; if the server still rejects one
+    (code -1021), the clock is measured again and the request sent once more.
+    """
+    client = client or CLIENT
+    for attempt in range(2):
+        query_string = urlencode(payload)
+        # Replace single quotes to double quotes
+        query_string = query_string.replace('%27', '%22')
+        if query_string:
+            query_string = "{}&timestamp={}".format(query_string, CLOCK.timestamp())
+        else:
+            query_string = 'timestamp={}'.format(CLOCK.timestamp())
+        url = client.base_url + url_path + '?' + query_string + '&signature=' + hashing(query_string)
+        params = {'url': url, 'params': {}}
+        response = decode_json(dispatch_request(http_method, client)(**params).content)
+        if attempt == 0 and isinstance(response, dict) and response.get('code') == TIMESTAMP_ERROR_CODE:
+            CLOCK.sync()
+            continue
+        return response
+
+
+def send_public_request(url_path: str, payload={}, client: HttpClient = None, raw=False):
     """
     Prepare and send an unsigned request.
     Use this function to obtain public market data
+    Set raw to get the undecoded response body (bytes).
     """
+    client = client or CLIENT
     query_string = urlencode(payload, True)
-    url = BASE_URL + url_path
+    url = client.base_url + url_path
     if query_string:
         url = url + '?' + query_string
-    response = dispatch_request('GET')(url=url)
-    return response.json()
+    response = dispatch_request('GET', client)(url=url)
+    if raw:
+        return response.content
+    return decode_json(response.content)
 
 
 # GENERAL ENDPOINTS
@@ -104,6 +115,10 @@ def get_server_time():
     return serverTime
 
 
+# Server clock used to timestamp signed requests
+CLOCK = ClockSync(get_server_time)
+
+
 def get_exchange_info():
     """ Returns current exchange trading rules and symbols information """
     url_path = '/fapi/v1/exchangeInfo'
@@ -214,6 +229,15 @@ def get_old_trades(pair: str, limit=100, fromId=None):
     return trades
 
 
+def format_klines(klines: list):
+    """
+    Convert klines given as lists (eg: an already decoded response) to a structured array of utils.OHLC_DTYPE.
+    Numbers sent as str are parsed by numpy directly, without boxing each value in Python.
+    """
+    n_columns = len(utils.OHLC_COLUMNS)
+    return np.array([tuple(kline[:n_columns]) for kline in klines], dtype=utils.OHLC_DTYPE)
+
+
 def get_klines(pair: str, intervals: str, startTime=None, endTime=None, limit=1500):
     """
     Get candlestick bars (called klines) for a symbol. Klines are uniquely identified by their open time.
@@ -228,20 +252,20 @@ def get_klines(pair: str, intervals: str, startTime=None, endTime=None, limit=15
         limit (int): less or equal to 1500
 
     Response:
-        list of lists [
-            [
-                Open Time (ms unix timestamp)
-                Open Price (float)
-                High Price (float)
-                Low Price (float)
-                Close Price (float)
-                Volume (float)
-                Close Time (ms unix timestamp)
-                Quote asset volume (float)
-                Number of trades (int)
-                Taker buy base asset volume (float)
-                Taker buy quote asset volume (float)
-            ]
+        structured array of utils.OHLC_DTYPE, one record per kline: [
+            (
+                open_time (ms unix timestamp)
+                open_price (float)
+                high_price (float)
+                low_price (float)
+                close_price (float)
+                volume (float)
+                close_time (ms unix timestamp)
+                quote_volume (float)
+                number_of_trades (int)
+                taker_buy_volume (float)
+                taker_buy_quote_volume (float)
+            )
         ]
     """
     url_path = '/fapi/v1/klines'
@@ -250,23 +274,8 @@ def get_klines(pair: str, intervals: str, startTime=None, endTime=None, limit=15
         params['startTime'] = startTime
     if endTime != None:
         params['endTime'] = endTime
-    klines = send_public_request(url_path, params)
-    # Convert str to float
-    for i in range(len(klines)):
-        klines[i] = [
-            klines[i][0],
-            np.float64(klines[i][1]),
-            np.float64(klines[i][2]),
-            np.float64(klines[i][3]),
-            np.float64(klines[i][4]),
-            np.float64(klines[i][5]),
-            klines[i][6],
-            np.float64(klines[i][7]),
-            klines[i][8],
-            np.float64(klines[i][9]),
-            np.float64(klines[i][10]),
-        ]
-    return klines
+    content = send_public_request(url_path, params, raw=True)
+    return decode_klines(content)
 
 
 def get_contract_klines(pair: str, intervals: str, contractType='PERPETUAL', startTime=None, endTime=None, limit=1500):
@@ -284,20 +293,20 @@ def get_contract_klines(pair: str, intervals: str, contractType='PERPETUAL', sta
         limit (int): less or equal to 1500
 
     Response:
-        list of lists [
-            [
-                Open Time (ms unix timestamp)
-                Open Price (float)
-                High Price (float)
-                Low Price (float)
-                Close Price (float)
-                Volume (float)
-                Close Time (ms unix timestamp)
-                Quote asset volume (float)
-                Number of trades (int)
-                Taker buy base asset volume (float)
-                Taker buy quote asset volume (float)
-            ]
+        structured array of utils.OHLC_DTYPE, one record per kline: [
+            (
+                open_time (ms unix timestamp)
+                open_price (float)
+                high_price (float)
+                low_price (float)
+                close_price (float)
+                volume (float)
+                close_time (ms unix timestamp)
+                quote_volume (float)
+                number_of_trades (int)
+                taker_buy_volume (float)
+                taker_buy_quote_volume (float)
+            )
         ]
     """
     url_path = '/fapi/v1/continuousKlines'
@@ -306,23 +315,22 @@ def get_contract_klines(pair: str, intervals: str, contractType='PERPETUAL', sta
         params['startTime'] = startTime
     if endTime != None:
         params['endTime'] = endTime
-    klines = send_public_request(url_path, params)
-    # Convert str to float
-    for i in range(len(klines)):
-        klines[i] = [
-            klines[i][0],
-            np.float64(klines[i][1]),
-            np.float64(klines[i][2]),
-            np.float64(klines[i][3]),
-            np.float64(klines[i][4]),
-            np.float64(klines[i][5]),
-            klines[i][6],
-            np.float64(klines[i][7]),
-            klines[i][8],
-            np.float64(klines[i][9]),
-            np.float64(klines[i][10]),
-        ]
-    return klines
+    content = send_public_request(url_path, params, raw=True)
+    return decode_klines(content)
+
+
+def get_klines_weight(limit: int):
+    """
+    Returns the request weight charged by Binance for a klines call with the given limit.
+    Applies to klines, continuousKlines, indexPriceKlines and markPriceKlines endpoints.
+    """
+    if limit < 100:
+        return 1
+    elif limit < 500:
+        return 2
+    elif limit <= 1000:
+        return 5
+    return 10
 
 
 def get_price(pair: str):
@@ -342,6 +350,38 @@ def get_price(pair: str):
     return price
 
 
+def get_24h_tickers():
+    """
+    Get the 24h rolling window statistics of every pair (request weight 40).
+
+    Response:
+        [
+            {
+                "symbol": "BTCUSDT",
+                "priceChange": "-94.99999800",
+                "priceChangePercent": "-95.960",
+                "weightedAvgPrice": "0.29628482",
+                "lastPrice": "4.00000200",
+                "lastQty": "200.00000000",
+                "openPrice": "99.00000000",
+                "highPrice": "100.00000000",
+                "lowPrice": "0.10000000",
+                "volume": "8913.30000000",
+                "quoteVolume": "15.30000000",
+                "openTime": 1499783499040,
+                "closeTime": 1499869899040,
+                "firstId": 28385,
+                "lastId": 28460,
+                "count": 76
+            },
+            ...
+        ]
+    """
+    url_path = '/fapi/v1/ticker/24hr'
+    tickers = send_public_request(url_path)
+    return tickers
+
+
 # ACCOUNT ENDPOINTS
 # -----------------
 
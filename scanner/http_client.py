@@ -0,0 +1,102 @@
+# PreBurst Signals Telegram Bot
+#
+# Antoine Beretto
+# GitHub: @augustin999
+#
+# April 2021
+
+import json
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from scanner import utils
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def decode_json(content: bytes):
+    """ Parse a JSON response body, with orjson when it is installed """
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
+
+def decode_klines(content: bytes):
+    """
+    Decode a raw klines response body straight to a structured array of utils.OHLC_DTYPE.
+    Klines only hold numbers, some of them sent as str: once the quotes are removed the JSON
+    parser reads every value as a number and numpy builds the columns in one go, without
+    boxing each value in a Python object.
+    """
+    if not content.lstrip().startswith(b'['):
+        raise ValueError(f'Unexpected klines response: {decode_json(content)}')
+    rows = decode_json(content.replace(b'"', b''))
+    klines = np.empty(len(rows), dtype=utils.OHLC_DTYPE)
+    if not rows:
+        return klines
+    table = np.array(rows, dtype=np.float64)
+    for i, column in enumerate(utils.OHLC_COLUMNS):
+        klines[column] = table[:, i]
+    return klines
+
+
+class HttpClient:
+    """
+    Persistent HTTP client shared by every request sent to a Binance API.
+    Connections are kept alive in a pool so that consecutive calls reuse the
+    same TCP+TLS session instead of paying a new handshake each time.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        api_key: str = '',
+        pool_size=utils.HTTP_POOL_SIZE,
+        timeout=utils.HTTP_TIMEOUT,
+        max_retries=utils.HTTP_MAX_RETRIES,
+        backoff_factor=utils.HTTP_BACKOFF_FACTOR
+    ):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers.update({
+            'Content-Type': 'application/json;charset=utf-8',
+            'X-MBX-APIKEY': api_key
+        })
+        # Only idempotent methods are retried: replaying a POST could duplicate an order
+        retry = Retry(
+            total=max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=utils.HTTP_RETRY_STATUSES,
+            allowed_methods=['GET', 'PUT', 'DELETE'],
+            respect_retry_after_header=True,
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def request(self, http_method: str, url: str, **kwargs):
+        """ Send a request through the pooled session with the default timeout """
+        kwargs.setdefault('timeout', self.timeout)
+        return self.session.request(http_method, url, **kwargs)
+
+    def get(self, url: str, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def delete(self, url: str, **kwargs):
+        return self.request('DELETE', url, **kwargs)
+
+    def put(self, url: str, **kwargs):
+        return self.request('PUT', url, **kwargs)
+
+    def post(self, url: str, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def close(self):
+        self.session.close()
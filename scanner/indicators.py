@@ -0,0 +1,227 @@
+# PreBurst Signals Telegram Bot
+#
+# Antoine Beretto
+# GitHub: @augustin999
+#
+# April 2021
+
+import numpy as np
+import pandas as pd
+
+from scanner import utils
+
+
+def slope_weights(length: int):
+    """
+    Weights w such that the least-squares slope of y against x = 0..length-1 is the dot product w.y
+    (closed form of np.polyfit(range(length), y, 1)[0]).
+    """
+    x = np.arange(length, dtype=np.float64)
+    x_centered = x - x.mean()
+    return x_centered / (x_centered**2).sum()
+
+
+def rolling_slope(values, window=utils.N_DIFF, min_periods=2):
+    """
+    Vectorized equivalent of values.rolling(window, min_periods).apply(lambda x: np.polyfit(range(len(x)), x, 1)[0]).
+    Computed along the last axis, so it also accepts a (pairs x candles) array.
+    The first rows use a window truncated at the start of the series, like pandas does,
+    and any window containing a NaN gives a NaN slope, like np.polyfit does.
+    """
+    index = values.index if isinstance(values, pd.Series) else None
+    values = np.asarray(values, dtype=np.float64)
+    n = values.shape[-1]
+    slopes = np.full(values.shape, np.nan)
+    # Full windows: correlation with a fixed set of weights
+    if window >= max(min_periods, 2) and n >= window:
+        weights = slope_weights(window)
+        full = np.zeros(values.shape[:-1] + (n - window + 1,))
+        for k in range(window):
+            full += weights[k] * values[..., k:n - window + 1 + k]
+        slopes[..., window - 1:] = full
+    # Warm-up rows: the window is truncated at the start of the series
+    for length in range(max(min_periods, 2), min(window, n + 1)):
+        slopes[..., length - 1] = values[..., :length] @ slope_weights(length)
+    if index is not None:
+        return pd.Series(slopes, index=index)
+    return slopes
+
+
+# BATCH COMPUTATION ON A (PAIRS x CANDLES) ARRAY
+# ----------------------------------------------
+
+def rolling_sum(values: np.ndarray, window: int):
+    """
+    Rolling sum along the last axis from cumulative sums,
+    NaN until the window is full or if it contains a NaN.
+    """
+    n = values.shape[-1]
+    sums = np.full(values.shape, np.nan)
+    if n < window:
+        return sums
+    missing = np.isnan(values)
+    cumsum = np.cumsum(np.where(missing, 0.0, values), axis=-1)
+    cumcount = np.cumsum(missing, axis=-1)
+    window_sums = cumsum[..., window - 1:].copy()
+    window_sums[..., 1:] -= cumsum[..., :n - window]
+    window_missing = cumcount[..., window - 1:].copy()
+    window_missing[..., 1:] -= cumcount[..., :n - window]
+    sums[..., window - 1:] = np.where(window_missing > 0, np.nan, window_sums)
+    return sums
+
+
+def row_offsets(values: np.ndarray):
+    """ Mean of each row, used to center prices before cumulative sums to limit cancellation errors """
+    with np.errstate(invalid='ignore'):
+        offsets = np.nanmean(values, axis=-1, keepdims=True) if values.size else np.zeros(values.shape[:-1] + (1,))
+    return np.nan_to_num(offsets)
+
+
+def rolling_mean(values: np.ndarray, window: int):
+    """ Rolling mean along the last axis, NaN until the window is full or if it contains a NaN """
+    offsets = row_offsets(values)
+    return rolling_sum(values - offsets, window) / window + offsets
+
+
+def rolling_std(values: np.ndarray, window: int):
+    """ Rolling population standard deviation (ddof=0) along the last axis """
+    centered = values - row_offsets(values)
+    mean = rolling_sum(centered, window) / window
+    variance = rolling_sum(centered**2, window) / window - mean**2
+    return np.sqrt(np.maximum(variance, 0.0))
+
+
+def rolling_mean_deviation(values: np.ndarray, means: np.ndarray, window: int):
+    """
+    Rolling mean absolute deviation around the given rolling means.
+    Accumulated one window offset at a time on a time-major copy, so every pass
+    works on contiguous memory and memory stays (pairs x candles).
+    """
+    n = values.shape[-1]
+    deviations = np.full(values.shape, np.nan)
+    if n >= window:
+        values_t = np.ascontiguousarray(np.moveaxis(values, -1, 0))
+        window_means = np.ascontiguousarray(np.moveaxis(means, -1, 0)[window - 1:])
+        total = np.zeros(window_means.shape)
+        buffer = np.empty(window_means.shape)
+        for k in range(window):
+            np.subtract(values_t[k:n - window + 1 + k], window_means, out=buffer)
+            np.abs(buffer, out=buffer)
+            total += buffer
+        deviations[..., window - 1:] = np.moveaxis(total, 0, -1) / window
+    return deviations
+
+
+def batch_bollinger_bands(close: np.ndarray, window=utils.BB_PERIOD, multiplier=utils.BB_MULTIPLIER):
+    offsets = row_offsets(close)
+    centered = close - offsets
+    centered_mean = rolling_sum(centered, window) / window
+    std = np.sqrt(np.maximum(rolling_sum(centered**2, window) / window - centered_mean**2, 0.0))
+    mean = centered_mean + offsets
+    return mean + multiplier*std, mean - multiplier*std
+
+
+def batch_cci(high: np.ndarray, low: np.ndarray, close: np.ndarray, window=utils.CCI_PERIOD):
+    typical_price = (high + low + close) / 3.0
+    mean = rolling_mean(typical_price, window)
+    return (typical_price - mean) / (0.015 * rolling_mean_deviation(typical_price, mean, window))
+
+
+def recursive_ema(values: np.ndarray, alpha: float, block=64):
+    """
+    y[t] = (1 - alpha)*y[t-1] + alpha*x[t] along the last axis, starting from y[0] = x[0] (pandas ewm(adjust=False)).
+    Vectorized over the candles too: each block of `block` candles is one product with the lower triangular
+    matrix of decay weights alpha*(1 - alpha)**(i - j), plus the carry of the previous block decayed
+    by (1 - alpha)**(i + 1). Every weight is at most 1, so unlike the closed form over the whole series
+    nothing overflows; only the loop over blocks is left in Python.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    ema = np.empty(values.shape)
+    n = values.shape[-1]
+    if n == 0:
+        return ema
+    ema[..., 0] = values[..., 0]
+    lags = np.arange(block)
+    decay = (1 - alpha)**(lags[:, None] - lags[None, :])
+    weights = np.where(lags[:, None] >= lags[None, :], alpha*decay, 0.0)
+    carry_decay = (1 - alpha)**(lags + 1)
+    for start in range(1, n, block):
+        length = min(block, n - start)
+        ema[..., start:start + length] = (
+            values[..., start:start + length] @ weights[:length, :length].T
+            + ema[..., start - 1:start] * carry_decay[:length]
+        )
+    return ema
+
+
+def batch_rsi(close: np.ndarray, window=utils.RSI_PERIOD):
+    """
+    RSI of every row, same smoothing as ta. Each row starts at its first non-NaN close,
+    so NaN padding of recently listed pairs does not alter their values.
+    A missing close counts as a zero move, before the first one the averages stay at zero,
+    so the Wilder smoothing runs on the whole array at once (see recursive_ema).
+    """
+    n_pairs, n = close.shape
+    diff = np.nan_to_num(np.diff(close, axis=1, prepend=np.nan), nan=0.0)
+    ema_up = recursive_ema(np.maximum(diff, 0.0), 1 / window)
+    ema_down = recursive_ema(np.maximum(-diff, 0.0), 1 / window)
+    # Candles since the first close of each row, included
+    listed = ~np.isnan(close)
+    first = np.where(listed.any(axis=1), listed.argmax(axis=1), n) if n else np.zeros(n_pairs, dtype=int)
+    count = np.arange(1, n + 1) - first[:, None]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        values = np.where(ema_down == 0, 100.0, 100 - 100 / (1 + ema_up/ema_down))
+    return np.where(count >= window, values, np.nan)
+
+
+def compute_indicators_batch(close: np.ndarray, high: np.ndarray, low: np.ndarray, thresholds: np.ndarray):
+    """
+    Vectorized compute_technical_indicators for a whole universe at once.
+
+    Arguments:
+        close, high, low (np.ndarray): (pairs x candles) prices aligned on open time, NaN where a pair has no candle
+        thresholds (np.ndarray): BB span threshold of each pair
+
+    Response:
+        dict of (pairs x candles) arrays: BBh, BBl, cci, rsi, BBh_slope, BBl_slope, BB_slopes_diff, BB_span, pre_burst
+    """
+    bbh, bbl = batch_bollinger_bands(close)
+    bbh_slope = rolling_slope(bbh, utils.N_DIFF, min_periods=2)
+    bbl_slope = rolling_slope(bbl, utils.N_DIFF, min_periods=2)
+    bb_span = (bbh - bbl) / close
+    with np.errstate(invalid='ignore'):
+        pre_burst = bb_span <= np.asarray(thresholds, dtype=np.float64)[:, None]
+    return {
+        'BBh': bbh,
+        'BBl': bbl,
+        'cci': batch_cci(high, low, close),
+        'rsi': batch_rsi(close),
+        'BBh_slope': bbh_slope,
+        'BBl_slope': bbl_slope,
+        'BB_slopes_diff': bbh_slope + bbl_slope,
+        'BB_span': bb_span,
+        'pre_burst': pre_burst,
+    }
+
+
+def stack_ohlc(ohlcs: dict, columns=('close_price', 'high_price', 'low_price')):
+    """
+    Align the OHLC DataFrames of several pairs on their open times.
+
+    Response:
+        pairs (list), open_times (np.ndarray), then one (pairs x candles) array per requested column,
+        NaN where a pair has no candle
+    """
+    pairs = list(ohlcs.keys())
+    pair_times = [ohlcs[pair]['open_time'].to_numpy() for pair in pairs]
+    if all(np.array_equal(times, pair_times[0]) for times in pair_times):
+        # Usual case: every pair has the same candles, no alignment needed
+        stacked = [np.array([ohlcs[pair][column].to_numpy(dtype=np.float64) for pair in pairs]) for column in columns]
+        return (pairs, pair_times[0], *stacked)
+    open_times = np.unique(np.concatenate(pair_times))
+    stacked = [np.full((len(pairs), len(open_times)), np.nan) for _ in columns]
+    for i, pair in enumerate(pairs):
+        positions = np.searchsorted(open_times, pair_times[i])
+        for array, column in zip(stacked, columns):
+            array[i, positions] = ohlcs[pair][column].to_numpy(dtype=np.float64)
+    return (pairs, open_times, *stacked)
@@ -0,0 +1,186 @@
+# PreBurst Signals Telegram Bot
+#
+# Antoine Beretto
+# GitHub: @augustin999
+#
+# April 2021
+
+import asyncio
+import threading
+import numpy as np
+
+from scanner import futures_api, utils
+from scanner.candles import Candles
+from scanner.rate_limit import RequestWeightLimiter
+
+
+def fetch_perpetual_klines(pair: str, timeframe: str, startTime=None, endTime=None, limit=utils.MAX_KLINES_LIMIT):
+    """ Default kline source of the cache: perpetual contract klines from the futures API """
+    return futures_api.get_contract_klines(
+        pair, timeframe, contractType='PERPETUAL', startTime=startTime, endTime=endTime, limit=limit
+    )
+
+
+class KlineCache:
+    """
+    Rolling cache of closed candles, one compact Candles series per (pair, timeframe).
+    A series is seeded once with `maxlen` candles, then every scan only requests
+    the candles that closed since the last one. Missing candles inside the series
+    are detected and backfilled automatically.
+    """
+
+    def __init__(self, maxlen=utils.SCAN_LIMIT, fetch=fetch_perpetual_klines):
+        self.maxlen = maxlen
+        self.fetch = fetch
+        self.klines = dict()
+        self.gaps = dict()
+        self.locks = dict()
+        self.lock = threading.Lock()
+
+    def _get_lock(self, key):
+        with self.lock:
+            if key not in self.locks:
+                self.locks[key] = threading.Lock()
+            return self.locks[key]
+
+    def fetch_range(self, pair: str, timeframe: str, start_time: int, end_time: int):
+        """ Page through the API to get every candle opened in [start_time, end_time] """
+        interval = utils.TIMEFRAMES_MS[timeframe]
+        candles = Candles.empty(timeframe)
+        while start_time <= end_time:
+            page = self.fetch(pair, timeframe, startTime=start_time, endTime=end_time, limit=utils.MAX_KLINES_LIMIT)
+            if len(page) == 0:
+                break
+            candles = candles.merge(Candles.from_klines(page, timeframe))
+            if len(page) < utils.MAX_KLINES_LIMIT:
+                break
+            start_time = int(page['open_time'][-1]) + interval
+        return candles
+
+    def backfill_gaps(self, pair: str, timeframe: str, candles: Candles):
+        """
+        Fetch the candles missing between consecutive ones and merge them in.
+        Gaps the exchange could not fill (eg: trading halts) are remembered and not requested again.
+        """
+        interval = utils.TIMEFRAMES_MS[timeframe]
+        known_gaps = self.gaps.setdefault((pair, timeframe), set())
+        open_times = candles.open_time
+        for i in np.flatnonzero(np.diff(open_times) > interval):
+            gap = (int(open_times[i]) + interval, int(open_times[i + 1]) - interval)
+            if gap not in known_gaps:
+                candles = candles.merge(self.fetch_range(pair, timeframe, *gap))
+                known_gaps.add(gap)
+        return candles
+
+    def missing_range(self, pair: str, timeframe: str, end_time: int):
+        """
+        Open times [start_time, end_time] of the candles get() would request for a pair, None if it has
+        nothing to request: the whole series when it is not cached (or too far behind), else the top-up.
+        """
+        interval = utils.TIMEFRAMES_MS[timeframe]
+        last_expected = ((end_time - 1) // interval) * interval
+        candles = self.klines.get((pair, timeframe))
+        if candles is None or len(candles) == 0 or last_expected - candles.open_time[-1] > self.maxlen * interval:
+            return last_expected - (self.maxlen - 1)*interval, end_time - 1
+        if candles.open_time[-1] < last_expected:
+            return int(candles.open_time[-1]) + interval, end_time - 1
+        return None
+
+    async def fetch_range_async(self, client, pair: str, timeframe: str, start_time: int, end_time: int, limiter: RequestWeightLimiter = None):
+        """
+        fetch_range() through an AsyncFuturesClient. Each page waits for its request weight on `limiter`
+        when given (in an executor thread, so that the event loop keeps serving the other pairs).
+        """
+        loop = asyncio.get_running_loop()
+        interval = utils.TIMEFRAMES_MS[timeframe]
+        candles = Candles.empty(timeframe)
+        while start_time <= end_time:
+            # Binance charges by limit: a top-up of a few candles only asks for those
+            limit = min(utils.MAX_KLINES_LIMIT, (end_time - start_time) // interval + 1)
+            if limiter is not None:
+                await loop.run_in_executor(None, limiter.acquire, futures_api.get_klines_weight(limit))
+            page = await client.get_contract_klines(
+                pair, timeframe, contractType='PERPETUAL', startTime=start_time, endTime=end_time, limit=limit
+            )
+            if len(page) == 0:
+                break
+            candles = candles.merge(Candles.from_klines(page, timeframe))
+            if len(page) < limit:
+                break
+            start_time = int(page['open_time'][-1]) + interval
+        return candles
+
+    async def prefetch(self, client, pairs: list, timeframe: str, end_time: int, limiter: RequestWeightLimiter = None):
+        """
+        Request the candles missing for every pair concurrently on one event loop and merge them in,
+        so that the get() calls of the scan that follows have nothing left to request.
+        Requests spend their weight on `limiter` when given, like the threaded scans.
+        A failing pair is reported and left to get(). Returns the number of candles fetched.
+        """
+        ranges = {pair: self.missing_range(pair, timeframe, end_time) for pair in pairs}
+        ranges = {pair: bounds for pair, bounds in ranges.items() if bounds is not None}
+        results = await asyncio.gather(
+            *[self.fetch_range_async(client, pair, timeframe, *bounds, limiter) for pair, bounds in ranges.items()],
+            return_exceptions=True
+        )
+        fetched = 0
+        for pair, candles in zip(ranges, results):
+            if isinstance(candles, Exception):
+                print(f'Error in KlineCache.prefetch()\nFetch failed for {pair}\n{candles}')
+                continue
+            self.add(pair, timeframe, candles[candles.open_time < end_time])
+            fetched += len(candles)
+        return fetched
+
+    def get(self, pair: str, timeframe: str, end_time: int):
+        """
+        Returns the latest `maxlen` candles of a pair opened strictly before `end_time` (ms unix timestamp).
+        Only the candles missing from the cached series are requested from the API.
+        """
+        key = (pair, timeframe)
+        interval = utils.TIMEFRAMES_MS[timeframe]
+        last_expected = ((end_time - 1) // interval) * interval
+        with self._get_lock(key):
+            candles = self.klines.get(key)
+            if candles is not None and len(candles) and last_expected - candles.open_time[-1] > self.maxlen * interval:
+                # Too far behind, topping up would cost more than seeding again
+                candles = None
+            if candles is None or len(candles) == 0:
+                if self.maxlen <= utils.MAX_KLINES_LIMIT:
+                    klines = self.fetch(pair, timeframe, endTime=end_time - 1, limit=self.maxlen)
+                    candles = Candles.from_klines(klines, timeframe)
+                else:
+                    candles = self.fetch_range(pair, timeframe, last_expected - (self.maxlen - 1)*interval, end_time - 1)
+            elif candles.open_time[-1] < last_expected:
+                new_candles = self.fetch_range(pair, timeframe, int(candles.open_time[-1]) + interval, end_time - 1)
+                candles = candles.merge(new_candles)
+            candles = candles[candles.open_time < end_time]
+            candles = self.backfill_gaps(pair, timeframe, candles)[-self.maxlen:]
+            self.klines[key] = candles
+            return candles
+
+    def add(self, pair: str, timeframe: str, candles: Candles):
+        """ Merge candles received from elsewhere (eg: a websocket stream) into a cached series """
+        key = (pair, timeframe)
+        with self._get_lock(key):
+            cached = self.klines.get(key)
+            merged = candles if cached is None else cached.merge(candles)
+            self.klines[key] = merged[-self.maxlen:]
+
+    def clear(self, pair: str = None, timeframe: str = None):
+        """ Drop cached series, all of them or only those matching the given pair and/or timeframe """
+        with self.lock:
+            for key in list(self.klines.keys()):
+                if pair in (None, key[0]) and timeframe in (None, key[1]):
+                    del self.klines[key]
+                    self.gaps.pop(key, None)
+
+
+def base_limit(timeframes=None, base_timeframe=None):
+    """ Number of base candles to keep so that SCAN_LIMIT candles of every timeframe can be resampled from them """
+    timeframes = timeframes or utils.TIMEFRAMES
+    base_interval = utils.TIMEFRAMES_MS[base_timeframe or utils.BASE_TIMEFRAME]
+    return utils.SCAN_LIMIT * max(utils.TIMEFRAMES_MS[timeframe] for timeframe in timeframes) // base_interval
+
+
+KLINE_CACHE = KlineCache(maxlen=base_limit())
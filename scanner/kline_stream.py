@@ -0,0 +1,162 @@
+# PreBurst Signals Telegram Bot
+#
+# Antoine Beretto
+# GitHub: @augustin999
+#
+# April 2021
+
+import asyncio
+import aiohttp
+import numpy as np
+
+from scanner import adaptive_thresholds, kline_cache, scanner, scheduler, utils
+from scanner.candles import Candles
+from scanner.http_client import decode_json
+from scanner.streaming_indicators import IndicatorEngine
+from scanner.universe import UNIVERSE_MANAGER
+
+
+def stream_name(pair: str, timeframe: str):
+    """ Name of the perpetual continuous kline stream of a pair """
+    return f'{pair.lower()}_perpetual@continuousKline_{timeframe}'
+
+
+def parse_kline_event(message: dict):
+    """
+    Read a combined stream message.
+    Returns (pair, timeframe, Candles of one candle) when it reports a closed candle, else None.
+
+    Message:
+        {
+            'stream': 'btcusdt_perpetual@continuousKline_4h',
+            'data': {
+                'e': 'continuous_kline', 'ps': 'BTCUSDT', 'ct': 'PERPETUAL',
+                'k': {'t': open time, 'T': close time, 'i': interval, 'o', 'h', 'l', 'c', 'v' (str), 'x': is closed, ...}
+            }
+        }
+    """
+    data = message.get('data', {})
+    kline = data.get('k')
+    if kline is None or not kline['x']:
+        return None
+    klines = np.zeros(1, dtype=utils.OHLC_DTYPE)
+    klines['open_time'] = kline['t']
+    klines['close_time'] = kline['T']
+    for column, key in [('open_price', 'o'), ('high_price', 'h'), ('low_price', 'l'), ('close_price', 'c'), ('volume', 'v')]:
+        klines[column] = float(kline[key])
+    return data['ps'], kline['i'], Candles.from_klines(klines, kline['i'])
+
+
+class KlineStream:
+    """
+    Subscribe to the perpetual kline streams of a universe on one or several combined
+    websocket connections and call `on_candle_closed(pair, timeframe, candles)` for each closed candle.
+    Connections are reopened after STREAM_RECONNECT_DELAY seconds when they drop.
+    """
+
+    def __init__(self, universe: list, timeframe: str, on_candle_closed, url=utils.STREAM_URL):
+        self.universe = universe
+        self.timeframe = timeframe
+        self.on_candle_closed = on_candle_closed
+        self.url = url
+        self.running = False
+        self.tasks = set()
+
+    def connection_urls(self):
+        streams = [stream_name(pair, self.timeframe) for pair in self.universe]
+        return [
+            f'{self.url}?streams=' + '/'.join(streams[i:i + utils.STREAM_MAX_STREAMS])
+            for i in range(0, len(streams), utils.STREAM_MAX_STREAMS)
+        ]
+
+    async def listen(self, session: aiohttp.ClientSession, url: str):
+        while self.running:
+            try:
+                async with session.ws_connect(url, heartbeat=60) as websocket:
+                    async for message in websocket:
+                        if message.type != aiohttp.WSMsgType.TEXT:
+                            continue
+                        event = parse_kline_event(decode_json(message.data))
+                        if event is not None:
+                            # Candles of the whole universe close together: handle them concurrently
+                            task = asyncio.ensure_future(self.on_candle_closed(*event))
+                            self.tasks.add(task)
+                            task.add_done_callback(self.tasks.discard)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                print(f'Error in KlineStream.listen()\nConnection lost\n{e}')
+            if self.running:
+                await asyncio.sleep(utils.STREAM_RECONNECT_DELAY)
+
+    async def run(self):
+        self.running = True
+        async with aiohttp.ClientSession() as session:
+            await asyncio.gather(*[self.listen(session, url) for url in self.connection_urls()])
+
+    def stop(self):
+        self.running = False
+
+
+class StreamScanner:
+    """
+    Streaming counterpart of the scan loop: the base timeframe candles of each pair (utils.BASE_TIMEFRAME)
+    are streamed into the kline cache. On each close, every timeframe closing with it is resampled from
+    the cache and its last candle goes through the indicator engine; when it triggers a pre-burst signal,
+    the full scan_market evaluation (chart, price) runs at once.
+    Pairs are warmed up from the kline cache the first time they are seen or after a gap in the stream.
+    The engine is checkpointed every STREAM_SAVE_INTERVAL seconds and on stop, so that a scanner built
+    with IndicatorEngine.load() resumes from it.
+    """
+
+    def __init__(self, universe: list, on_opportunity, timeframes=None, url=utils.STREAM_URL, engine: IndicatorEngine = None):
+        self.timeframe = utils.BASE_TIMEFRAME
+        self.timeframes = timeframes or utils.TIMEFRAMES
+        self.on_opportunity = on_opportunity
+        self.engine = engine or IndicatorEngine()
+        self.stream = KlineStream(universe, self.timeframe, self.on_candle_closed, url)
+
+    def evaluate(self, pair: str, candles: Candles):
+        """
+        Blocking part of a candle close: cache top-up if the stream missed candles, then for each
+        timeframe closing with it, warm-up if needed, indicators update, opportunity if any.
+        Returns the list of opportunities.
+        """
+        open_time = int(candles.open_time[-1])
+        end_time = open_time + utils.TIMEFRAMES_MS[self.timeframe]
+        kline_cache.KLINE_CACHE.get(pair, self.timeframe, open_time)
+        kline_cache.KLINE_CACHE.add(pair, self.timeframe, candles)
+        base_candles = kline_cache.KLINE_CACHE.get(pair, self.timeframe, end_time)
+        opportunities = []
+        for timeframe in scheduler.due_timeframes(self.timeframes, end_time):
+            resampled = base_candles.resample(timeframe)[-utils.SCAN_LIMIT:]
+            # Pairs without a calibrated threshold get theirs from this history
+            UNIVERSE_MANAGER.threshold(pair, resampled['close_price'], timeframe)
+            # Only the candles the engine has not seen yet are fed, ie all of them on warm-up
+            snapshot = self.engine.seed_candles(pair, resampled)
+            if snapshot is None or not snapshot['pre_burst']:
+                continue
+            ohlc = scanner.compute_technical_indicators(resampled.to_frame(), pair, timeframe)
+            opportunities.append(scanner.evaluate_market(ohlc, pair, timeframe))
+        self.engine.checkpoint()
+        if utils.THRESHOLD_MODE == 'adaptive':
+            adaptive_thresholds.get_adaptive_thresholds().checkpoint()
+        return opportunities
+
+    async def on_candle_closed(self, pair: str, timeframe: str, candles: Candles):
+        loop = asyncio.get_running_loop()
+        try:
+            opportunities = await loop.run_in_executor(None, self.evaluate, pair, candles)
+        except Exception as e:
+            print(f'Error in StreamScanner.on_candle_closed()\nEvaluation failed for {pair}\n{e}')
+            return
+        for opportunity in opportunities:
+            await loop.run_in_executor(None, self.on_opportunity, pair, opportunity)
+
+    async def run(self):
+        try:
+            await self.stream.run()
+        finally:
+            self.engine.save()
+
+    def stop(self):
+        self.stream.stop()
+        self.engine.save()
@@ -0,0 +1,187 @@
+# PreBurst Signals Telegram Bot
+#
+# Antoine Beretto
+# GitHub: @augustin999
+#
+# April 2021
+
+import argparse
+import os
+import threading
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+from scanner import futures_api, utils
+from scanner.candles import Candles
+
+
+def klines_to_array(klines):
+    """ Convert klines (structured array or list of lists) to a structured array of OHLC_DTYPE """
+    if isinstance(klines, np.ndarray):
+        return klines.astype(utils.OHLC_DTYPE, copy=False)
+    return futures_api.format_klines(klines)
+
+
+def array_to_frame(candles: np.ndarray):
+    """ Build an OHLC DataFrame, laid out like the scanner's, from a structured array of candles """
+    return pd.DataFrame({
+        column: candles[column].astype('datetime64[ms]') if column in ('open_time', 'close_time') else candles[column]
+        for column in utils.OHLC_COLUMNS
+    })
+
+
+def to_ms(timestamp):
+    """ Convert a date (str, pd.Timestamp or ms unix timestamp) to a ms unix timestamp """
+    if timestamp is None or isinstance(timestamp, (int, np.integer)):
+        return timestamp
+    return int(pd.Timestamp(timestamp).value // 10**6)
+
+
+class OhlcStore:
+    """
+    Local OHLCV store, one .npy file of OHLC_DTYPE candles per pair, timeframe and month:
+        <root>/<PAIR>/<timeframe>/<YYYY-MM>.npy
+    Partitions are sorted and deduplicated by open time. They are read memory-mapped,
+    so a range lying within a single month is returned as a zero-copy view.
+    """
+
+    def __init__(self, root: Path = utils.store_path):
+        self.root = Path(root)
+        self.lock = threading.Lock()
+
+    def partition_path(self, pair: str, timeframe: str, month: str):
+        return self.root / pair.upper() / timeframe / f'{month}.npy'
+
+    def months(self, pair: str, timeframe: str):
+        """ Returns the sorted list of months stored for a pair and timeframe """
+        directory = self.root / pair.upper() / timeframe
+        if not directory.exists():
+            return []
+        return sorted(path.stem for path in directory.glob('*.npy'))
+
+    def pairs(self, timeframe: str = None):
+        """ Returns the pairs having data in the store (for a given timeframe if specified) """
+        if not self.root.exists():
+            return []
+        return sorted(
+            path.name for path in self.root.iterdir()
+            if path.is_dir() and (timeframe is None or (path / timeframe).exists())
+        )
+
+    def load_partition(self, pair: str, timeframe: str, month: str, mmap=True):
+        path = self.partition_path(pair, timeframe, month)
+        if not path.exists():
+            return np.empty(0, dtype=utils.OHLC_DTYPE)
+        return np.load(path, mmap_mode='r' if mmap else None)
+
+    def write_partition(self, pair: str, timeframe: str, month: str, candles: np.ndarray):
+        """ Atomically replace a partition file """
+        path = self.partition_path(pair, timeframe, month)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix('.tmp')
+        with open(tmp_path, 'wb') as _file:
+            np.save(_file, candles)
+        os.replace(tmp_path, path)
+
+    def append(self, pair: str, timeframe: str, klines):
+        """
+        Add candles to the store. Candles already stored with the same open time are
+        replaced by the new ones. Returns the number of candles written.
+        """
+        candles = klines_to_array(klines)
+        if len(candles) == 0:
+            return 0
+        months = candles['open_time'].astype('datetime64[ms]').astype('datetime64[M]')
+        with self.lock:
+            for month in np.unique(months):
+                new = candles[months == month]
+                old = self.load_partition(pair, timeframe, str(month), mmap=False)
+                merged = np.concatenate([new, old])
+                # np.unique keeps the first occurrence, ie the freshly appended candle
+                _, index = np.unique(merged['open_time'], return_index=True)
+                self.write_partition(pair, timeframe, str(month), merged[index])
+        return len(candles)
+
+    def read(self, pair: str, timeframe: str, start=None, end=None):
+        """
+        Returns the candles opened in [start, end] as a structured array of OHLC_DTYPE.
+        start and end can be dates or ms unix timestamps, None meaning unbounded.
+        """
+        start, end = to_ms(start), to_ms(end)
+        months = self.months(pair, timeframe)
+        if start is not None:
+            first = str(np.datetime64(start, 'ms').astype('datetime64[M]'))
+            months = [month for month in months if month >= first]
+        if end is not None:
+            last = str(np.datetime64(end, 'ms').astype('datetime64[M]'))
+            months = [month for month in months if month <= last]
+        chunks = []
+        for month in months:
+            candles = self.load_partition(pair, timeframe, month)
+            lower = 0 if start is None else np.searchsorted(candles['open_time'], start, side='left')
+            upper = len(candles) if end is None else np.searchsorted(candles['open_time'], end, side='right')
+            chunks.append(candles[lower:upper])
+        if not chunks:
+            return np.empty(0, dtype=utils.OHLC_DTYPE)
+        if len(chunks) == 1:
+            return chunks[0]
+        return np.concatenate(chunks)
+
+    def read_frame(self, pair: str, timeframe: str, start=None, end=None):
+        """ Same as read() but returns an OHLC DataFrame laid out like the scanner's """
+        return array_to_frame(self.read(pair, timeframe, start, end))
+
+    def read_candles(self, pair: str, timeframe: str, start=None, end=None, columns=None, dtype=None):
+        """ Same as read() but returns compact Candles holding only the given columns """
+        return Candles.from_klines(self.read(pair, timeframe, start, end), timeframe, columns, dtype)
+
+    def last_open_time(self, pair: str, timeframe: str):
+        """ Returns the open time (ms) of the latest stored candle, None if there is none """
+        months = self.months(pair, timeframe)
+        if not months:
+            return None
+        candles = self.load_partition(pair, timeframe, months[-1])
+        return int(candles['open_time'][-1]) if len(candles) else None
+
+    def backfill(self, pair: str, timeframe: str, start, end=None):
+        """
+        Download perpetual klines from `start` (or from the latest stored candle) up to `end`
+        (default: now), paging through the API, and append them to the store.
+        Returns the number of candles written.
+        """
+        interval = utils.TIMEFRAMES_MS[timeframe]
+        start_time = to_ms(start)
+        last_stored = self.last_open_time(pair, timeframe)
+        if last_stored is not None and last_stored >= start_time:
+            start_time = last_stored + interval
+        end_time = to_ms(end) if end is not None else futures_api.get_server_time()
+        written = 0
+        while start_time <= end_time:
+            klines = futures_api.get_contract_klines(
+                pair, timeframe, contractType='PERPETUAL',
+                startTime=start_time, endTime=end_time, limit=utils.MAX_KLINES_LIMIT
+            )
+            # Only keep closed candles
+            klines = klines[klines['close_time'] < end_time]
+            if len(klines) == 0:
+                break
+            written += self.append(pair, timeframe, klines)
+            start_time = int(klines['open_time'][-1]) + interval
+        return written
+
+
+OHLC_STORE = OhlcStore()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Download historical perpetual klines into the local OHLCV store')
+    parser.add_argument('command', choices=['backfill'])
+    parser.add_argument('--pairs', nargs='+', default=utils.UNIVERSE)
+    parser.add_argument('--timeframe', default=utils.TIMEFRAME)
+    parser.add_argument('--start', required=True, help='first date to download, eg: 2020-01-01')
+    parser.add_argument('--end', default=None, help='last date to download (default: now)')
+    args = parser.parse_args()
+    for pair in args.pairs:
+        written = OHLC_STORE.backfill(pair, args.timeframe, args.start, args.end)
+        print(f'{pair} {args.timeframe}: {written} candles stored')
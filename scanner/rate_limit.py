@@ -0,0 +1,38 @@
+# PreBurst Signals Telegram Bot
+#
+# Antoine Beretto
+# GitHub: @augustin999
+#
+# April 2021
+
+import threading
+import time as tm
+
+from scanner import utils
+
+
+class RequestWeightLimiter:
+    """
+    Token bucket over request weight (Binance request weight, or one per Telegram message).
+    Weight is refilled continuously so that no more than `weight_limit` is spent over `period` seconds.
+    """
+
+    def __init__(self, weight_limit=utils.REQUEST_WEIGHT_LIMIT, period=60):
+        self.weight_limit = weight_limit
+        self.rate = weight_limit / period
+        self.available = weight_limit
+        self.last_refill = tm.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, weight: int):
+        """ Block until `weight` can be spent without exceeding the limit """
+        while True:
+            with self.lock:
+                now = tm.monotonic()
+                self.available = min(self.weight_limit, self.available + (now - self.last_refill) * self.rate)
+                self.last_refill = now
+                if self.available >= weight:
+                    self.available -= weight
+                    return
+                wait = (weight - self.available) / self.rate
+            tm.sleep(wait)
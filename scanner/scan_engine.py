@@ -0,0 +1,137 @@
+# PreBurst Signals Telegram Bot
+#
+# Antoine Beretto
+# GitHub: @augustin999
+#
+# April 2021
+
+import asyncio
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+
+from scanner import adaptive_thresholds, futures_api, indicators, kline_cache, scanner, utils
+from scanner.async_futures_api import AsyncFuturesClient
+from scanner.rate_limit import RequestWeightLimiter
+from scanner.universe import UNIVERSE_MANAGER
+
+
+# Weight of one pair scan: the klines call plus the price lookup done on a signal
+PAIR_SCAN_WEIGHT = futures_api.get_klines_weight(utils.SCAN_LIMIT) + 1
+LIMITER = RequestWeightLimiter()
+
+
+def fetch_pair(pair: str, end_time: int, limiter: RequestWeightLimiter = None):
+    """
+    Pull the base timeframe candles of a pair opened before `end_time` (ms) once the request weight is available.
+    Candles already prefetched into the cache (see prefetch_klines) only cost the price lookup weight.
+    """
+    cached = kline_cache.KLINE_CACHE.missing_range(pair, utils.BASE_TIMEFRAME, end_time) is None
+    (limiter or LIMITER).acquire(1 if cached else PAIR_SCAN_WEIGHT)
+    return scanner.load_latest_candles(pair, end_time)
+
+
+def prefetch_klines(universe: list, end_time: int = None, client: AsyncFuturesClient = None, limiter: RequestWeightLimiter = None):
+    """
+    Pull the base timeframe candles of the whole universe into the kline cache from a single event loop
+    (utils.ASYNC_FETCH): requests run concurrently on the AsyncFuturesClient, capped by its semaphore and
+    by the request weight of `limiter` (LIMITER by default), instead of blocking the scan threads one pair
+    at a time. The scan that follows, given the same `end_time` (scanner.scan_end_time() by default),
+    only reads the cache. Returns the number of candles fetched.
+    """
+    end_time = end_time or scanner.scan_end_time()
+
+    async def prefetch():
+        async with (client or AsyncFuturesClient()) as session:
+            return await kline_cache.KLINE_CACHE.prefetch(session, universe, utils.BASE_TIMEFRAME, end_time, limiter or LIMITER)
+
+    return asyncio.run(prefetch())
+
+
+def scan_pair(pair: str, end_time: int, limiter: RequestWeightLimiter = None, process_pool: ProcessPoolExecutor = None, timeframes=None):
+    """
+    Fetch a single pair once, then compute and evaluate it on each timeframe (utils.TIMEFRAMES by default).
+    Indicator math is offloaded to `process_pool` when given, otherwise it runs in the calling thread.
+    Returns the list of opportunities, None for each timeframe without signal.
+    """
+    candles = fetch_pair(pair, end_time, limiter)
+    opportunities = []
+    for timeframe in timeframes or utils.TIMEFRAMES:
+        ohlc = scanner.resample_ohlc(candles, timeframe)
+        if process_pool is not None:
+            # Thresholds are taken in this process: a worker would feed and cache them in its own copy
+            ohlc = process_pool.submit(scanner.compute_technical_indicators, ohlc, pair, timeframe, False).result()
+            ohlc = scanner.flag_pre_burst(ohlc, pair, timeframe)
+        else:
+            ohlc = scanner.compute_technical_indicators(ohlc, pair, timeframe)
+        opportunities.append(scanner.evaluate_market(ohlc, pair, timeframe))
+    return opportunities
+
+
+def scan_universe(universe: list, max_workers=utils.SCAN_WORKERS, use_processes=False, limiter: RequestWeightLimiter = None, end_time: int = None, timeframes=None):
+    """
+    Scan every pair of the universe concurrently on a bounded thread pool, on each timeframe
+    (utils.TIMEFRAMES by default). Yields one (pair, opportunity) tuple per timeframe as soon as
+    each pair is done, opportunity being None when there is no signal. A failing pair is reported
+    and does not stop the others.
+    Every pair gets the candles opened before the same `end_time` (ms), read once from the state
+    (scanner.scan_end_time()) when not given, so that a scan running late cannot mix two boundaries.
+    """
+    end_time = end_time or scanner.scan_end_time()
+    process_pool = ProcessPoolExecutor() if use_processes else None
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as thread_pool:
+            futures = {
+                thread_pool.submit(scan_pair, pair, end_time, limiter, process_pool, timeframes): pair
+                for pair in universe
+            }
+            for future in as_completed(futures):
+                pair = futures[future]
+                try:
+                    opportunities = future.result()
+                except Exception as e:
+                    print(f'Error in scan_engine.scan_universe()\nScan failed for {pair}\n{e}')
+                    continue
+                for opportunity in opportunities:
+                    yield pair, opportunity
+    finally:
+        if process_pool is not None:
+            process_pool.shutdown()
+
+
+def scan_universe_batch(universe: list, max_workers=utils.SCAN_WORKERS, limiter: RequestWeightLimiter = None, end_time: int = None, timeframes=None):
+    """
+    Fetch every pair concurrently, then, for each timeframe, compute the indicators of the whole
+    universe in a single vectorized pass on a (pairs x candles) array. Only pairs with a signal get
+    their indicators copied into their DataFrame for the chart. Yields (pair, opportunity) tuples like scan_universe.
+    """
+    end_time = end_time or scanner.scan_end_time()
+    candles = dict()
+    with ThreadPoolExecutor(max_workers=max_workers) as thread_pool:
+        futures = {thread_pool.submit(fetch_pair, pair, end_time, limiter): pair for pair in universe}
+        for future in as_completed(futures):
+            pair = futures[future]
+            try:
+                candles[pair] = future.result()
+            except Exception as e:
+                print(f'Error in scan_engine.scan_universe_batch()\nFetch failed for {pair}\n{e}')
+    for timeframe in timeframes or utils.TIMEFRAMES:
+        ohlcs = {pair: scanner.resample_ohlc(pair_candles, timeframe) for pair, pair_candles in candles.items()}
+        ohlcs = {pair: ohlc for pair, ohlc in ohlcs.items() if len(ohlc)}
+        if not ohlcs:
+            continue
+        pairs, open_times, close, high, low = indicators.stack_ohlc(ohlcs)
+        thresholds = UNIVERSE_MANAGER.thresholds(pairs, close, timeframe)
+        results = indicators.compute_indicators_batch(close, high, low, thresholds)
+        if utils.THRESHOLD_MODE == 'adaptive':
+            thresholds = adaptive_thresholds.thresholds(pairs, timeframe, open_times, results['BB_span'], static=thresholds)
+            with np.errstate(invalid='ignore'):
+                results['pre_burst'] = results['BB_span'] <= thresholds[:, None]
+        for i, pair in enumerate(pairs):
+            ohlc = ohlcs[pair]
+            positions = np.searchsorted(open_times, ohlc['open_time'].values)
+            if not results['pre_burst'][i, positions[-1]]:
+                yield pair, None
+                continue
+            for column, values in results.items():
+                ohlc[column] = values[i, positions]
+            yield pair, scanner.evaluate_market(ohlc, pair, timeframe)
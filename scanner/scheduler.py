@@ -0,0 +1,109 @@
+# PreBurst Signals Telegram Bot
+#
+# Antoine Beretto
+# GitHub: @augustin999
+#
+# April 2021
+
+import threading
+import time as tm
+import numpy as np
+
+from scanner import futures_api, utils
+from scanner.clock_sync import ClockSync
+
+
+def next_boundary(timeframe: str, server_time: int):
+    """ Open time (ms) of the first candle of the timeframe starting strictly after server_time """
+    interval = utils.TIMEFRAMES_MS[timeframe]
+    offset = utils.BOUNDARY_OFFSETS_MS.get(timeframe, 0)
+    return (int(server_time - offset) // interval + 1) * interval + offset
+
+
+def due_timeframes(timeframes: list, boundary: int):
+    """ Timeframes among `timeframes` whose candles close at boundary (ms) """
+    return [
+        timeframe for timeframe in timeframes
+        if (boundary - utils.BOUNDARY_OFFSETS_MS.get(timeframe, 0)) % utils.TIMEFRAMES_MS[timeframe] == 0
+    ]
+
+
+class CandleScheduler:
+    """
+    Run jobs at every candle boundary of their timeframe, in server time.
+    Server time is read from a ClockSync (futures_api.CLOCK by default), so in between boundaries
+    the scheduler only sleeps and sends no request. Each firing runs in its own thread so that
+    a long scan on one timeframe does not delay the others.
+
+    Usage:
+        scheduler = CandleScheduler()
+        scheduler.add_job('4h', scan)   # scan(boundary_ms) at 00:00, 04:00, ... UTC
+        scheduler.run()
+    """
+
+    def __init__(self, delay=utils.SCHEDULER_DELAY, clock: ClockSync = None):
+        self.delay = delay
+        self.clock = clock or futures_api.CLOCK
+        self.jobs = []
+        self.lateness = dict()
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+
+    def add_job(self, timeframe: str, callback):
+        """ Call callback(boundary_ms) after each close of a timeframe candle """
+        self.jobs.append({'timeframe': timeframe, 'callback': callback, 'next': None})
+        self.lateness.setdefault(timeframe, [])
+
+    def server_time(self):
+        """ Current server time in milliseconds """
+        return self.clock.now()
+
+    def _fire(self, job: dict, boundary: int):
+        try:
+            job['callback'](boundary)
+        except Exception as e:
+            print(f"Error in CandleScheduler._fire()\nJob on {job['timeframe']} failed\n{e}")
+
+    def run(self):
+        """ Block and fire the jobs until stop() is called """
+        self.stop_event.clear()
+        now = self.server_time()
+        for job in self.jobs:
+            job['next'] = next_boundary(job['timeframe'], now)
+        while not self.stop_event.is_set():
+            job = min(self.jobs, key=lambda job: job['next'])
+            fire_time = job['next'] + 1000*self.delay
+            remaining = (fire_time - self.server_time()) / 1000
+            if remaining > 0:
+                # Wake up at least once per clock refresh to follow offset updates
+                self.stop_event.wait(min(remaining, self.clock.refresh_period or remaining))
+                continue
+            with self.lock:
+                self.lateness[job['timeframe']].append(-remaining*1000)
+            threading.Thread(target=self._fire, args=[job, job['next']], daemon=True).start()
+            # Boundaries missed while the machine was suspended are skipped, not replayed
+            job['next'] = next_boundary(job['timeframe'], self.server_time())
+
+    def stop(self):
+        self.stop_event.set()
+
+    def metrics(self):
+        """
+        Firing lateness statistics per timeframe, in milliseconds after the planned firing time
+        (candle boundary + delay): runs, last, mean, max and jitter (standard deviation).
+        """
+        with self.lock:
+            lateness = {timeframe: np.array(values) for timeframe, values in self.lateness.items()}
+        metrics = dict()
+        for timeframe, values in lateness.items():
+            if len(values) == 0:
+                metrics[timeframe] = {'runs': 0}
+                continue
+            metrics[timeframe] = {
+                'runs': len(values),
+                'last': values[-1],
+                'mean': values.mean(),
+                'max': values.max(),
+                'jitter': values.std(),
+            }
+        return metrics
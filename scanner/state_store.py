@@ -0,0 +1,129 @@
+# PreBurst Signals Telegram Bot
+#
+# Antoine Beretto
+# GitHub: @augustin999
+#
+# April 2021
+
+import copy
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+import pandas as pd
+
+from scanner import utils
+
+
+class StateStore:
+    """
+    Bot state kept in memory and written through to files/data.pickle on every change.
+    Reads never touch the disk once the file was loaded (`disk_loads` counts the loads, so a
+    scan can check it did not cause any). Writes replace the file atomically,
+    so a crash cannot leave it truncated, and a re-entrant lock serialises them between
+    the scheduler thread and the command handlers.
+
+    State:
+        'next timestamp' (pd.Timestamp): open time of the candle the next scan waits for
+        'universe' (list): pairs scanned
+        'nThreads' (int): number of scan loops running
+        'opportunities' (dict): {(pair, timeframe): opportunity} found by the last scan
+        'subscriptions' (dict): {chat_id: {'pairs': [...], 'timeframes': [...]}} of the chats receiving alerts
+
+    A property assignment is atomic, but `STATE.next_timestamp += ...` is a get then a set:
+    read-modify-write updates go through transaction().
+
+    Usage:
+        STATE.next_timestamp = pd.Timestamp('2021-04-01 04:00')
+        with STATE.transaction() as data:
+            data['next timestamp'] += pd.Timedelta('4h')
+            if data['nThreads'] == 0:
+                data['nThreads'] = 1
+    """
+
+    DEFAULTS = {'next timestamp': None, 'universe': [], 'nThreads': 0, 'opportunities': dict(), 'subscriptions': dict()}
+
+    def __init__(self, path: Path = utils.data_path):
+        self.path = Path(path)
+        self.data = None
+        self.disk_loads = 0
+        self.lock = threading.RLock()
+
+    def _load(self):
+        if self.data is None:
+            # Keys missing from files written by older versions take their default value
+            self.data = copy.deepcopy(self.DEFAULTS)
+            if self.path.exists():
+                self.data.update(utils.load_pickle(self.path))
+                self.disk_loads += 1
+        return self.data
+
+    def get(self, key: str):
+        with self.lock:
+            return copy.copy(self._load()[key])
+
+    def set(self, key: str, value):
+        with self.transaction() as data:
+            data[key] = value
+
+    @contextmanager
+    def transaction(self):
+        """
+        Read-modify-write block on a copy of the state.
+        The copy replaces the state and is saved when the block exits normally, it is dropped on exception.
+        """
+        with self.lock:
+            data = copy.deepcopy(self._load())
+            yield data
+            utils.dump_pickle(data, self.path)
+            self.data = data
+
+    def reset(self, data: dict):
+        """ Replace the whole state """
+        with self.transaction() as current:
+            current.clear()
+            current.update(data)
+
+    def invalidate(self):
+        """ Drop the in-memory state (eg: file edited by another process), it is read again on next access """
+        with self.lock:
+            self.data = None
+
+    @property
+    def next_timestamp(self) -> pd.Timestamp:
+        return self.get('next timestamp')
+
+    @next_timestamp.setter
+    def next_timestamp(self, value: pd.Timestamp):
+        self.set('next timestamp', value)
+
+    @property
+    def universe(self) -> list:
+        return self.get('universe')
+
+    @universe.setter
+    def universe(self, value: list):
+        self.set('universe', list(value))
+
+    @property
+    def n_threads(self) -> int:
+        return self.get('nThreads')
+
+    @n_threads.setter
+    def n_threads(self, value: int):
+        self.set('nThreads', int(value))
+
+    @property
+    def opportunities(self) -> dict:
+        return self.get('opportunities')
+
+    @opportunities.setter
+    def opportunities(self, value: dict):
+        self.set('opportunities', dict(value))
+
+    @property
+    def subscriptions(self) -> dict:
+        return copy.deepcopy(self.get('subscriptions'))
+
+
+STATE = StateStore()
@@ -0,0 +1,227 @@
+# PreBurst Signals Telegram Bot
+#
+# Antoine Beretto
+# GitHub: @augustin999
+#
+# April 2021
+
+import threading
+import time as tm
+from collections import deque
+from pathlib import Path
+
+import numpy as np
+
+from scanner import adaptive_thresholds, indicators, utils
+
+
+class StreamingIndicators:
+    """
+    Indicators of one pair updated candle by candle, reproducing compute_technical_indicators.
+        - Bollinger Bands: running mean and sum of squared deviations over the last BB_PERIOD closes
+        - RSI: Wilder smoothing state of gains and losses
+        - CCI: ring buffer of typical prices with a running sum; the mean deviation
+          is taken over that fixed-size buffer so its cost does not grow with history
+        - slopes: last N_DIFF values of each band
+    Running sums are recomputed from their buffers every RESYNC_PERIOD updates to cancel float drift.
+    """
+
+    RESYNC_PERIOD = 1000
+
+    def __init__(
+        self,
+        pair: str,
+        timeframe=utils.TIMEFRAME,
+        bb_period=utils.BB_PERIOD,
+        bb_multiplier=utils.BB_MULTIPLIER,
+        cci_period=utils.CCI_PERIOD,
+        rsi_period=utils.RSI_PERIOD,
+        n_diff=utils.N_DIFF
+    ):
+        self.pair = pair
+        self.timeframe = timeframe
+        self.bb_period = bb_period
+        self.bb_multiplier = bb_multiplier
+        self.cci_period = cci_period
+        self.rsi_period = rsi_period
+        self.n_diff = n_diff
+        self.last_open_time = None
+        self.n_updates = 0
+        # Bollinger Bands
+        self.closes = deque(maxlen=bb_period)
+        self.close_mean = 0.0
+        self.close_m2 = 0.0
+        # CCI
+        self.typical_prices = np.zeros(cci_period)
+        self.tp_count = 0
+        self.tp_sum = 0.0
+        # RSI
+        self.previous_close = None
+        self.ema_up = 0.0
+        self.ema_down = 0.0
+        self.rsi_count = 0
+        # Slopes
+        self.bbh = deque(maxlen=n_diff)
+        self.bbl = deque(maxlen=n_diff)
+
+    def _update_bollinger(self, close: float):
+        n = len(self.closes)
+        if n < self.bb_period:
+            # Welford update while the window is filling
+            delta = close - self.close_mean
+            self.close_mean += delta / (n + 1)
+            self.close_m2 += delta * (close - self.close_mean)
+        else:
+            # Replace the oldest close by the new one
+            old = self.closes[0]
+            old_mean = self.close_mean
+            self.close_mean += (close - old) / n
+            self.close_m2 += (close - old) * (close - self.close_mean + old - old_mean)
+        self.closes.append(close)
+        if len(self.closes) < self.bb_period:
+            return np.nan, np.nan
+        std = np.sqrt(max(self.close_m2, 0.0) / self.bb_period)
+        return self.close_mean + self.bb_multiplier*std, self.close_mean - self.bb_multiplier*std
+
+    def _update_cci(self, typical_price: float):
+        position = self.tp_count % self.cci_period
+        self.tp_sum += typical_price - self.typical_prices[position]
+        self.typical_prices[position] = typical_price
+        self.tp_count += 1
+        if self.tp_count < self.cci_period:
+            return np.nan
+        mean = self.tp_sum / self.cci_period
+        mean_deviation = np.abs(self.typical_prices - mean).mean()
+        return (typical_price - mean) / (0.015 * mean_deviation)
+
+    def _update_rsi(self, close: float):
+        alpha = 1 / self.rsi_period
+        # Like ta, the first candle counts as a zero move
+        diff = 0.0 if self.previous_close is None else close - self.previous_close
+        self.previous_close = close
+        self.ema_up = (1 - alpha)*self.ema_up + alpha*max(diff, 0.0) if self.rsi_count else max(diff, 0.0)
+        self.ema_down = (1 - alpha)*self.ema_down + alpha*max(-diff, 0.0) if self.rsi_count else max(-diff, 0.0)
+        self.rsi_count += 1
+        if self.rsi_count < self.rsi_period:
+            return np.nan
+        if self.ema_down == 0:
+            return 100.0
+        return 100 - 100 / (1 + self.ema_up/self.ema_down)
+
+    def _slope(self, values: deque):
+        if len(values) < 2:
+            return np.nan
+        return float(np.dot(indicators.slope_weights(len(values)), values))
+
+    def _resync(self):
+        """ Recompute the running sums from their buffers """
+        closes = np.array(self.closes)
+        self.close_mean = closes.mean()
+        self.close_m2 = ((closes - self.close_mean)**2).sum()
+        self.tp_sum = self.typical_prices.sum()
+
+    def update(self, open_time: int, high: float, low: float, close: float):
+        """
+        Feed one closed candle and return the indicators of that candle.
+        Candles older than or equal to the last one fed are ignored (returns None).
+        """
+        if self.last_open_time is not None and open_time <= self.last_open_time:
+            return None
+        self.last_open_time = open_time
+        high, low, close = float(high), float(low), float(close)
+        bbh, bbl = self._update_bollinger(close)
+        cci = self._update_cci((high + low + close) / 3.0)
+        rsi = self._update_rsi(close)
+        self.bbh.append(bbh)
+        self.bbl.append(bbl)
+        self.n_updates += 1
+        if self.n_updates % self.RESYNC_PERIOD == 0:
+            self._resync()
+        bbh_slope = self._slope(self.bbh)
+        bbl_slope = self._slope(self.bbl)
+        bb_span = (bbh - bbl) / close
+        return {
+            'open_time': open_time,
+            'close_price': close,
+            'BBh': bbh,
+            'BBl': bbl,
+            'cci': cci,
+            'rsi': rsi,
+            'BBh_slope': bbh_slope,
+            'BBl_slope': bbl_slope,
+            'BB_slopes_diff': bbh_slope + bbl_slope,
+            'BB_span': bb_span,
+            'pre_burst': bool(bb_span <= adaptive_thresholds.threshold(self.pair, self.timeframe, [open_time], [bb_span])),
+        }
+
+    def is_warm(self):
+        """ True once every indicator has enough history to be defined """
+        return self.tp_count >= self.cci_period and self.rsi_count >= self.rsi_period and len(self.closes) == self.bb_period
+
+
+class IndicatorEngine:
+    """
+    Streaming indicators for a whole universe, one StreamingIndicators per (pair, timeframe).
+    The engine can be checkpointed to disk so that a restart only needs the candles
+    closed since the checkpoint instead of a full warm-up download.
+    """
+
+    def __init__(self):
+        self.pairs = dict()
+        self.saved_at = tm.monotonic()
+        self.lock = threading.Lock()
+
+    def get(self, pair: str, timeframe=utils.TIMEFRAME):
+        key = (pair, timeframe)
+        with self.lock:
+            if key not in self.pairs:
+                self.pairs[key] = StreamingIndicators(pair, timeframe)
+            return self.pairs[key]
+
+    def last_open_time(self, pair: str, timeframe=utils.TIMEFRAME):
+        """ Open time (ms) of the last candle fed for a pair, None if the pair was never fed """
+        if (pair, timeframe) not in self.pairs:
+            return None
+        return self.pairs[(pair, timeframe)].last_open_time
+
+    def update(self, pair: str, kline, timeframe=utils.TIMEFRAME):
+        """ Feed one closed kline (API format) to a pair, returns the indicators of that candle """
+        return self.get(pair, timeframe).update(kline[0], kline[2], kline[3], kline[4])
+
+    def seed(self, pair: str, klines, timeframe=utils.TIMEFRAME):
+        """ Feed a series of closed klines, returns the indicators of the last new candle """
+        latest = None
+        for kline in klines:
+            latest = self.update(pair, kline, timeframe) or latest
+        return latest
+
+    def seed_candles(self, pair: str, candles):
+        """ Same as seed() for a Candles series, fed to the state of its timeframe """
+        latest = None
+        state = self.get(pair, candles.timeframe)
+        if state.last_open_time is not None:
+            # Skip the candles already fed
+            candles = candles[np.searchsorted(candles.open_time, state.last_open_time, side='right'):]
+        for open_time, high, low, close in zip(candles.open_time, candles['high_price'], candles['low_price'], candles['close_price']):
+            latest = state.update(int(open_time), high, low, close) or latest
+        return latest
+
+    def save(self, path: Path = utils.indicators_state_path):
+        """ Checkpoint the state of every pair """
+        with self.lock:
+            utils.dump_pickle(self.pairs, path)
+            self.saved_at = tm.monotonic()
+
+    def checkpoint(self, interval=utils.STREAM_SAVE_INTERVAL, path: Path = utils.indicators_state_path):
+        """ Save, if the last save is older than `interval` seconds """
+        if tm.monotonic() - self.saved_at >= interval:
+            self.save(path)
+
+    @classmethod
+    def load(cls, path: Path = utils.indicators_state_path):
+        """ Restore an engine from a checkpoint, or return an empty one if there is none """
+        engine = cls()
+        if Path(path).exists():
+            # Checkpoints of older versions are keyed by pair only: their pairs warm up again
+            engine.pairs = {key: state for key, state in utils.load_pickle(path).items() if isinstance(key, tuple)}
+        return engine
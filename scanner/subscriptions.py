@@ -0,0 +1,107 @@
+# PreBurst Signals Telegram Bot
+#
+# Antoine Beretto
+# GitHub: @augustin999
+#
+# April 2021
+
+import re
+
+from scanner import state_store, utils
+from scanner.state_store import StateStore
+
+# Pair of a subscription to every pair of the universe
+ALL_PAIRS = '*'
+# A number and a unit, eg: 15m, 4h, 1d
+TIMEFRAME_PATTERN = re.compile(r'\d+[mhdwM]$')
+
+
+def parse_subscription_args(args: list):
+    """
+    Split command arguments into pairs and timeframes, any argument shaped like a timeframe being one
+    (so that an unknown timeframe is not taken for a pair).
+    eg: ['btcusdt', '4h', 'ETHUSDT'] -> (['BTCUSDT', 'ETHUSDT'], ['4h'])
+    """
+    pairs = [arg.upper() for arg in args if not TIMEFRAME_PATTERN.match(arg)]
+    timeframes = [arg for arg in args if TIMEFRAME_PATTERN.match(arg)]
+    return pairs, timeframes
+
+
+def invalid_subscription_args(pairs: list, timeframes: list, universe: list):
+    """ Pairs out of `universe` and timeframes out of utils.TIMEFRAMES: a subscription to them would never fire """
+    known_pairs = set(universe) | {ALL_PAIRS}
+    return [pair for pair in pairs if pair not in known_pairs], [timeframe for timeframe in timeframes if timeframe not in utils.TIMEFRAMES]
+
+
+class SubscriptionRegistry:
+    """
+    Chats receiving the alerts, each one for some pairs (or all of them) on some timeframes.
+    Subscriptions are kept in the bot state, so they survive restarts.
+
+    Usage:
+        REGISTRY.subscribe(chat_id, ['BTCUSDT'], ['4h'])
+        for chat_id in REGISTRY.chats_for('BTCUSDT', '4h'):
+            ...
+    """
+
+    def __init__(self, state: StateStore = None):
+        self.state = state or state_store.STATE
+
+    def subscribe(self, chat_id, pairs=None, timeframes=None):
+        """
+        Add pairs and timeframes to the subscription of a chat, created if needed.
+        No pairs means every pair of the universe, no timeframes means every scanned timeframe (utils.TIMEFRAMES).
+        Returns the updated subscription.
+        """
+        with self.state.transaction() as data:
+            subscription = data['subscriptions'].setdefault(chat_id, {'pairs': [], 'timeframes': []})
+            for pair in pairs or [ALL_PAIRS]:
+                if pair not in subscription['pairs']:
+                    subscription['pairs'].append(pair)
+            for timeframe in timeframes or utils.TIMEFRAMES:
+                if timeframe not in subscription['timeframes']:
+                    subscription['timeframes'].append(timeframe)
+            return dict(subscription)
+
+    def unsubscribe(self, chat_id, pairs=None, timeframes=None):
+        """
+        Remove pairs and / or timeframes from the subscription of a chat, or the whole subscription
+        if neither is given; it is also dropped once it has no pair or no timeframe left.
+        A pair covered by a subscription to every pair (ALL_PAIRS) cannot be removed on its own.
+
+        Response:
+            found (bool): False if the chat had no subscription
+            covered (list): pairs left subscribed because they are covered by ALL_PAIRS
+        """
+        with self.state.transaction() as data:
+            if chat_id not in data['subscriptions']:
+                return False, []
+            subscription = data['subscriptions'][chat_id]
+            if not pairs and not timeframes:
+                del data['subscriptions'][chat_id]
+                return True, []
+            covered = []
+            if pairs:
+                if ALL_PAIRS in subscription['pairs']:
+                    covered = [pair for pair in pairs if pair != ALL_PAIRS and pair not in subscription['pairs']]
+                subscription['pairs'] = [pair for pair in subscription['pairs'] if pair not in pairs]
+            if timeframes:
+                subscription['timeframes'] = [timeframe for timeframe in subscription['timeframes'] if timeframe not in timeframes]
+            if not subscription['pairs'] or not subscription['timeframes']:
+                del data['subscriptions'][chat_id]
+            return True, covered
+
+    def get(self, chat_id):
+        """ Subscription of a chat, None if it has none """
+        return self.state.subscriptions.get(chat_id)
+
+    def chats_for(self, pair: str, timeframe: str):
+        """ Chats to alert for an opportunity on a pair and timeframe """
+        return [
+            chat_id for chat_id, subscription in self.state.subscriptions.items()
+            if timeframe in subscription['timeframes']
+            and (ALL_PAIRS in subscription['pairs'] or pair.upper() in subscription['pairs'])
+        ]
+
+
+REGISTRY = SubscriptionRegistry()
@@ -0,0 +1,229 @@
+# PreBurst Signals Telegram Bot
+#
+# Antoine Beretto
+# GitHub: @augustin999
+#
+# April 2021
+
+import io
+import threading
+import time as tm
+from collections import OrderedDict, deque
+
+import numpy as np
+import telegram
+from telegram.error import BadRequest, NetworkError, RetryAfter, TelegramError
+
+from scanner import utils
+from scanner.rate_limit import RequestWeightLimiter
+
+# Telegram limits
+MAX_MESSAGE_LENGTH = 4096
+MAX_MEDIA_GROUP = 10
+
+
+class DeliveryQueue:
+    """
+    Outbound Telegram queue drained by one worker thread, so that alerts never block the scans.
+        - rate limits: at most TELEGRAM_GLOBAL_RATE messages per second overall and one message
+          every 1/TELEGRAM_CHAT_RATE seconds per chat; a chat waiting for its turn does not hold
+          back the others
+        - batching: texts waiting for the same chat are merged into one digest, photos into
+          media groups of up to 10
+        - retries: RetryAfter pauses the chat for the delay given by Telegram, network errors are
+          retried with exponential backoff, up to TELEGRAM_MAX_RETRIES times per message
+    metrics() reports the queue depth and the delivery latency (from enqueue to sent).
+
+    Usage:
+        queue = DeliveryQueue(bot)
+        queue.start()
+        queue.send_message(chat_id, '<b>Alert</b>')
+        queue.send_photo(chat_id, png_bytes)
+    """
+
+    def __init__(
+        self,
+        bot: telegram.Bot,
+        global_rate=utils.TELEGRAM_GLOBAL_RATE,
+        chat_rate=utils.TELEGRAM_CHAT_RATE,
+        max_retries=utils.TELEGRAM_MAX_RETRIES,
+        backoff_factor=utils.HTTP_BACKOFF_FACTOR
+    ):
+        self.bot = bot
+        self.limiter = RequestWeightLimiter(weight_limit=global_rate, period=1)
+        self.chat_interval = 1 / chat_rate
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        # {chat_id: deque of messages}, in the order chats are served
+        self.chats = OrderedDict()
+        self.next_send = dict()
+        self.condition = threading.Condition()
+        self.running = False
+        self.thread = None
+        self.latencies = deque(maxlen=1000)
+        self.delivered = 0
+        self.failed = 0
+        self.retries = 0
+
+    # PRODUCERS
+    # ---------
+
+    def put(self, chat_id, kind: str, content, callback=None, errback=None):
+        """
+        Queue a message of a kind ('text' or 'photo').
+        callback(sent_message) is called once it is delivered, errback(error) if it is given up.
+        """
+        message = {
+            'kind': kind, 'content': content, 'callback': callback, 'errback': errback,
+            'enqueued': tm.monotonic(), 'attempts': 0
+        }
+        with self.condition:
+            self.chats.setdefault(chat_id, deque()).append(message)
+            self.condition.notify()
+
+    def send_message(self, chat_id, text: str, callback=None, errback=None):
+        """ Queue an HTML text message """
+        self.put(chat_id, 'text', text, callback, errback)
+
+    def send_photo(self, chat_id, photo, callback=None, errback=None):
+        """ Queue a photo, given as PNG bytes or as the file_id of a photo already uploaded """
+        self.put(chat_id, 'photo', photo, callback, errback)
+
+    # WORKER
+    # ------
+
+    def _next_batch(self):
+        """
+        Wait for a chat allowed to receive and pop its next batch: all its leading texts
+        (up to the message size limit) or all its leading photos (up to a media group).
+        """
+        with self.condition:
+            while self.running:
+                now = tm.monotonic()
+                ready = [chat_id for chat_id, messages in self.chats.items() if messages and self.next_send.get(chat_id, 0) <= now]
+                if ready:
+                    chat_id = ready[0]
+                    # Serve chats round robin
+                    self.chats.move_to_end(chat_id)
+                    messages = self.chats[chat_id]
+                    batch = [messages.popleft()]
+                    size = len(batch[0]['content']) if batch[0]['kind'] == 'text' else 1
+                    while messages and messages[0]['kind'] == batch[0]['kind']:
+                        extra = len(messages[0]['content']) + 2 if batch[0]['kind'] == 'text' else 1
+                        if size + extra > (MAX_MESSAGE_LENGTH if batch[0]['kind'] == 'text' else MAX_MEDIA_GROUP):
+                            break
+                        size += extra
+                        batch.append(messages.popleft())
+                    self.next_send[chat_id] = now + self.chat_interval*(len(batch) if batch[0]['kind'] == 'photo' else 1)
+                    return chat_id, batch
+                waits = [self.next_send.get(chat_id, 0) - now for chat_id, messages in self.chats.items() if messages]
+                self.condition.wait(min(waits) if waits else None)
+        return None, None
+
+    def _deliver(self, chat_id, batch: list):
+        """ Send a batch, returns the list of sent telegram Messages (one per message of the batch) """
+        if batch[0]['kind'] == 'text':
+            sent = self.bot.send_message(
+                chat_id=chat_id,
+                text='\n\n'.join(message['content'] for message in batch),
+                parse_mode=telegram.ParseMode.HTML
+            )
+            return [sent]*len(batch)
+        photos = [message['content'] for message in batch]
+        photos = [io.BytesIO(photo) if isinstance(photo, bytes) else photo for photo in photos]
+        if len(photos) == 1:
+            return [self.bot.send_photo(chat_id=chat_id, photo=photos[0])]
+        return self.bot.send_media_group(chat_id=chat_id, media=[telegram.InputMediaPhoto(photo) for photo in photos])
+
+    def _requeue(self, chat_id, batch: list, delay: float):
+        with self.condition:
+            self.chats.setdefault(chat_id, deque()).extendleft(reversed(batch))
+            self.next_send[chat_id] = tm.monotonic() + delay
+            self.condition.notify()
+
+    def _fail(self, batch: list, error: Exception):
+        """ Give up a batch: count it as failed and call the errbacks of its messages """
+        self.failed += len(batch)
+        for message in batch:
+            if message['errback'] is not None:
+                try:
+                    message['errback'](error)
+                except Exception as e:
+                    print(f'Error in DeliveryQueue._fail()\nDelivery errback failed\n{e}')
+
+    def _run(self):
+        while self.running:
+            chat_id, batch = self._next_batch()
+            if batch is None:
+                return
+            self.limiter.acquire(len(batch) if batch[0]['kind'] == 'photo' else 1)
+            try:
+                sent = self._deliver(chat_id, batch)
+            except RetryAfter as e:
+                # Flood control: wait as long as Telegram asks, this does not count as a failed attempt
+                self.retries += 1
+                self._requeue(chat_id, batch, e.retry_after)
+                continue
+            except BadRequest as e:
+                # BadRequest derives from NetworkError but sending it again would fail the same way
+                print(f'Error in DeliveryQueue._run()\nDelivery to {chat_id} rejected\n{e}')
+                self._fail(batch, e)
+                continue
+            except NetworkError as e:
+                # Attempts are counted per message: a later batch may merge them differently
+                for message in batch:
+                    message['attempts'] += 1
+                exhausted = [message for message in batch if message['attempts'] > self.max_retries]
+                retried = [message for message in batch if message['attempts'] <= self.max_retries]
+                if exhausted:
+                    print(f'Error in DeliveryQueue._run()\n{len(exhausted)} deliveries to {chat_id} failed after {self.max_retries} retries\n{e}')
+                    self._fail(exhausted, e)
+                if retried:
+                    self.retries += 1
+                    self._requeue(chat_id, retried, self.backoff_factor * 2**max(message['attempts'] for message in retried))
+                continue
+            except TelegramError as e:
+                print(f'Error in DeliveryQueue._run()\nDelivery to {chat_id} rejected\n{e}')
+                self._fail(batch, e)
+                continue
+            now = tm.monotonic()
+            for message, sent_message in zip(batch, sent):
+                self.latencies.append(now - message['enqueued'])
+                self.delivered += 1
+                if message['callback'] is not None:
+                    try:
+                        message['callback'](sent_message)
+                    except Exception as e:
+                        print(f'Error in DeliveryQueue._run()\nDelivery callback failed\n{e}')
+
+    def start(self):
+        if self.thread is not None and self.thread.is_alive():
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+
+    # METRICS
+    # -------
+
+    def depth(self):
+        """ Number of messages waiting """
+        with self.condition:
+            return sum(len(messages) for messages in self.chats.values())
+
+    def metrics(self):
+        """ Queue depth, delivery counters and latency statistics (seconds) over the last 1000 messages """
+        latencies = np.array(self.latencies)
+        metrics = {'depth': self.depth(), 'delivered': self.delivered, 'failed': self.failed, 'retries': self.retries}
+        if len(latencies):
+            metrics.update({
+                'latency_mean': latencies.mean(),
+                'latency_p95': np.percentile(latencies, 95),
+                'latency_max': latencies.max(),
+            })
+        return metrics
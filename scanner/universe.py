@@ -0,0 +1,193 @@
+# PreBurst Signals Telegram Bot
+#
+# Antoine Beretto
+# GitHub: @augustin999
+#
+# April 2021
+
+import threading
+import time as tm
+from pathlib import Path
+
+import numpy as np
+
+from scanner import futures_api, indicators, utils
+
+
+def load_calibration(path: Path = utils.calibration_path):
+    """
+    Thresholds written by the calibration (scanner/calibration.py) as {timeframe: {pair: threshold}}.
+    A timeframe calibrated with other Bollinger Bands settings than utils.BB_PERIOD and
+    utils.BB_MULTIPLIER is left out, its thresholds would not match the spans the scanner computes.
+    """
+    if not Path(path).exists():
+        return dict()
+    thresholds = dict()
+    for timeframe, calibration in utils.load_json(path).items():
+        if (calibration['bb_period'], calibration['bb_multiplier']) != (utils.BB_PERIOD, utils.BB_MULTIPLIER):
+            print(
+                f"Calibrated {timeframe} thresholds ignored: they need BB_PERIOD = {calibration['bb_period']} "
+                f"and BB_MULTIPLIER = {calibration['bb_multiplier']}"
+            )
+            continue
+        thresholds[timeframe] = calibration['thresholds']
+    return thresholds
+
+
+def auto_thresholds(close: np.ndarray, quantile=utils.AUTO_THRESHOLD_QUANTILE, min_candles=utils.AUTO_THRESHOLD_MIN_CANDLES):
+    """
+    Automatic BB span threshold of each row of `close` (pairs x candles): the `quantile` quantile
+    of the row's BB span history, NaN when it has fewer than `min_candles` spans
+    """
+    close = np.asarray(close, dtype=np.float64)
+    bbh, bbl = indicators.batch_bollinger_bands(close)
+    spans = (bbh - bbl) / close
+    thresholds = np.full(len(close), np.nan)
+    for i, span in enumerate(spans):
+        span = span[~np.isnan(span)]
+        if len(span) >= min_candles:
+            thresholds[i] = np.quantile(span, quantile)
+    return thresholds
+
+
+class UniverseManager:
+    """
+    Pairs to scan, discovered from the futures exchange info instead of a hard-coded list.
+        - exchange info and 24h tickers are pulled once and cached for `ttl` seconds; if a refresh
+          fails, the previous values are kept
+        - pairs are the perpetual contracts trading against `quote_asset` with a 24h quote volume
+          of at least `min_volume`, sorted by decreasing volume
+        - thresholds come from the calibration file (see load_calibration), then utils.BB_SPAN_THRESHOLDS;
+          (pair, timeframe) missing from both get an automatic threshold: the
+          AUTO_THRESHOLD_QUANTILE quantile of their own BB span history on that timeframe, computed
+          the first time their candles are seen and again once it is older than `ttl` seconds
+    With DYNAMIC_UNIVERSE off (or before the exchange info could ever be fetched), utils.UNIVERSE is scanned.
+
+    Usage:
+        for pair, opp in scan_engine.scan_universe_batch(UNIVERSE_MANAGER.pairs()):
+            ...
+    """
+
+    def __init__(
+        self,
+        get_exchange_info=futures_api.get_exchange_info,
+        get_tickers=futures_api.get_24h_tickers,
+        ttl=utils.UNIVERSE_TTL,
+        quote_asset=utils.UNIVERSE_QUOTE_ASSET,
+        min_volume=utils.UNIVERSE_MIN_VOLUME,
+        calibration_path: Path = utils.calibration_path
+    ):
+        self.get_exchange_info = get_exchange_info
+        self.get_tickers = get_tickers
+        self.ttl = ttl
+        self.quote_asset = quote_asset
+        self.min_volume = min_volume
+        # {name: (fetch time, value)}
+        self.cache = dict()
+        self.fetches = 0
+        # {timeframe: {pair: threshold}} from the calibration file
+        self.calibrated = load_calibration(calibration_path)
+        # {(pair, timeframe): threshold} and {(pair, timeframe): computation time}
+        self.auto_thresholds = dict()
+        self.auto_computed = dict()
+        self.lock = threading.Lock()
+
+    def _cached(self, name: str, fetch):
+        """ Value of fetch() cached under name for ttl seconds, the stale value is kept if a refresh fails """
+        with self.lock:
+            fetched_at, value = self.cache.get(name, (None, None))
+            if fetched_at is not None and tm.monotonic() - fetched_at < self.ttl:
+                return value
+            try:
+                value = fetch()
+                self.fetches += 1
+                self.cache[name] = (tm.monotonic(), value)
+            except Exception as e:
+                print(f'Error in UniverseManager._cached()\nRefresh of {name} failed\n{e}')
+            return value
+
+    def _fetch_symbols(self):
+        exchange_info = self.get_exchange_info()
+        return {
+            symbol['symbol']: symbol for symbol in exchange_info['symbols']
+            if symbol.get('quoteAsset') == self.quote_asset
+            and symbol.get('status') == 'TRADING'
+            and symbol.get('contractType') == 'PERPETUAL'
+        }
+
+    def _fetch_volumes(self):
+        return {ticker['symbol']: float(ticker['quoteVolume']) for ticker in self.get_tickers()}
+
+    def symbols(self) -> dict:
+        """ {pair: exchange info metadata} of the perpetual contracts trading against the quote asset """
+        return self._cached('symbols', self._fetch_symbols) or dict()
+
+    def volumes(self) -> dict:
+        """ {pair: 24h quote volume} of every futures pair """
+        return self._cached('volumes', self._fetch_volumes) or dict()
+
+    def metadata(self, pair: str):
+        """ Exchange info of a pair (filters, precisions...), None if it is not in the universe """
+        return self.symbols().get(pair)
+
+    def pairs(self) -> list:
+        """ Pairs to scan, by decreasing 24h quote volume """
+        if not utils.DYNAMIC_UNIVERSE:
+            return list(utils.UNIVERSE)
+        symbols = self.symbols()
+        if not symbols:
+            return list(utils.UNIVERSE)
+        volumes = self.volumes()
+        pairs = [pair for pair in symbols if volumes.get(pair, 0) >= self.min_volume]
+        return sorted(pairs, key=lambda pair: volumes[pair], reverse=True)
+
+    def refresh(self):
+        """
+        Drop the cached exchange info and tickers, they are pulled again on next access.
+        Automatic thresholds are kept but computed again the next time candles are given.
+        """
+        with self.lock:
+            self.cache = dict()
+            self.auto_computed = dict()
+
+    # THRESHOLDS
+    # ----------
+
+    def calibrated_thresholds(self, timeframe=utils.TIMEFRAME):
+        """ {pair: threshold} of a timeframe, the calibration file winning over utils.BB_SPAN_THRESHOLDS """
+        return {**utils.BB_SPAN_THRESHOLDS.get(timeframe, dict()), **self.calibrated.get(timeframe, dict())}
+
+    def thresholds(self, pairs: list, close: np.ndarray = None, timeframe=utils.TIMEFRAME):
+        """
+        BB span threshold of each pair on a timeframe as a vector: the calibrated one, else the automatic one.
+        Pairs with neither, or with an automatic one older than `ttl` seconds, get one computed from their
+        row of `close` (pairs x candles of the timeframe) when given and long enough.
+        Pairs left without threshold get NaN (ie never triggering).
+        """
+        calibrated = self.calibrated_thresholds(timeframe)
+        now = tm.monotonic()
+        with self.lock:
+            thresholds = np.array([calibrated.get(pair, self.auto_thresholds.get((pair, timeframe), np.nan)) for pair in pairs])
+            expired = [
+                i for i, pair in enumerate(pairs)
+                if pair not in calibrated and now - self.auto_computed.get((pair, timeframe), -np.inf) >= self.ttl
+            ]
+        if close is None or len(expired) == 0:
+            return thresholds
+        # Quantiles are computed out of the lock, so that scans of other timeframes do not wait for them
+        computed = auto_thresholds(np.asarray(close)[expired])
+        with self.lock:
+            for i, threshold in zip(expired, computed):
+                if np.isnan(threshold):
+                    continue
+                self.auto_thresholds[(pairs[i], timeframe)] = thresholds[i] = threshold
+                self.auto_computed[(pairs[i], timeframe)] = now
+        return thresholds
+
+    def threshold(self, pair: str, close: np.ndarray = None, timeframe=utils.TIMEFRAME):
+        """ BB span threshold of a single pair, `close` being its close prices on the timeframe """
+        close = None if close is None else np.asarray(close, dtype=np.float64)[None, :]
+        return self.thresholds([pair], close, timeframe)[0]
+
+
+UNIVERSE_MANAGER = UniverseManager()
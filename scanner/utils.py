@@ -6,7 +6,9 @@
 # April 2021
 
 import os
+import json
 import pickle
+import numpy as np
 from pathlib import Path
 
 UNIVERSE = ['BTCUSDT', 'ETHUSDT', 'ADAUSDT', 'LINKUSDT']
@@ -18,16 +20,152 @@ BB_MULTIPLIER = 2
 CCI_PERIOD = 160
 RSI_PERIOD = 20
 N_DIFF = 3
-# BB span thresholds calibrated on 4h timeframe
+# Number of candles pulled for each scan (enough history to warm up the CCI)
+SCAN_LIMIT = 3*CCI_PERIOD
+# BB span thresholds calibrated per timeframe, {timeframe: {pair: threshold}} (other pairs get an automatic one,
+# see UNIVERSE SETTINGS). A flat {pair: threshold} dict is read as the thresholds of TIMEFRAME
 BB_SPAN_THRESHOLDS = {
-    'BTCUSDT': 0.035,
-    'ETHUSDT': 0.10,
-    'ADAUSDT': 0.08,
-    'LINKUSDT': 0.08
+    '4h': {
+        'BTCUSDT': 0.035,
+        'ETHUSDT': 0.10,
+        'ADAUSDT': 0.08,
+        'LINKUSDT': 0.08
+    }
 }
 
+# MULTI-TIMEFRAME SETTINGS
+# Timeframes scanned (eg: ['15m', '1h', '4h', '1d']). Each one is resampled from a single series of
+# BASE_TIMEFRAME candles per pair, so adding a timeframe costs no request, only memory:
+# the cache keeps SCAN_LIMIT candles of the longest timeframe, in base candles
+TIMEFRAMES = [TIMEFRAME]
+# Must divide every timeframe of TIMEFRAMES
+BASE_TIMEFRAME = TIMEFRAME
+
+# UNIVERSE SETTINGS
+# Scan every perpetual contract listed by the exchange that passes the filters below (False scans UNIVERSE only)
+DYNAMIC_UNIVERSE = True
+UNIVERSE_QUOTE_ASSET = 'USDT'
+# Minimum 24h quote volume of a pair to be scanned
+UNIVERSE_MIN_VOLUME = 10_000_000
+# Seconds the exchange info and 24h tickers are cached
+UNIVERSE_TTL = 3600
+# Pairs without a calibrated BB span threshold get this quantile of their own BB span history
+AUTO_THRESHOLD_QUANTILE = 0.05
+# Minimum number of BB span values needed to compute it (the pair never triggers before)
+AUTO_THRESHOLD_MIN_CANDLES = 200
+
+# ADAPTIVE THRESHOLDS SETTINGS
+# 'static' uses the calibrated, utils or automatic threshold of each pair (see UniverseManager),
+# 'adaptive' a rolling quantile of the pair's own BB span, updated at every candle (see scanner/adaptive_thresholds.py)
+THRESHOLD_MODE = 'static'
+ADAPTIVE_THRESHOLD_QUANTILE = AUTO_THRESHOLD_QUANTILE
+# The quantile covers between ADAPTIVE_THRESHOLD_WINDOW and twice as many of the latest candles
+ADAPTIVE_THRESHOLD_WINDOW = 500
+# Spans seen before the adaptive threshold is used (the static one is used until then)
+ADAPTIVE_THRESHOLD_MIN_CANDLES = AUTO_THRESHOLD_MIN_CANDLES
+# Seconds between two checkpoints of the quantile sketches
+ADAPTIVE_THRESHOLD_SAVE_INTERVAL = 300
+
+# BACKTEST SETTINGS
+# Candles after a pre-burst trigger in which the burst is expected
+BACKTEST_HORIZON = 12
+# Absolute move (relative to the trigger close) counted as a burst
+BACKTEST_BURST_MOVE = 0.05
+# Pairs without a calibrated threshold get the automatic one from their first BACKTEST_WARMUP candles only
+# (as many as the scanner sees the first time), and are evaluated on the candles after them
+BACKTEST_WARMUP = SCAN_LIMIT
+
+# CALIBRATION SETTINGS
+# Grid swept by `python -m scanner.calibration`, the best thresholds are written to calibration_path
+CALIBRATION_BB_PERIODS = [10, 14, 20, 30, 40]
+CALIBRATION_BB_MULTIPLIERS = [1.5, 2, 2.5, 3]
+CALIBRATION_THRESHOLDS = list(np.round(np.arange(0.01, 0.3001, 0.0025), 4))
+# A threshold needs at least this many evaluated triggers on a pair to be selected
+CALIBRATION_MIN_TRIGGERS = 10
+# Worker processes of the grid search (None for one per CPU)
+CALIBRATION_WORKERS = None
+
+# SCAN ENGINE SETTINGS
+SCAN_WORKERS = 8
+# Compute the indicators of the whole universe in one vectorized pass instead of pair by pair
+BATCH_SCAN = True
+# Pull the klines of the whole universe from one asyncio event loop (AsyncFuturesClient) before each
+# scan, instead of one blocking request per pair in the scan threads
+ASYNC_FETCH = False
+# Binance futures allows 2400 request weight per minute, keep a margin for other calls
+REQUEST_WEIGHT_LIMIT = 2000
+
+# CHART SETTINGS
+# Worker processes rendering opportunity charts (0 renders them in the scan threads)
+CHART_WORKERS = 2
+# Reuse pre-built figures and only update their data (False draws every chart from scratch)
+CHART_TEMPLATES = True
+CHART_FIGSIZE = (15, 8)
+# Lower it (eg: 72) for lighter and faster charts
+CHART_DPI = 100
+# Longer windows are downsampled to this number of candles (None to draw them all)
+CHART_MAX_POINTS = 500
+
+# TELEGRAM SETTINGS
+# Telegram allows about 30 messages per second overall and 1 per second in a given chat
+TELEGRAM_GLOBAL_RATE = 25
+TELEGRAM_CHAT_RATE = 1
+TELEGRAM_MAX_RETRIES = 5
+
+# SCHEDULER SETTINGS
+# Seconds waited after a candle boundary before scanning, so that the exchange has closed the candle
+SCHEDULER_DELAY = 1
+# Seconds between two measures of the offset between the local and the Binance server clocks
+CLOCK_REFRESH_PERIOD = 3600
+# Server time requests per measure, the one with the shortest round trip is kept
+CLOCK_SYNC_SAMPLES = 5
+
+# STREAM SETTINGS
+# 'polling' waits for each candle close and pulls klines from the REST API,
+# 'stream' subscribes to kline websocket streams and evaluates each candle as soon as it closes
+INGESTION_MODE = 'polling'
+STREAM_URL = 'wss://fstream.binance.com/stream'
+# Binance accepts up to 200 streams per connection
+STREAM_MAX_STREAMS = 200
+STREAM_RECONNECT_DELAY = 5
+# Seconds between two checkpoints of the streaming indicators, so that a restart resumes them
+STREAM_SAVE_INTERVAL = 300
+
+# HTTP CLIENT SETTINGS
+HTTP_POOL_SIZE = 20
+HTTP_TIMEOUT = 10
+HTTP_MAX_RETRIES = 3
+HTTP_BACKOFF_FACTOR = 0.5
+HTTP_RETRY_STATUSES = [429, 500, 502, 503, 504]
+# Maximum number of requests in flight on the asyncio client
+ASYNC_MAX_CONCURRENCY = 50
+
 # GENERAL SETTINGS
 
+# Duration of each Binance kline interval in milliseconds
+TIMEFRAMES_MS = {
+    '1m': 60_000,
+    '3m': 3*60_000,
+    '5m': 5*60_000,
+    '15m': 15*60_000,
+    '30m': 30*60_000,
+    '1h': 3_600_000,
+    '2h': 2*3_600_000,
+    '4h': 4*3_600_000,
+    '6h': 6*3_600_000,
+    '8h': 8*3_600_000,
+    '12h': 12*3_600_000,
+    '1d': 86_400_000,
+    '3d': 3*86_400_000,
+    '1w': 7*86_400_000,
+}
+
+# Binance weekly candles open on Monday 00:00 UTC, the epoch was a Thursday
+BOUNDARY_OFFSETS_MS = {'1w': 4*86_400_000}
+
+# Maximum number of klines returned by one futures klines request
+MAX_KLINES_LIMIT = 1500
+
 OHLC_COLUMNS = [
     'open_time',
     'open_price',
@@ -42,6 +180,26 @@ OHLC_COLUMNS = [
     'taker_buy_quote_volume',
 ]
 
+# Binary layout of one candle in the local OHLCV store
+OHLC_DTYPE = np.dtype([
+    ('open_time', 'i8'),
+    ('open_price', 'f8'),
+    ('high_price', 'f8'),
+    ('low_price', 'f8'),
+    ('close_price', 'f8'),
+    ('volume', 'f8'),
+    ('close_time', 'i8'),
+    ('quote_volume', 'f8'),
+    ('number_of_trades', 'i8'),
+    ('taker_buy_volume', 'f8'),
+    ('taker_buy_quote_volume', 'f8'),
+])
+
+# Columns kept in memory by the compact candle container (scanner, charts and calibration only need these)
+CANDLE_COLUMNS = ['open_price', 'high_price', 'low_price', 'close_price', 'volume']
+# Set to np.float32 to halve the memory used by candles held in memory
+CANDLE_DTYPE = np.float64
+
 root = Path(os.getcwd())
 
 keys_path = root / 'keys'
@@ -52,6 +210,11 @@ telegram_token_path = keys_path / 'telegram_token'
 files_path = root / 'files'
 data_path = files_path / 'data.pickle'
 images_path = files_path / 'images'
+store_path = files_path / 'store'
+indicators_state_path = files_path / 'indicators.pickle'
+calibration_path = files_path / 'thresholds.json'
+adaptive_thresholds_path = files_path / 'adaptive_thresholds.pickle'
+reports_path = files_path / 'reports'
 
 
 def read_file(path: Path):
@@ -62,11 +225,46 @@ def read_file(path: Path):
 
 def load_pickle(path: Path):
     """Load a pickle object from file"""
-    file = pickle.load(open(path, 'rb'))
-    return file
+    with open(path, 'rb') as _file:
+        return pickle.load(_file)
 
 
 def dump_pickle(obj, path: Path):
-    """Save a pickle object to file"""
-    pickle.dump(obj, open(path, 'wb'))
-    return
\ No newline at end of file
+    """Save a pickle object to file (written to a temporary file first, then swapped in)"""
+    tmp_path = Path(str(path) + '.tmp')
+    with open(tmp_path, 'wb') as _file:
+        pickle.dump(obj, _file)
+    os.replace(tmp_path, path)
+    return
+
+
+def load_json(path: Path):
+    """Load a JSON object from file (eg: calibrated thresholds)"""
+    with open(path, 'r') as _file:
+        return json.load(_file)
+
+
+def dump_json(obj, path: Path):
+    """Save a JSON object to file (written to a temporary file first, then swapped in)"""
+    tmp_path = Path(str(path) + '.tmp')
+    with open(tmp_path, 'w') as _file:
+        json.dump(obj, _file, indent=4, sort_keys=True)
+    os.replace(tmp_path, path)
+    return
+
+def nested_thresholds(thresholds: dict, timeframe=TIMEFRAME):
+    """
+    BB span thresholds as {timeframe: {pair: threshold}}. The former layout {pair: threshold} is read as the
+    thresholds of `timeframe` (with a notice), a mix of both layouts is rejected.
+    """
+    flat = [key for key, value in thresholds.items() if not isinstance(value, dict)]
+    if not flat:
+        return thresholds
+    if len(flat) < len(thresholds):
+        raise ValueError(f"BB_SPAN_THRESHOLDS mixes pair keys ({', '.join(flat)}) with timeframe keys")
+    print(f'BB_SPAN_THRESHOLDS is keyed by pair: read as the {timeframe} thresholds, key it by timeframe instead')
+    return {timeframe: dict(thresholds)}
+
+
+# Settings written before thresholds were keyed by timeframe would otherwise be silently ignored
+BB_SPAN_THRESHOLDS = nested_thresholds(BB_SPAN_THRESHOLDS)
@@ -12,22 +12,24 @@ from telegram.ext import Handler, CallbackContext, CallbackQueryHandler, Convers
 from telegram.ext.commandhandler import CommandHandler
 from telegram.ext.messagehandler import MessageHandler
 from telegram.ext.filters import Filters
+import asyncio
+import functools
 import threading
 import os
 import pandas as pd
 import time as tm
+from concurrent.futures import Future
 
-from scanner import utils, scanner, futures_api, spot_api
+from scanner import utils, adaptive_thresholds, scanner, scan_engine, scheduler, state_store, subscriptions, telegram_queue, universe, kline_stream, futures_api, spot_api, streaming_indicators
 
+SCHEDULER = scheduler.CandleScheduler()
 
 
 def display_universe(update: Update, context: CallbackContext):
     """ Tell user all the pairs in the futures universe """
-    msg = "List of pairs in universe:\n"
-    data = utils.load_pickle(utils.data_path)
-    universe = data['universe']
-    for pair in universe:
-        msg += f'\n\t{pair}'
+    pairs = state_store.STATE.universe
+    # Comma separated so that a few hundred pairs still fit in one message
+    msg = f"List of the {len(pairs)} pairs in universe:\n\n" + ', '.join(pairs)
     update.message.reply_text(msg)
     return
 
@@ -36,72 +38,216 @@ def display_universe(update: Update, context: CallbackContext):
 # --------------------------------------------------
 
 def periodic_1h_process(update: Update, context: CallbackContext):
-    # Wait for next timestamp
-    next_timestamp = utils.load_pickle(utils.data_path)['next timestamp']
-    t = pd.Timestamp(futures_api.get_server_time(), unit='ms')
-    while t < next_timestamp + pd.Timedelta('1M'):
-        if t < next_timestamp - pd.Timedelta('1M'):
-            # print('Sleep for 60s')
-            tm.sleep(10)
-        elif t < next_timestamp:
-            # print('Sleep for 5s')
-            tm.sleep(5)
-        else:
-            # Search for opportunities on every markets
-            opportunity_scan(update, context)
-            # Update next timestamp
-            print('Scan done')
-            data = utils.load_pickle(utils.data_path)
-            data['next timestamp'] = data['next timestamp'] + pd.Timedelta(utils.TIMEFRAME)
-            utils.dump_pickle(data, utils.data_path)
-        next_timestamp = utils.load_pickle(utils.data_path)['next timestamp']
-        t = pd.Timestamp(futures_api.get_server_time(), unit='ms')
+    """ Scan every market at each candle close of utils.BASE_TIMEFRAME, on the timeframes closing with it """
+    def scan(boundary: int):
+        timeframes = scheduler.due_timeframes(utils.TIMEFRAMES, boundary)
+        if not timeframes:
+            return
+        # The state records the boundary, the scan gets it explicitly: a scan running late must not
+        # see it move under its pairs
+        state_store.STATE.next_timestamp = pd.Timestamp(boundary, unit='ms')
+        # Search for opportunities on every markets, in the candles closed before the boundary
+        opportunity_scan(update, context, timeframes, boundary)
+        if utils.THRESHOLD_MODE == 'adaptive':
+            adaptive_thresholds.get_adaptive_thresholds().checkpoint()
+        # Update next timestamp
+        print(f"Scan done on {', '.join(timeframes)}")
+        with state_store.STATE.transaction() as data:
+            data['next timestamp'] += pd.Timedelta(utils.BASE_TIMEFRAME)
+
+    SCHEDULER.add_job(utils.BASE_TIMEFRAME, scan)
+    SCHEDULER.run()
+    return
+
+
+def display_scheduler_metrics(update: Update, context: CallbackContext):
+    """ Tell user how late the scheduled scans fired """
+    msg = "Scheduled scans lateness (ms):\n"
+    for timeframe, metrics in SCHEDULER.metrics().items():
+        msg += f"\n\t{timeframe}: {metrics['runs']} runs"
+        if metrics['runs']:
+            msg += f", last {metrics['last']:.0f}, mean {metrics['mean']:.0f}, max {metrics['max']:.0f}, jitter {metrics['jitter']:.0f}"
+    update.message.reply_text(msg)
+    return
+
+
+def display_delivery_metrics(update: Update, context: CallbackContext):
+    """ Tell user how the alerts delivery queue is doing """
+    metrics = DELIVERY.metrics()
+    msg = "Alerts delivery:\n"
+    msg += f"\n\tqueued: {metrics['depth']}"
+    msg += f"\n\tdelivered: {metrics['delivered']}, failed: {metrics['failed']}, retries: {metrics['retries']}"
+    if 'latency_mean' in metrics:
+        msg += f"\n\tlatency (s): mean {metrics['latency_mean']:.2f}, p95 {metrics['latency_p95']:.2f}, max {metrics['latency_max']:.2f}"
+    update.message.reply_text(msg)
+    return
+
+
+def stream_process(update: Update, context: CallbackContext):
+    """ Scan every candle close as soon as the exchange pushes it (INGESTION_MODE = 'stream') """
+    pairs = universe.UNIVERSE_MANAGER.pairs()
+    state_store.STATE.universe = pairs
+    # Resume the indicators from their last checkpoint, only the candles closed since then are fed
+    stream_scanner = kline_stream.StreamScanner(pairs, send_opportunity, engine=streaming_indicators.IndicatorEngine.load())
+    asyncio.run(stream_scanner.run())
     return
 
 
 def initiate_opportunity_scans(update: Update, context: CallbackContext):
+    """ Subscribe the chat to every pair and start the scans loop if it is not running yet """
     chat_id = update.effective_message.chat_id
-    data = utils.load_pickle(utils.data_path)
-    if data['nThreads'] == 0:
+    subscriptions.REGISTRY.subscribe(chat_id)
+    # Check and claim in one transaction so that two commands cannot both start a loop
+    with state_store.STATE.transaction() as data:
+        start_loop = data['nThreads'] == 0
         data['nThreads'] = 1
-        utils.dump_pickle(data, utils.data_path)
+    if start_loop:
         msg = 'Starting scans loop'
         bot.send_message(chat_id=chat_id, text=msg, parse_mode=telegram.ParseMode.HTML)
-        periodic_1h_thread = threading.Thread(target=periodic_1h_process, args=[update, context])
+        process = stream_process if utils.INGESTION_MODE == 'stream' else periodic_1h_process
+        periodic_1h_thread = threading.Thread(target=process, args=[update, context])
         periodic_1h_thread.start()
     else:
-        msg = 'Scans loop already initiated'
+        msg = 'Scans loop already initiated, this chat is now subscribed to its alerts'
         bot.send_message(chat_id=chat_id, text=msg, parse_mode=telegram.ParseMode.HTML)
     return
 
 
-def opportunity_scan(update: Update, context: CallbackContext):
-    chat_id = update.effective_message.chat_id
+def opportunity_scan(update: Update, context: CallbackContext, timeframes=None, end_time: int = None):
+    """ Scan the universe on candles opened before end_time (ms, read once from the state by default) and send the alerts """
     # Clear previous opportunities
-    data = utils.load_pickle(utils.data_path)
-    if 'opportunities' in data.keys():
-        key_pairs = list(data['opportunities'].keys())
-        for pair in key_pairs:
-            img_path = utils.images_path / f'{pair.upper()}_opp.png'
-            if os.path.exists(img_path):
-                os.remove(img_path)
-            del data['opportunities'][pair]
-    # Now, scan and display the new opportunities
+    state_store.STATE.opportunities = dict()
+    # Now, scan and display the new opportunities: text alerts are queued at once,
+    # charts as soon as each render finishes, the delivery queue sends them in the background
     opportunities = dict()
-    for pair in utils.UNIVERSE:
-        opp = scanner.scan_market(pair)
+    disk_loads = state_store.STATE.disk_loads
+    # Pairs listed or delisted since the last scan are picked up once the exchange info cache expires
+    pairs = universe.UNIVERSE_MANAGER.pairs()
+    state_store.STATE.universe = pairs
+    end_time = end_time or scanner.scan_end_time()
+    if utils.ASYNC_FETCH:
+        scan_engine.prefetch_klines(pairs, end_time)
+    scan_universe = scan_engine.scan_universe_batch if utils.BATCH_SCAN else scan_engine.scan_universe
+    for pair, opp in scan_universe(pairs, end_time=end_time, timeframes=timeframes):
         if opp != None:
-            opportunities[pair] = opp
-            path = utils.images_path / f'{pair}_opp.png'
-            opp_description = f'<b>New trading opportunity: {pair.upper()}</b>'
-            opp_description += f"\n time: {opp['time']}"
-            opp_description += f"\n price: {opp['price']}"
-            opp_description += f"\n CCI: {opp['cci']}"
-            opp_description += f"\n RSI: {opp['rsi']}"
-            
-            bot.send_message(chat_id=chat_id, text=opp_description, parse_mode=telegram.ParseMode.HTML)
-            bot.send_photo(chat_id=chat_id, photo=open(path, 'rb'))
-    data['opportunities'] = opportunities
+            chat_ids = subscriptions.REGISTRY.chats_for(pair, opp['timeframe'])
+            chart = opp.pop('chart')
+            opportunities[(pair, opp['timeframe'])] = opp
+            send_opportunity_description(chat_ids, pair, opp)
+            # Runs in the renderer thread once the chart is drawn (at once if it already is), mid-scan
+            chart.add_done_callback(functools.partial(send_opportunity_chart, chat_ids, pair))
+    print(f'State loaded from disk {state_store.STATE.disk_loads - disk_loads} times during the scan')
+    state_store.STATE.opportunities = opportunities
+    return
+
+
+def send_opportunity_description(chat_ids: list, pair: str, opp: dict):
+    """ Send the text alert of an opportunity to every subscribed chat """
+    opp_description = f"<b>New trading opportunity: {pair.upper()} {opp['timeframe']}</b>"
+    opp_description += f"\n time: {opp['time']}"
+    opp_description += f"\n price: {opp['price']}"
+    opp_description += f"\n CCI: {opp['cci']}"
+    opp_description += f"\n RSI: {opp['rsi']}"
+
+    for chat_id in chat_ids:
+        DELIVERY.send_message(chat_id, opp_description)
+    return
+
+
+def send_opportunity_chart(chat_ids: list, pair: str, chart: Future):
+    """
+    Send the chart of an opportunity to every subscribed chat once rendered.
+    The PNG is uploaded to one chat only, the others receive the file_id Telegram gave it.
+    If that upload fails (bot blocked, rejected, retries exhausted), it is uploaded to the next chat instead.
+    """
+    if not chat_ids:
+        return
+    try:
+        png = chart.result()
+    except Exception as e:
+        print(f'Error in send_opportunity_chart()\nChart rendering failed for {pair}\n{e}')
+        return
+
+    def upload(chat_ids: list):
+        others = chat_ids[1:]
+
+        def forward(message: telegram.Message):
+            file_id = message.photo[-1].file_id
+            for chat_id in others:
+                DELIVERY.send_photo(chat_id, file_id)
+
+        def fallback(error: Exception):
+            upload(others)
+
+        DELIVERY.send_photo(chat_ids[0], png, callback=forward if others else None, errback=fallback if others else None)
+
+    upload(chat_ids)
+    return
+
+
+def send_opportunity(pair: str, opp: dict):
+    """ Send the description, then the chart of an opportunity to every subscribed chat """
+    chart = opp.pop('chart')
+    chat_ids = subscriptions.REGISTRY.chats_for(pair, opp['timeframe'])
+    send_opportunity_description(chat_ids, pair, opp)
+    send_opportunity_chart(chat_ids, pair, chart)
+    return
+
+# --------------------------------------------------
+#                  SUBSCRIPTIONS
+# --------------------------------------------------
+
+def describe_subscription(subscription: dict):
+    pairs = 'all pairs' if subscriptions.ALL_PAIRS in subscription['pairs'] else ', '.join(subscription['pairs'])
+    return f"{pairs} on {', '.join(subscription['timeframes'])}"
+
+
+def subscribe(update: Update, context: CallbackContext):
+    """ Subscribe the chat to pairs and timeframes: /subscribe [PAIR ...] [TIMEFRAME ...] """
+    chat_id = update.effective_message.chat_id
+    pairs, timeframes = subscriptions.parse_subscription_args(context.args)
+    universe_pairs = universe.UNIVERSE_MANAGER.pairs()
+    unknown_pairs, unknown_timeframes = subscriptions.invalid_subscription_args(pairs, timeframes, universe_pairs)
+    if unknown_pairs or unknown_timeframes:
+        msg = 'Nothing subscribed'
+        if unknown_timeframes:
+            msg += f"\nTimeframes not scanned: {', '.join(unknown_timeframes)}. Scanned timeframes: {', '.join(utils.TIMEFRAMES)}"
+        if unknown_pairs:
+            msg += f"\nPairs not in the universe: {', '.join(unknown_pairs)}. Pairs in the universe: {', '.join(universe_pairs)}"
+        update.message.reply_text(msg)
+        return
+    subscription = subscriptions.REGISTRY.subscribe(chat_id, pairs, timeframes)
+    msg = f'Subscribed to {describe_subscription(subscription)}'
+    if state_store.STATE.n_threads == 0:
+        msg += '\nScans are not running yet, start them with /init_scans'
+    update.message.reply_text(msg)
+    return
+
+
+def unsubscribe(update: Update, context: CallbackContext):
+    """ Unsubscribe the chat from some pairs and / or timeframes, or from everything: /unsubscribe [PAIR ...] [TIMEFRAME ...] """
+    chat_id = update.effective_message.chat_id
+    pairs, timeframes = subscriptions.parse_subscription_args(context.args)
+    found, covered = subscriptions.REGISTRY.unsubscribe(chat_id, pairs, timeframes)
+    if not found:
+        msg = 'This chat has no subscription'
+    else:
+        subscription = subscriptions.REGISTRY.get(chat_id)
+        msg = f'Now subscribed to {describe_subscription(subscription)}' if subscription else 'Unsubscribed from every alert'
+        if covered:
+            msg += (
+                f"\n{', '.join(covered)} cannot be removed from a subscription to all pairs: "
+                "send /unsubscribe *, then /subscribe the pairs to keep"
+            )
+    update.message.reply_text(msg)
+    return
+
+
+def display_subscriptions(update: Update, context: CallbackContext):
+    """ Tell user what the chat is subscribed to """
+    subscription = subscriptions.REGISTRY.get(update.effective_message.chat_id)
+    msg = f'Subscribed to {describe_subscription(subscription)}' if subscription else 'This chat has no subscription'
+    update.message.reply_text(msg)
     return
 
 # --------------------------------------------------
@@ -118,6 +264,11 @@ def help(update: Update, context: CallbackContext):
     msg += "\n\t<b>\\help</b> - return list of commands"
     msg += "\n\t<b>\\display_universe</b> - show listed pairs on which to look for trading opportunities"
     msg += "\n\t<b>\init_scans</b> - initiate loop to scan markets for opportunities periodically"
+    msg += "\n\t<b>\\scheduler_metrics</b> - show how late the scheduled scans fired"
+    msg += "\n\t<b>\\delivery_metrics</b> - show the alerts queue depth and delivery latency"
+    msg += "\n\t<b>\\subscribe</b> [pairs] [timeframes] - receive the alerts of some pairs (all by default)"
+    msg += "\n\t<b>\\unsubscribe</b> [pairs] [timeframes] - stop receiving the alerts of some pairs or timeframes (all by default)"
+    msg += "\n\t<b>\\subscriptions</b> - show the pairs and timeframes this chat is subscribed to"
 
     chat_id = update.message.chat_id
     bot.send_message(chat_id=chat_id, text=msg, parse_mode=telegram.ParseMode.HTML)
@@ -130,7 +281,7 @@ def initiate_account():
     Paper Trading, the other for Real Trading.
     """
     # Set up next_timestamp
-    timedelta = pd.Timedelta(utils.TIMEFRAME)
+    timedelta = pd.Timedelta(utils.BASE_TIMEFRAME)
     t = pd.Timestamp(int(tm.time()), unit='s')
     divider = int(timedelta.to_timedelta64()/10**9/60)
 
@@ -143,21 +294,31 @@ def initiate_account():
     ) + timedelta
     data = {
         'next timestamp': next_timestamp,
-        'universe': utils.UNIVERSE,
+        'universe': universe.UNIVERSE_MANAGER.pairs(),
         'nThreads': 0,
-        'opportunities': dict()
+        'opportunities': dict(),
+        # Subscriptions outlive restarts
+        'subscriptions': state_store.STATE.subscriptions
     }
-    utils.dump_pickle(data, utils.data_path)
+    state_store.STATE.reset(data)
     return
 
 if __name__ == '__main__':
     telegram_token = utils.read_file(path=utils.telegram_token_path)
     initiate_account()
+    futures_api.CLOCK.start()
     updater = Updater(telegram_token)
     bot = telegram.Bot(telegram_token)
+    DELIVERY = telegram_queue.DeliveryQueue(bot)
+    DELIVERY.start()
     dp = updater.dispatcher
     dp.add_handler(CommandHandler('init_scans', initiate_opportunity_scans))
     dp.add_handler(CommandHandler('help', help))
     dp.add_handler(CommandHandler('display_universe', display_universe))
+    dp.add_handler(CommandHandler('scheduler_metrics', display_scheduler_metrics))
+    dp.add_handler(CommandHandler('delivery_metrics', display_delivery_metrics))
+    dp.add_handler(CommandHandler('subscribe', subscribe))
+    dp.add_handler(CommandHandler('unsubscribe', unsubscribe))
+    dp.add_handler(CommandHandler('subscriptions', display_subscriptions))
     updater.start_polling()
     updater.idle()
\ No newline at end of file
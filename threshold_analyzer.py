@@ -1,96 +1,223 @@
-import pandas as pd
+# PreBurst Signals Telegram Bot
+#
+# Antoine Beretto
+# GitHub: @augustin999
+#
+# April 2021
+#
+# Batch report of the BB span thresholds of the whole universe, from the local OHLCV store:
+# span distribution, time spent in the pre-burst zone and triggers of every pair, written
+# to a directory with one PNG per pair, summary.csv and an index.html to browse them.
+#
+# Usage: python threshold_analyzer.py [--pairs BTCUSDT ETHUSDT] [--timeframe 4h] [--output files/reports/thresholds_4h]
+
+import argparse
+import html
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import matplotlib.dates as mdates
 import numpy as np
-import matplotlib.pyplot as plt
-from ta.trend import cci
-from ta.momentum import rsi
-from ta.volatility import BollingerBands
-import requests as re
-import time as tm
+import pandas as pd
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from scanner import backtest, indicators, ohlc_store, utils
+from scanner.chart_renderer import downsample_index, set_limits
+from scanner.universe import UNIVERSE_MANAGER
 
-from scanner import futures_api, spot_api, utils
+# Span quantiles reported for every pair
+QUANTILES = [0.01, 0.05, 0.25, 0.5, 0.75, 0.95]
+HISTOGRAM_BINS = 60
+# Candles drawn on the time series panels (the statistics use every candle)
+MAX_POINTS = 2000
 
 
-def calc_slope(x):
+class ThresholdChart:
     """
-    Compute linear regressions on a rolling window and store the calculated slope.
+    Report chart of a pair, built once per worker process and re-used for every pair:
+    close prices with the pre-burst triggers, BB span against the threshold, and the span histogram.
+    Each render only updates the artists' data and prints the PNG.
     """
-    slopes = np.polyfit(range(len(x)), x, 1)[0]
-    return slopes
 
+    def __init__(self, figsize=(12, 8), dpi=80):
+        self.fig = Figure(figsize=figsize, dpi=dpi)
+        self.canvas = FigureCanvasAgg(self.fig)
+        ax1 = self.fig.add_subplot(311)
+        ax1.xaxis_date()
+        self.close, = ax1.plot([], [], color='darkblue', linewidth=0.6)
+        self.triggers = ax1.scatter([], [], marker='*', color='red', s=20, zorder=3)
+        ax1.set_ylabel('Close')
+        # Placeholder title, so that tight_layout leaves room for it
+        self.title = ax1.set_title('PAIR', fontsize=14)
+        ax2 = self.fig.add_subplot(312, sharex=ax1)
+        self.span, = ax2.plot([], [], color='red', linewidth=0.6)
+        self.span_threshold = ax2.axhline(np.nan, color='black', linewidth=0.8, linestyle='--')
+        ax2.set_ylabel('BB span')
+        ax3 = self.fig.add_subplot(313)
+        self.histogram, = ax3.plot([], [], color='red', linewidth=0.8, drawstyle='steps-post')
+        self.histogram_threshold = ax3.axvline(np.nan, color='black', linewidth=0.8, linestyle='--')
+        ax3.set_xlabel('BB span')
+        ax3.set_ylabel('Candles')
+        self.axes = (ax1, ax2, ax3)
+        self.fig.tight_layout()
 
-def load_latest_futures_ohlc(pair):
-    """
-    Pull future OHLCV data from the Binance API.
-    """
-    next_timestamp = utils.load_pickle(utils.data_path)['next timestamp']
-    limit = 1500 # 3*utils.CCI_PERIOD
-    ohlc = futures_api.get_contract_klines(pair, utils.TIMEFRAME, contractType='PERPETUAL', limit=limit)
-    ohlc = pd.DataFrame(ohlc, columns=utils.OHLC_COLUMNS)
-    ohlc = ohlc[ohlc['open_time'] < 1000*next_timestamp.timestamp()]
-    ohlc['open_time'] = pd.to_datetime(ohlc['open_time'], unit='ms')
-    return ohlc
+    def render(self, pair: str, open_times, close, span, entries, threshold, path: Path):
+        ax1, ax2, ax3 = self.axes
+        dates = mdates.date2num(open_times)
+        index = downsample_index(len(close), MAX_POINTS)
+        self.close.set_data(dates[index], close[index])
+        self.triggers.set_offsets(np.column_stack([dates[entries], close[entries]]) if entries.any() else np.empty((0, 2)))
+        self.span.set_data(dates[index], span[index])
+        self.span_threshold.set_ydata([threshold, threshold])
+        self.title.set_text(f'{pair} - threshold {threshold:.4f}')
+        ax1.set_xlim(dates[0], dates[-1])
+        set_limits(ax1, np.nanmin(close), np.nanmax(close))
+        set_limits(ax2, 0, np.nanmax(span))
+        defined = span[~np.isnan(span)]
+        counts, edges = np.histogram(defined, bins=HISTOGRAM_BINS)
+        self.histogram.set_data(edges, np.r_[counts, counts[-1]])
+        self.histogram_threshold.set_xdata([threshold, threshold])
+        ax3.set_xlim(edges[0], edges[-1])
+        set_limits(ax3, 0, counts.max())
+        # Fastest zlib level: the PNG encoding takes half the time
+        self.canvas.print_png(str(path), pil_kwargs={'compress_level': 1})
 
 
-def compute_technical_indicators(ohlc):
-    """
-    Calculate some technical indicators that will be usefull for examining signals.
-    *** THIS FUNCTION MUST BE EDITED ACCORDING TO THE TARGETTED SIGNALS ***
-    """
-    BB = BollingerBands(ohlc['close_price'], utils.BB_PERIOD, utils.BB_MULTIPLIER)
-    ohlc['BBh'] = BB.bollinger_hband()
-    ohlc['BBl'] = BB.bollinger_lband()
-    ohlc['cci'] = cci(high=ohlc['high_price'], low=ohlc['low_price'], close=ohlc['close_price'], window=utils.CCI_PERIOD)
-    ohlc['rsi'] = rsi(close=ohlc['close_price'], window=utils.RSI_PERIOD)
-    ohlc['BBh_slope'] = ohlc['BBh'].rolling(utils.N_DIFF, min_periods=2).apply(calc_slope)
-    ohlc['BBl_slope'] = ohlc['BBl'].rolling(utils.N_DIFF, min_periods=2).apply(calc_slope)
-    ohlc['BB_slopes_diff'] = ohlc['BBh_slope'] + ohlc['BBl_slope']
-    ohlc['BB_span'] = (ohlc['BBh'] - ohlc['BBl']) / ohlc['close_price']
-    ohlc['pre_burst'] = np.where(ohlc['BB_span'] <= BB_SPAN_THRESHOLD, True, False)
-    return ohlc
-
-
-def create_opportunity_plot(ohlc, pair):
+_chart = None
+
+
+def get_chart():
+    """ Report chart of the current process, created on first use """
+    global _chart
+    if _chart is None:
+        _chart = ThresholdChart()
+    return _chart
+
+
+def analyze_pair(pair: str, timeframe=utils.TIMEFRAME, start=None, end=None, output_dir: Path = None):
     """
-    Create a chart containing useful information about the current state of the market.
-    *** THIS FUNCTION MUST BE EDITED ACCORDING TO THE TARGETTED SIGNALS ***
+    BB span statistics of a pair over its stored candles, with its calibrated threshold:
+    span quantiles, percentile of the threshold in the span distribution, share of candles in
+    the pre-burst zone and triggers (candles entering it). Draws its chart into output_dir if given.
+    A pair without calibrated threshold gets an automatic one from its first BACKTEST_WARMUP candles,
+    like in the backtest, and its statistics only cover the candles after them (auto_threshold is True).
+    Returns a dict of statistics, None if the pair has no stored candles.
     """
-    fig = plt.figure(figsize=(12, 6))
-    # Plot OHLC prices + Bollinger Bands + PreBurst Signals
-    ax1 = fig.add_subplot(211)
-    ax1.plot(ohlc['close_time'], ohlc['BBh'], color='red', linewidth=0.5)
-    ax1.plot(ohlc['close_time'], ohlc['BBl'], color='red', linewidth=0.5)
-    ax1.fill_between(ohlc['close_time'], y1=ohlc['BBl'], y2=ohlc['BBh'], color='pink')
-    ax1.scatter(ohlc['close_time'], ohlc['high_price'], marker='.', color='darkblue', s=10)
-    ax1.scatter(ohlc['close_time'], ohlc['low_price'], marker='.', color='red', s=10)
-    ax1.scatter(ohlc['close_time'], ohlc['open_price'], marker='.', color='orange', s=10)
-    ax1.scatter(ohlc['close_time'], ohlc['close_price'], marker='.', color='cyan', s=10)
-    ax1.scatter(ohlc[ohlc['pre_burst'] == True]['close_time'], ohlc[ohlc['pre_burst'] == True]['close_price'], marker='*', color='yellow', s=30)
-    ax1.set_ylabel('OHLC & BB', fontsize=18)
-    ax1.set_title(pair.upper(), fontsize=20)
-    # Plot the Bollinger Bands span
-    ax2 = fig.add_subplot(212, sharex=ax1)
-    ax2.plot(ohlc['close_time'], ohlc['BB_span'], color='red', linewidth=0.8)
-    ax2.plot(ohlc['close_time'], [0]*len(ohlc['close_time']), color='black', linewidth=0.8)
-    ax2.fill_between(x=ohlc['close_time'], y1=[0]*len(ohlc['close_time']), y2=ohlc['BB_span'], color='pink')
-    ax2.set_ylabel('BB span', fontsize=18)
-    # Save the figure in the appropriate location
-    plt.tight_layout()
-    # img_path = utils.images_path / f'{pair.upper()}_opp.png'
-    # plt.savefig(img_path)
-    plt.show()
-    return 
-
-
-
-# BTCUSDT: 0.035
-# ETHUSDT: 0.10
-# ADAUSDT: 0.08
-# LINKUSDT: 0.08
+    _, open_times, close, _, _ = backtest.load_universe([pair], timeframe, start, end)
+    if len(open_times) == 0:
+        return None
+    bbh, bbl = indicators.batch_bollinger_bands(close)
+    span = ((bbh - bbl) / close)[0]
+    calibrated = UNIVERSE_MANAGER.calibrated_thresholds(timeframe)
+    auto = pair not in calibrated
+    if auto:
+        thresholds, starts = backtest.warmup_thresholds(close)
+        threshold, first = thresholds[0], starts[0]
+    else:
+        threshold, first = calibrated[pair], 0
+    close = close[0]
+    evaluated = np.arange(len(span)) >= first
+    defined = span[evaluated & ~np.isnan(span)]
+    with np.errstate(invalid='ignore'):
+        pre_burst = span <= threshold
+    entries = pre_burst & ~np.r_[False, pre_burst[:-1]] & evaluated
+    statistics = {
+        'pair': pair,
+        'first_candle': str(pd.Timestamp(open_times[0])),
+        'candles': len(defined),
+        'threshold': threshold,
+        'auto_threshold': auto,
+        'threshold_percentile': np.mean(defined <= threshold) if len(defined) else np.nan,
+        'triggers': int(entries.sum()),
+        'triggers_per_1000': 1000*entries.sum() / len(defined) if len(defined) else np.nan,
+        'last_span': defined[-1] if len(defined) else np.nan,
+    }
+    for q, value in zip(QUANTILES, np.quantile(defined, QUANTILES) if len(defined) else [np.nan]*len(QUANTILES)):
+        statistics[f'span_q{round(100*q):02d}'] = value
+    if output_dir is not None and len(defined):
+        get_chart().render(pair, open_times, close, span, entries, threshold, Path(output_dir) / f'{pair}.png')
+    return statistics
+
+
+def analyze_universe(pairs: list, timeframe=utils.TIMEFRAME, start=None, end=None, output_dir: Path = None, max_workers=None):
+    """ analyze_pair() of every pair in a process pool, returns the statistics as a DataFrame indexed by pair """
+    statistics = []
+    with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count()) as pool:
+        futures = {pair: pool.submit(analyze_pair, pair, timeframe, start, end, output_dir) for pair in pairs}
+        for pair, future in futures.items():
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f'Error in threshold_analyzer.analyze_universe()\nAnalysis failed for {pair}\n{e}')
+                continue
+            if result is not None:
+                statistics.append(result)
+    if not statistics:
+        return pd.DataFrame()
+    return pd.DataFrame(statistics).set_index('pair')
+
+
+def plot_overview(report: pd.DataFrame, path: Path):
+    """ Threshold of every pair against its median span, and distribution of the threshold percentiles """
+    fig = Figure(figsize=(12, 5), dpi=80)
+    ax1 = fig.add_subplot(121)
+    ax1.scatter(report['span_q50'], report['threshold'], marker='.', color='darkblue')
+    ax1.set_xlabel('Median BB span')
+    ax1.set_ylabel('Threshold')
+    ax2 = fig.add_subplot(122)
+    ax2.hist(report['threshold_percentile'].dropna(), bins=20, range=(0, 1), color='pink', edgecolor='red')
+    ax2.set_xlabel('Threshold percentile in the span distribution')
+    ax2.set_ylabel('Pairs')
+    fig.tight_layout()
+    FigureCanvasAgg(fig).print_png(str(path))
+
+
+def write_report(report: pd.DataFrame, output_dir: Path, timeframe: str, charts=True):
+    """ Write summary.csv, overview.png and an index.html listing every pair with its chart """
+    output_dir = Path(output_dir)
+    report.to_csv(output_dir / 'summary.csv')
+    plot_overview(report, output_dir / 'overview.png')
+    table = report.round(4)
+    # Pairs on an automatic threshold are starred
+    labels = {pair: html.escape(pair) + (' *' if auto else '') for pair, auto in report['auto_threshold'].items()}
+    table.index = [f'<a href="#{pair}">{labels[pair]}</a>' if charts else labels[pair] for pair in table.index]
+    sections = ''.join(
+        f'<h2 id="{pair}">{labels[pair]}</h2><img src="{pair}.png" loading="lazy">'
+        for pair in report.index
+    ) if charts else ''
+    page = (
+        f'<html><head><meta charset="utf-8"><title>BB span thresholds - {timeframe}</title>'
+        '<style>body{font-family:sans-serif} table{border-collapse:collapse;font-size:12px} '
+        'td,th{padding:2px 6px;border-bottom:1px solid #ddd;text-align:right}</style></head><body>'
+        f'<h1>BB span thresholds - {timeframe} - {len(report)} pairs</h1>'
+        f'<p>BB_PERIOD = {utils.BB_PERIOD}, BB_MULTIPLIER = {utils.BB_MULTIPLIER}</p>'
+        f'<p>* no calibrated threshold: automatic one from the first {utils.BACKTEST_WARMUP} candles, '
+        'statistics over the candles after them</p>'
+        '<img src="overview.png">'
+        f'{table.to_html(escape=False)}{sections}</body></html>'
+    )
+    (output_dir / 'index.html').write_text(page)
+
 
 if __name__ == '__main__':
-    # %matplotlib widget
-    pair = 'ETHUSDT'
-    BB_SPAN_THRESHOLD = 0.1
-    ohlc = load_latest_futures_ohlc(pair)
-    ohlc = compute_technical_indicators(ohlc)
-    create_opportunity_plot(ohlc, pair)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Report the BB span distributions and pre-burst triggers of every stored pair')
+    parser.add_argument('--pairs', nargs='+', default=None, help='pairs to analyze (default: every stored pair)')
+    parser.add_argument('--timeframe', default=utils.TIMEFRAME)
+    parser.add_argument('--start', default=None, help='first date, eg: 2020-01-01 (default: first stored candle)')
+    parser.add_argument('--end', default=None, help='last date (default: last stored candle)')
+    parser.add_argument('--output', default=None, help='report directory (default: files/reports/thresholds_<timeframe>)')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: one per CPU)')
+    parser.add_argument('--no-charts', action='store_true', help='only write the statistics, no PNG per pair')
+    args = parser.parse_args()
+
+    output_dir = Path(args.output) if args.output else utils.reports_path / f'thresholds_{args.timeframe}'
+    output_dir.mkdir(parents=True, exist_ok=True)
+    pairs = args.pairs or ohlc_store.OHLC_STORE.pairs()
+    report = analyze_universe(pairs, args.timeframe, args.start, args.end, None if args.no_charts else output_dir, args.workers)
+    if report.empty:
+        print(f'No stored {args.timeframe} candles for these pairs')
+    else:
+        write_report(report, output_dir, args.timeframe, charts=not args.no_charts)
+        print(f'{len(report)} pairs analyzed, report written to {output_dir / "index.html"}')
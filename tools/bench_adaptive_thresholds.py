@@ -0,0 +1,87 @@
+# PreBurst Signals Telegram Bot
+#
+# Antoine Beretto
+# GitHub: @augustin999
+#
+# April 2021
+#
+# Adaptive thresholds on BB spans of a random walk going through three
+# volatility regimes: the rolling P² quantile against the exact quantile of the
+# same candles and against a fixed threshold, cost of one update, size of the
+# checkpoint per pair, and a checkpoint round trip.
+#
+# Usage: python tools/bench_adaptive_thresholds.py [candles] [pairs]
+
+import sys
+import time as tm
+
+from mock_exchange import prepare_workspace
+
+prepare_workspace()
+
+import numpy as np
+
+from scanner import adaptive_thresholds, indicators, utils
+
+REGIMES = [0.01, 0.03, 0.015]
+
+
+def regime_spans(n: int, seed=0):
+    """ BB spans of a random walk whose volatility changes every n / len(REGIMES) candles """
+    rng = np.random.default_rng(seed)
+    volatility = np.repeat(REGIMES, -(-n // len(REGIMES)))[:n]
+    close = 100*np.exp(np.cumsum(rng.normal(0, volatility)))
+    bbh, bbl = indicators.batch_bollinger_bands(close[None, :])
+    return ((bbh - bbl) / close)[0]
+
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 6000
+    n_pairs = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    window = utils.ADAPTIVE_THRESHOLD_WINDOW
+    spans = regime_spans(n)
+    open_times = np.arange(n, dtype=np.int64) * utils.TIMEFRAMES_MS[utils.TIMEFRAME]
+
+    thresholds = adaptive_thresholds.AdaptiveThresholds()
+    estimates = np.full(n, np.nan)
+    start = tm.perf_counter()
+    for t in range(n):
+        estimates[t] = thresholds.observe('MOCK000USDT', utils.TIMEFRAME, open_times[t:t + 1], spans[t:t + 1])
+    update_time = (tm.perf_counter() - start) / n
+
+    # Exact quantile of the same candles as the sketch: the last `window` to 2*`window` valid spans
+    valid = np.flatnonzero(~np.isnan(spans))
+    exact = np.full(n, np.nan)
+    for k, t in enumerate(valid):
+        if k + 1 < utils.ADAPTIVE_THRESHOLD_MIN_CANDLES:
+            continue
+        covered = window + (k + 1) % window if k + 1 >= window else k + 1
+        exact[t] = np.quantile(spans[valid[k + 1 - covered:k + 1]], utils.ADAPTIVE_THRESHOLD_QUANTILE)
+    static = np.quantile(spans[valid], utils.ADAPTIVE_THRESHOLD_QUANTILE)
+
+    print(f'{n} candles, quantile {utils.ADAPTIVE_THRESHOLD_QUANTILE}, window {window}, volatility regimes {REGIMES}')
+    print(f'{"regime":>8} {"exact":>8} {"adaptive":>9} {"rel err":>8} {"static":>8} {"candles below exact/adaptive/static":>38}')
+    for i, bounds in enumerate(np.array_split(np.arange(n), len(REGIMES))):
+        # Second half of each regime: the sketch has caught up with it
+        t = bounds[len(bounds)//2:]
+        t = t[~np.isnan(exact[t])]
+        error = np.nanmean(np.abs(estimates[t] - exact[t]) / exact[t])
+        below = [int(np.sum(spans[t] <= threshold)) for threshold in (exact[t], estimates[t], static)]
+        print(
+            f'{REGIMES[i]:>8} {np.mean(exact[t]):>8.4f} {np.mean(estimates[t]):>9.4f} {error:>8.2%} '
+            f'{static:>8.4f} {"/".join(map(str, below)):>38}'
+        )
+    print(f'Update: {update_time*1e6:.1f} us per candle, {n_pairs} pairs x 3 timeframes: {update_time*n_pairs*3*1e3:.1f} ms per candle close')
+
+    for i in range(1, n_pairs):
+        thresholds.observe(f'MOCK{i:03d}USDT', utils.TIMEFRAME, open_times, regime_spans(n, seed=i))
+    thresholds.save()
+    restored = adaptive_thresholds.AdaptiveThresholds.load()
+    size = utils.adaptive_thresholds_path.stat().st_size
+    print(f'Checkpoint of {n_pairs} pairs: {size/1024:.0f} kB ({size/n_pairs:.0f} B per pair)')
+    for i in range(n_pairs):
+        pair = f'MOCK{i:03d}USDT'
+        assert restored.threshold(pair) == thresholds.threshold(pair)
+    # Candles already seen are not fed twice
+    assert restored.observe('MOCK000USDT', utils.TIMEFRAME, open_times, spans) == thresholds.threshold('MOCK000USDT')
+    print('Checkpoint restored with the same thresholds, candles already seen are skipped')
@@ -0,0 +1,65 @@
+# PreBurst Signals Telegram Bot
+#
+# Antoine Beretto
+# GitHub: @augustin999
+#
+# April 2021
+#
+# Compute side of a universe scan: one compute_technical_indicators call per pair
+# versus a single batch pass over the (pairs x candles) array, checking both agree.
+#
+# Usage: python tools/bench_batch_indicators.py [n_pairs]
+
+import sys
+import time as tm
+import numpy as np
+import pandas as pd
+
+from mock_exchange import mock_pairs, prepare_workspace, synthetic_klines
+
+prepare_workspace()
+
+from scanner import indicators, scanner, utils
+from scanner.universe import UNIVERSE_MANAGER
+
+COLUMNS = ['BBh', 'BBl', 'cci', 'rsi', 'BBh_slope', 'BBl_slope', 'BB_span']
+
+
+def synthetic_universe(n_pairs: int):
+    ohlcs = dict()
+    for pair in mock_pairs(n_pairs):
+        klines = synthetic_klines(pair, '4h', limit=utils.SCAN_LIMIT)
+        ohlc = pd.DataFrame([kline[:len(utils.OHLC_COLUMNS)] for kline in klines], columns=utils.OHLC_COLUMNS)
+        for column in ['open_price', 'high_price', 'low_price', 'close_price']:
+            ohlc[column] = ohlc[column].astype(float)
+        ohlcs[pair] = ohlc
+        utils.BB_SPAN_THRESHOLDS.setdefault(utils.TIMEFRAME, dict())[pair] = 0.05
+    return ohlcs
+
+
+if __name__ == '__main__':
+    n_pairs = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    ohlcs = synthetic_universe(n_pairs)
+
+    start = tm.perf_counter()
+    per_pair = {pair: scanner.compute_technical_indicators(ohlc.copy(), pair) for pair, ohlc in ohlcs.items()}
+    per_pair_time = tm.perf_counter() - start
+
+    start = tm.perf_counter()
+    pairs, open_times, close, high, low = indicators.stack_ohlc(ohlcs)
+    stack_time = tm.perf_counter() - start
+    results = indicators.compute_indicators_batch(close, high, low, UNIVERSE_MANAGER.thresholds(pairs))
+    batch_time = tm.perf_counter() - start
+
+    error = 0.0
+    for i, pair in enumerate(pairs):
+        for column in COLUMNS:
+            reference = per_pair[pair][column].values
+            assert np.array_equal(np.isnan(reference), np.isnan(results[column][i]))
+            error = max(error, np.nanmax(np.abs(results[column][i] - reference) / np.maximum(np.abs(reference), 1e-9)))
+        assert np.array_equal(per_pair[pair]['pre_burst'].values, results['pre_burst'][i])
+
+    print(f'{n_pairs} pairs x {utils.SCAN_LIMIT} candles')
+    print(f'per-pair compute_technical_indicators: {per_pair_time:8.3f} s')
+    print(f'batch (stack {1000*stack_time:.1f} ms):        {batch_time:8.3f} s  ({per_pair_time/batch_time:.0f}x)')
+    print(f'max relative difference: {error:.2e}')
@@ -0,0 +1,80 @@
+# PreBurst Signals Telegram Bot
+#
+# Antoine Beretto
+# GitHub: @augustin999
+#
+# April 2021
+#
+# Calibration grid search over a local OHLCV store filled with several years of
+# synthetic 4h candles: time of the whole (BB period x BB multiplier x
+# threshold) grid over every pair in the process pool, against a naive search
+# backtesting each grid point of one pair separately, whose counts it must match.
+#
+# Usage: python tools/bench_calibration.py [pairs] [years]
+
+import sys
+import time as tm
+
+from mock_exchange import mock_pairs, prepare_workspace, synthetic_klines
+
+prepare_workspace()
+
+import numpy as np
+
+from scanner import backtest, calibration, indicators, ohlc_store, utils
+
+TIMEFRAME = '4h'
+
+
+def fill_store(pairs: list, years: int):
+    interval = utils.TIMEFRAMES_MS[TIMEFRAME]
+    end = int(tm.time()*1000) // interval * interval
+    n = int(years*365*86_400_000 / interval)
+    for pair in pairs:
+        ohlc_store.OHLC_STORE.append(pair, TIMEFRAME, synthetic_klines(pair, TIMEFRAME, limit=n, startTime=end - n*interval, now_ms=end))
+
+
+def naive_grid(pair: str, move: float):
+    """ Bands, entries and moves recomputed for every grid point, returns {(period, multiplier, threshold): (triggers, hits)} """
+    _, _, close, high, low = backtest.load_universe([pair], TIMEFRAME)
+    counts = dict()
+    for bb_period in utils.CALIBRATION_BB_PERIODS:
+        for bb_multiplier in utils.CALIBRATION_BB_MULTIPLIERS:
+            for threshold in utils.CALIBRATION_THRESHOLDS:
+                bbh, bbl = indicators.batch_bollinger_bands(close, bb_period, bb_multiplier)
+                with np.errstate(invalid='ignore'):
+                    pre_burst = (bbh - bbl) / close <= threshold
+                entries = pre_burst & ~np.pad(pre_burst[:, :-1], ((0, 0), (1, 0)))
+                moves = backtest.forward_moves(close, high, low, utils.BACKTEST_HORIZON)[entries]
+                with np.errstate(invalid='ignore'):
+                    counts[(bb_period, bb_multiplier, threshold)] = (entries.sum(), np.sum(moves >= move))
+    return counts
+
+
+if __name__ == '__main__':
+    n_pairs = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    years = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    # The synthetic prices swing less than real ones: a 2% move counts as a burst
+    move = 0.02
+    pairs = mock_pairs(n_pairs)
+    fill_store(pairs, years)
+    grid_size = len(utils.CALIBRATION_BB_PERIODS) * len(utils.CALIBRATION_BB_MULTIPLIERS) * len(utils.CALIBRATION_THRESHOLDS)
+
+    start = tm.perf_counter()
+    results = calibration.run_grid(pairs, TIMEFRAME, move=move)
+    grid_time = tm.perf_counter() - start
+    print(f'{n_pairs} pairs x {years} years x {grid_size} grid points: {grid_time:.2f} s ({len(results)} results)')
+    bb_period, bb_multiplier, best = calibration.select_best(results)
+    print(f'Best bands: BB_PERIOD = {bb_period}, BB_MULTIPLIER = {bb_multiplier}')
+    print(best.head(10).round(4).to_string())
+
+    start = tm.perf_counter()
+    counts = naive_grid(pairs[0], move)
+    naive_time = tm.perf_counter() - start
+    print(f'Naive search of {pairs[0]}: {naive_time:.2f} s for one pair, ~{naive_time*n_pairs:.0f} s for {n_pairs} pairs')
+
+    first = results[results['pair'] == pairs[0]]
+    for row in first.itertuples():
+        triggers, hits = counts[(row.bb_period, row.bb_multiplier, row.threshold)]
+        assert (triggers, hits) == (row.triggers, row.hits), (row, triggers, hits)
+    print(f'{len(first)} grid points of {pairs[0]} match the naive search')
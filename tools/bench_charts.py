@@ -0,0 +1,73 @@
+# PreBurst Signals Telegram Bot
+#
+# Antoine Beretto
+# GitHub: @augustin999
+#
+# April 2021
+#
+# Per-chart render time of the opportunity plot drawn from scratch versus the
+# pre-built figure template, at full and reduced DPI, on the scan window and on
+# a long window that the template downsamples. The PNGs are written to the
+# throw-away workspace for a visual check.
+#
+# Usage: python tools/bench_charts.py [renders_per_case]
+
+import sys
+import time as tm
+
+from mock_exchange import prepare_workspace, synthetic_klines
+
+workspace = prepare_workspace()
+
+from scanner import chart_renderer, scanner, utils
+from scanner.candles import Candles
+from scanner.http_client import decode_klines
+import json
+
+WINDOWS = [utils.SCAN_LIMIT, 5000]
+
+
+def enriched_ohlc(n: int):
+    """ Indicator-enriched OHLC of the last n 4h candles of a synthetic pair, as passed to the renderer """
+    klines = decode_klines(json.dumps(synthetic_klines('BTCUSDT', '4h', limit=n + utils.CCI_PERIOD)).encode())
+    ohlc = Candles.from_klines(klines, '4h').to_frame()
+    ohlc = scanner.compute_technical_indicators(ohlc, 'BTCUSDT')
+    return ohlc.iloc[utils.CCI_PERIOD:][chart_renderer.CHART_COLUMNS]
+
+
+def from_scratch(ohlc, pair):
+    utils.CHART_TEMPLATES = False
+    return chart_renderer.render_opportunity_plot(ohlc, pair)
+
+
+def with_template(dpi):
+    def render(ohlc, pair):
+        return chart_renderer.get_template(utils.CHART_FIGSIZE, dpi).render(ohlc, pair)
+    return render
+
+
+def timed(render, ohlc, n: int):
+    render(ohlc, 'BTCUSDT')
+    start = tm.perf_counter()
+    for _ in range(n):
+        png = render(ohlc, 'BTCUSDT')
+    return 1000*(tm.perf_counter() - start) / n, png
+
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    cases = [
+        ('from scratch', from_scratch),
+        (f'template {utils.CHART_DPI} dpi', with_template(utils.CHART_DPI)),
+        ('template 72 dpi', with_template(72)),
+    ]
+    print(f'{"candles":>8} {"renderer":>18} {"ms/chart":>9} {"speed-up":>9} {"PNG (kB)":>9}')
+    for window in WINDOWS:
+        ohlc = enriched_ohlc(window)
+        reference = None
+        for name, render in cases:
+            duration, png = timed(render, ohlc, n)
+            reference = reference or duration
+            (workspace / f"{window}_{name.replace(' ', '_')}.png").write_bytes(png)
+            print(f'{window:>8} {name:>18} {duration:>9.1f} {reference/duration:>8.1f}x {len(png)//1024:>9}')
+    print(f'Charts written to {workspace}')
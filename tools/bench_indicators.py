@@ -0,0 +1,65 @@
+# PreBurst Signals Telegram Bot
+#
+# Antoine Beretto
+# GitHub: @augustin999
+#
+# April 2021
+#
+# Per-pair indicator time with the former rolling polyfit slopes versus the
+# vectorized closed-form slopes, checking both give the same values.
+#
+# Usage: python tools/bench_indicators.py
+
+import time as tm
+import numpy as np
+import pandas as pd
+
+from mock_exchange import prepare_workspace, synthetic_klines
+
+prepare_workspace()
+
+from scanner import indicators, scanner, utils
+
+CANDLES = [500, 1500, 100_000]
+
+
+def synthetic_ohlc(n: int):
+    klines = synthetic_klines('BTCUSDT', '1m', limit=n)
+    ohlc = pd.DataFrame([kline[:len(utils.OHLC_COLUMNS)] for kline in klines], columns=utils.OHLC_COLUMNS)
+    for column in ['open_price', 'high_price', 'low_price', 'close_price']:
+        ohlc[column] = ohlc[column].astype(float)
+    return ohlc
+
+
+def calc_slope(x):
+    """ Former slope of the scanner: linear regression of the rolling window """
+    return np.polyfit(range(len(x)), x, 1)[0]
+
+
+def polyfit_slopes(ohlc):
+    ohlc['BBh_slope'] = ohlc['BBh'].rolling(utils.N_DIFF, min_periods=2).apply(calc_slope)
+    ohlc['BBl_slope'] = ohlc['BBl'].rolling(utils.N_DIFF, min_periods=2).apply(calc_slope)
+    return ohlc
+
+
+def timed(function, *args):
+    start = tm.perf_counter()
+    result = function(*args)
+    return result, tm.perf_counter() - start
+
+
+if __name__ == '__main__':
+    utils.BB_SPAN_THRESHOLDS.setdefault(utils.TIMEFRAME, dict())['BTCUSDT'] = 0.035
+    print(f'{"candles":>8} {"polyfit slopes (s)":>19} {"closed-form (s)":>16} {"speedup":>8} {"indicators (s)":>15} {"max abs err":>12}')
+    for n in CANDLES:
+        ohlc, indicators_time = timed(scanner.compute_technical_indicators, synthetic_ohlc(n), 'BTCUSDT')
+        reference, polyfit_time = timed(polyfit_slopes, ohlc.copy())
+        slopes, closed_form_time = timed(
+            lambda: (indicators.rolling_slope(ohlc['BBh'], utils.N_DIFF), indicators.rolling_slope(ohlc['BBl'], utils.N_DIFF))
+        )
+        error = max(
+            np.nanmax(np.abs(slopes[0] - reference['BBh_slope'])),
+            np.nanmax(np.abs(slopes[1] - reference['BBl_slope']))
+        )
+        assert slopes[0].isna().equals(reference['BBh_slope'].isna())
+        print(f'{n:>8} {polyfit_time:>19.4f} {closed_form_time:>16.5f} {polyfit_time/closed_form_time:>7.0f}x {indicators_time:>15.4f} {error:>12.2e}')
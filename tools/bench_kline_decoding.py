@@ -0,0 +1,68 @@
+# PreBurst Signals Telegram Bot
+#
+# Antoine Beretto
+# GitHub: @augustin999
+#
+# April 2021
+#
+# Decoding of kline responses into the scanner's DataFrame: the former
+# json + np.float64 loop + list of lists path versus the structured array path.
+#
+# Usage: python tools/bench_kline_decoding.py [n_rows] [n_pairs]
+
+import json
+import sys
+import time as tm
+import numpy as np
+import pandas as pd
+
+from mock_exchange import mock_pairs, prepare_workspace, synthetic_klines
+
+prepare_workspace()
+
+from scanner import ohlc_store, utils
+from scanner.http_client import decode_klines, orjson
+
+
+def loop_decode(content: bytes):
+    """ Decoding as done before: stdlib json, one np.float64 per value, DataFrame from a list of lists """
+    klines = json.loads(content)
+    for i in range(len(klines)):
+        klines[i] = [
+            klines[i][0],
+            np.float64(klines[i][1]),
+            np.float64(klines[i][2]),
+            np.float64(klines[i][3]),
+            np.float64(klines[i][4]),
+            np.float64(klines[i][5]),
+            klines[i][6],
+            np.float64(klines[i][7]),
+            klines[i][8],
+            np.float64(klines[i][9]),
+            np.float64(klines[i][10]),
+        ]
+    ohlc = pd.DataFrame(klines, columns=utils.OHLC_COLUMNS)
+    ohlc['open_time'] = pd.to_datetime(ohlc['open_time'], unit='ms')
+    ohlc['close_time'] = pd.to_datetime(ohlc['close_time'], unit='ms')
+    return ohlc
+
+
+def array_decode(content: bytes):
+    """ Current decoding: raw body to structured array (orjson when installed), DataFrame from its columns """
+    return ohlc_store.array_to_frame(decode_klines(content))
+
+
+if __name__ == '__main__':
+    n_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1500
+    n_pairs = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    responses = [json.dumps(synthetic_klines(pair, '1m', limit=n_rows)).encode() for pair in mock_pairs(n_pairs)]
+    print(f'{n_pairs} responses x {n_rows} klines (orjson {"installed" if orjson else "not installed"})')
+    timings = dict()
+    for decode in (loop_decode, array_decode):
+        start = tm.perf_counter()
+        frames = [decode(content) for content in responses]
+        timings[decode.__name__] = tm.perf_counter() - start
+        print(f'{decode.__name__:>13}: {timings[decode.__name__]:6.2f} s')
+    reference, current = loop_decode(responses[0]), array_decode(responses[0])
+    assert (reference.values == current.values).all()
+    print(f'speedup: {timings["loop_decode"]/timings["array_decode"]:.1f}x')
@@ -0,0 +1,57 @@
+# PreBurst Signals Telegram Bot
+#
+# Antoine Beretto
+# GitHub: @augustin999
+#
+# April 2021
+#
+# Scan latency of the sequential loop versus the concurrent scan engine,
+# measured against the local mock exchange, with the number of times the
+# bot state was read from disk during the three scans.
+#
+# Usage: python tools/bench_scan_engine.py [latency_in_seconds]
+
+import sys
+import time as tm
+
+from mock_exchange import MockExchange, mock_pairs, prepare_workspace
+
+prepare_workspace()
+
+from scanner import futures_api, scanner, scan_engine, state_store, utils
+from scanner.http_client import HttpClient
+
+UNIVERSE_SIZES = [4, 50, 200]
+
+
+def sequential_scan(universe):
+    for pair in universe:
+        scanner.scan_market(pair)
+
+
+def engine_scan(universe, use_processes=False):
+    # No weight limit here: the mock exchange does not enforce one
+    limiter = scan_engine.RequestWeightLimiter(weight_limit=10**9)
+    for _ in scan_engine.scan_universe(universe, use_processes=use_processes, limiter=limiter):
+        pass
+
+
+if __name__ == '__main__':
+    latency = float(sys.argv[1]) if len(sys.argv) > 1 else 0.05
+    with MockExchange(latency=latency) as exchange:
+        futures_api.CLIENT = HttpClient(exchange.url)
+        print(f'Mock exchange latency: {1000*latency:.0f} ms, workers: {utils.SCAN_WORKERS}')
+        print(f'{"pairs":>6} {"sequential (s)":>15} {"threads (s)":>12} {"threads+procs (s)":>18} {"state disk loads":>17}')
+        for n in UNIVERSE_SIZES:
+            universe = mock_pairs(n)
+            for pair in universe:
+                # Threshold 0 so that no chart is rendered: only fetch + compute is timed
+                utils.BB_SPAN_THRESHOLDS.setdefault(utils.TIMEFRAME, dict())[pair] = 0
+            timings = []
+            disk_loads = state_store.STATE.disk_loads
+            for scan in (sequential_scan, engine_scan, lambda u: engine_scan(u, use_processes=True)):
+                start = tm.perf_counter()
+                scan(universe)
+                timings.append(tm.perf_counter() - start)
+            disk_loads = state_store.STATE.disk_loads - disk_loads
+            print(f'{n:>6} {timings[0]:>15.2f} {timings[1]:>12.2f} {timings[2]:>18.2f} {disk_loads:>17}')
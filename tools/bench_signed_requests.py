@@ -0,0 +1,59 @@
+# PreBurst Signals Telegram Bot
+#
+# Antoine Beretto
+# GitHub: @augustin999
+#
+# April 2021
+#
+# Latency of signed requests when each one first asks the server time versus
+# when timestamps come from the cached ClockSync offset, measured against the
+# local mock exchange (whose clock runs ahead of the local one).
+#
+# Usage: python tools/bench_signed_requests.py [latency_in_seconds]
+
+import sys
+import time as tm
+
+from mock_exchange import MockExchange, prepare_workspace
+
+prepare_workspace()
+
+from scanner import futures_api
+from scanner.clock_sync import ClockSync
+from scanner.http_client import HttpClient
+
+N_REQUESTS = 50
+CLOCK_OFFSET = 3000
+
+
+def time_balance_requests(n: int):
+    latencies = []
+    for _ in range(n):
+        start = tm.perf_counter()
+        balance = futures_api.get_futures_account_balance()
+        latencies.append(tm.perf_counter() - start)
+        assert balance is not None
+    latencies.sort()
+    return 1000*latencies[n//2], 1000*latencies[int(0.95*n)]
+
+
+if __name__ == '__main__':
+    latency = float(sys.argv[1]) if len(sys.argv) > 1 else 0.05
+    with MockExchange(latency=latency, clock_offset=CLOCK_OFFSET) as exchange:
+        futures_api.CLIENT = HttpClient(exchange.url)
+        print(f'Mock exchange latency: {1000*latency:.0f} ms, server clock {CLOCK_OFFSET} ms ahead')
+        print(f'{"timestamps":>22} {"p50 (ms)":>9} {"p95 (ms)":>9} {"requests":>9}')
+        # refresh_period=0 without background thread: one server time request before every signed request
+        clocks = [
+            ('server time each call', ClockSync(futures_api.get_server_time, samples=1, refresh_period=0)),
+            ('cached offset', ClockSync(futures_api.get_server_time)),
+        ]
+        for name, clock in clocks:
+            futures_api.CLOCK = clock
+            if clock.refresh_period:
+                clock.start()
+            count = exchange.request_count
+            p50, p95 = time_balance_requests(N_REQUESTS)
+            clock.stop()
+            print(f'{name:>22} {p50:>9.1f} {p95:>9.1f} {exchange.request_count - count:>9}')
+        print(f'Measured offset: {clocks[1][1].offset:.0f} ms (round trip {clocks[1][1].rtt:.0f} ms)')
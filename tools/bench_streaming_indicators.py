@@ -0,0 +1,73 @@
+# PreBurst Signals Telegram Bot
+#
+# Antoine Beretto
+# GitHub: @augustin999
+#
+# April 2021
+#
+# Parity of the streaming indicators (scanner/streaming_indicators.py), fed candle
+# by candle, with compute_technical_indicators on the whole series: pre-burst flags
+# and largest relative error of each indicator once warm, and time per update.
+#
+# Usage: python tools/bench_streaming_indicators.py
+
+import time as tm
+import numpy as np
+import pandas as pd
+
+from mock_exchange import prepare_workspace, synthetic_klines
+
+prepare_workspace()
+
+from scanner import scanner, utils
+from scanner.streaming_indicators import StreamingIndicators
+
+PAIR = 'BTCUSDT'
+# Past RESYNC_PERIOD, so that the resync of the running sums is covered too
+CANDLES = [1000, 5000]
+COLUMNS = ['BBh', 'BBl', 'cci', 'rsi', 'BBh_slope', 'BBl_slope', 'BB_slopes_diff', 'BB_span']
+
+
+def synthetic_ohlc(n: int):
+    klines = synthetic_klines(PAIR, utils.TIMEFRAME, limit=n)
+    ohlc = pd.DataFrame([kline[:len(utils.OHLC_COLUMNS)] for kline in klines], columns=utils.OHLC_COLUMNS)
+    for column in ['open_price', 'high_price', 'low_price', 'close_price']:
+        ohlc[column] = ohlc[column].astype(float)
+    return ohlc
+
+
+def relative_error(values: np.ndarray, reference: np.ndarray):
+    return np.max(np.abs(values - reference) / np.maximum(np.abs(reference), 1e-12))
+
+
+if __name__ == '__main__':
+    print(f'{"candles":>8} {"pre_burst":>10} {"mismatches":>11} {"max rel err":>12} {"worst":>15} {"update (us)":>12}')
+    for n in CANDLES:
+        ohlc = scanner.compute_technical_indicators(synthetic_ohlc(n), PAIR)
+        # A threshold among the spans, so that both outcomes of the flag are checked often, halfway between
+        # two of them: a span equal to it would flip on float noise
+        spans = np.sort(ohlc['BB_span'].dropna().values)
+        k = int(0.3*len(spans))
+        utils.BB_SPAN_THRESHOLDS.setdefault(utils.TIMEFRAME, dict())[PAIR] = float((spans[k] + spans[k + 1]) / 2)
+        ohlc = scanner.flag_pre_burst(ohlc, PAIR)
+
+        state = StreamingIndicators(PAIR)
+        start = tm.perf_counter()
+        rows = [
+            state.update(int(open_time), high, low, close)
+            for open_time, high, low, close in zip(ohlc['open_time'], ohlc['high_price'], ohlc['low_price'], ohlc['close_price'])
+        ]
+        update_time = (tm.perf_counter() - start) / n
+        streamed = pd.DataFrame(rows)
+
+        # The scanner only reads the candles after the CCI warm-up
+        reference, streamed = ohlc.iloc[utils.CCI_PERIOD:], streamed.iloc[utils.CCI_PERIOD:]
+        errors = {column: relative_error(streamed[column].values, reference[column].values) for column in COLUMNS}
+        worst = max(errors, key=errors.get)
+        mismatches = int((streamed['pre_burst'].values != reference['pre_burst'].values).sum())
+        print(
+            f'{n:>8} {int(reference["pre_burst"].sum()):>10} {mismatches:>11} {errors[worst]:>12.2e} {worst:>15} {1e6*update_time:>12.1f}'
+        )
+        assert mismatches == 0
+        assert errors[worst] <= 1e-8
+    print('Streaming indicators match compute_technical_indicators')
@@ -0,0 +1,52 @@
+# PreBurst Signals Telegram Bot
+#
+# Antoine Beretto
+# GitHub: @augustin999
+#
+# April 2021
+#
+# Batch threshold report over a local OHLCV store filled with several years of
+# synthetic 4h candles: time to analyze every pair and write the report
+# directory (one PNG per pair, summary.csv, overview.png, index.html).
+#
+# Usage: python tools/bench_threshold_analyzer.py [pairs] [years] [workers]
+
+import sys
+import time as tm
+
+from mock_exchange import mock_pairs, prepare_workspace, synthetic_klines
+
+prepare_workspace()
+
+import threshold_analyzer
+from scanner import ohlc_store, utils
+
+TIMEFRAME = '4h'
+
+
+def fill_store(pairs: list, years: int):
+    interval = utils.TIMEFRAMES_MS[TIMEFRAME]
+    end = int(tm.time()*1000) // interval * interval
+    n = int(years*365*86_400_000 / interval)
+    for pair in pairs:
+        ohlc_store.OHLC_STORE.append(pair, TIMEFRAME, synthetic_klines(pair, TIMEFRAME, limit=n, startTime=end - n*interval, now_ms=end))
+
+
+if __name__ == '__main__':
+    n_pairs = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    years = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    workers = int(sys.argv[3]) if len(sys.argv) > 3 else None
+    pairs = mock_pairs(n_pairs)
+    fill_store(pairs, years)
+    output_dir = utils.reports_path / f'thresholds_{TIMEFRAME}'
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    for charts in (False, True):
+        start = tm.perf_counter()
+        report = threshold_analyzer.analyze_universe(pairs, TIMEFRAME, output_dir=output_dir if charts else None, max_workers=workers)
+        threshold_analyzer.write_report(report, output_dir, TIMEFRAME, charts=charts)
+        duration = tm.perf_counter() - start
+        print(f'{len(report)} pairs x {years} years, {"with" if charts else "without"} charts: {duration:.1f} s')
+    pngs = list(output_dir.glob('*.png'))
+    print(f'{len(pngs)} PNG ({sum(png.stat().st_size for png in pngs)/2**20:.1f} MB) and index.html written to {output_dir}')
+    print(report.head(5).round(4).to_string())
@@ -0,0 +1,65 @@
+# PreBurst Signals Telegram Bot
+#
+# Antoine Beretto
+# GitHub: @augustin999
+#
+# April 2021
+#
+# Multi-timeframe scans resampled from one 1h base series per pair, against
+# the local mock exchange: REST requests of the initial seed and of the next
+# scans (a 1h close, then a 1d close where every timeframe is due), scan time
+# and memory held by the kline cache, as timeframes are added.
+#
+# Usage: python tools/bench_timeframes.py [pairs]
+
+import sys
+import time as tm
+
+from mock_exchange import MockExchange, mock_pairs, prepare_workspace
+
+prepare_workspace()
+
+import pandas as pd
+
+from scanner import chart_renderer, futures_api, kline_cache, scan_engine, scheduler, state_store, utils
+from scanner.http_client import HttpClient
+
+BASE_TIMEFRAME = '1h'
+CONFIGS = [['1h'], ['1h', '4h'], ['1h', '4h', '1d']]
+
+
+def scan(universe, boundary: int, exchange: MockExchange, limiter):
+    """ Scan the timeframes closing at boundary, returns (timeframes, requests, seconds, signals) """
+    timeframes = scheduler.due_timeframes(utils.TIMEFRAMES, boundary)
+    state_store.STATE.next_timestamp = pd.Timestamp(boundary, unit='ms')
+    requests = exchange.request_count
+    start = tm.perf_counter()
+    signals = sum(
+        opp is not None
+        for _, opp in scan_engine.scan_universe_batch(universe, limiter=limiter, timeframes=timeframes)
+    )
+    return timeframes, exchange.request_count - requests, tm.perf_counter() - start, signals
+
+
+if __name__ == '__main__':
+    n_pairs = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    universe = mock_pairs(n_pairs)
+    # No chart rendering and no price lookup: only the klines requests are counted
+    chart_renderer.CHART_RENDERER.submit = lambda ohlc, pair: None
+    futures_api.get_price = lambda pair: 0.0
+    # Last daily close, minus one hour: the first scan seeds the cache, the next ones top it up
+    day = utils.TIMEFRAMES_MS['1d']
+    last_day = int(tm.time()*1000) // day * day
+    with MockExchange(latency=0.005) as exchange:
+        futures_api.CLIENT = HttpClient(exchange.url)
+        limiter = scan_engine.RequestWeightLimiter(weight_limit=10**9)
+        utils.BASE_TIMEFRAME = BASE_TIMEFRAME
+        print(f'{n_pairs} pairs, base timeframe {BASE_TIMEFRAME}')
+        print(f'{"timeframes":>12} {"scan":>8} {"scanned":>12} {"requests":>9} {"time (s)":>9} {"signals":>8} {"cache (MB)":>11}')
+        for timeframes in CONFIGS:
+            utils.TIMEFRAMES = timeframes
+            kline_cache.KLINE_CACHE = kline_cache.KlineCache(maxlen=kline_cache.base_limit())
+            for name, boundary in [('seed', last_day - 2*3_600_000), ('1h close', last_day - 3_600_000), ('1d close', last_day)]:
+                scanned, requests, duration, signals = scan(universe, boundary, exchange, limiter)
+                cache_size = sum(candles.nbytes for candles in kline_cache.KLINE_CACHE.klines.values()) / 2**20
+                print(f'{",".join(timeframes):>12} {name:>8} {",".join(scanned):>12} {requests:>9} {duration:>9.2f} {signals:>8} {cache_size:>11.1f}')
@@ -0,0 +1,48 @@
+# PreBurst Signals Telegram Bot
+#
+# Antoine Beretto
+# GitHub: @augustin999
+#
+# April 2021
+#
+# Universe discovery and batch scans of every pair listed by the local mock
+# exchange: pairs kept by the filters, exchange info fetches across scans
+# (cached, so only the first scan pulls it), automatic thresholds and scan time.
+#
+# Usage: python tools/bench_universe.py [listed_pairs]
+
+import sys
+import time as tm
+
+from mock_exchange import MockExchange, prepare_workspace
+
+prepare_workspace()
+
+from scanner import chart_renderer, futures_api, scan_engine, universe, utils
+from scanner.http_client import HttpClient
+
+N_SCANS = 3
+
+
+if __name__ == '__main__':
+    n_pairs = int(sys.argv[1]) if len(sys.argv) > 1 else 250
+    # No chart rendering: only discovery, fetch and compute are timed
+    chart_renderer.CHART_RENDERER.submit = lambda ohlc, pair: None
+    with MockExchange(latency=0.01, n_pairs=n_pairs) as exchange:
+        futures_api.CLIENT = HttpClient(exchange.url)
+        # No weight limit here: the mock exchange does not enforce one
+        limiter = scan_engine.RequestWeightLimiter(weight_limit=10**9)
+        manager = universe.UNIVERSE_MANAGER
+        print(f'Listed pairs: {n_pairs}, minimum 24h volume: {utils.UNIVERSE_MIN_VOLUME:,.0f}')
+        print(f'{"scan":>5} {"pairs":>6} {"info fetches":>13} {"auto thresholds":>16} {"signals":>8} {"time (s)":>9}')
+        for i in range(N_SCANS):
+            start = tm.perf_counter()
+            pairs = manager.pairs()
+            signals = sum(
+                opp is not None
+                for _, opp in scan_engine.scan_universe_batch(pairs, limiter=limiter)
+            )
+            duration = tm.perf_counter() - start
+            print(f'{i + 1:>5} {len(pairs):>6} {manager.fetches:>13} {len(manager.auto_thresholds):>16} {signals:>8} {duration:>9.2f}')
+        thresholds = list(manager.auto_thresholds.values())
+        print(f'Automatic thresholds: min {min(thresholds):.4f}, max {max(thresholds):.4f}')
@@ -0,0 +1,297 @@
+# PreBurst Signals Telegram Bot
+#
+# Antoine Beretto
+# GitHub: @augustin999
+#
+# April 2021
+#
+# Local stand-ins for the Binance futures REST API and kline websocket streams,
+# used by the benchmarks and the stream replay.
+# Candles are synthetic but deterministic: the same (pair, open time) always
+# returns the same values, whatever the requested window.
+
+import asyncio
+import json
+import math
+import os
+import pickle
+import sys
+import tempfile
+import threading
+import time as tm
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import urlparse, parse_qs
+
+ROOT = Path(__file__).resolve().parent.parent
+
+INTERVALS_MS = {
+    '1m': 60_000, '3m': 180_000, '5m': 300_000, '15m': 900_000, '30m': 1_800_000,
+    '1h': 3_600_000, '2h': 7_200_000, '4h': 14_400_000, '6h': 21_600_000,
+    '8h': 28_800_000, '12h': 43_200_000, '1d': 86_400_000,
+}
+
+
+def mock_pairs(n: int):
+    """ Returns n fake USDT pair names """
+    return [f'MOCK{i:03d}USDT' for i in range(n)]
+
+
+def mock_exchange_info(n: int):
+    """
+    Futures exchange info listing the n mock pairs as trading perpetuals, plus a quarterly
+    contract, a halted pair and a BUSD pair that a USDT universe must leave out
+    """
+    def symbol(name, contract_type='PERPETUAL', status='TRADING', quote='USDT'):
+        return {
+            'symbol': name, 'pair': name.split('_')[0], 'contractType': contract_type, 'status': status,
+            'baseAsset': name.split('_')[0][:-len(quote)], 'quoteAsset': quote, 'pricePrecision': 4, 'quantityPrecision': 1,
+        }
+    symbols = [symbol(pair) for pair in mock_pairs(n)]
+    symbols += [
+        symbol('MOCK000USDT_210625', contract_type='CURRENT_QUARTER'),
+        symbol('HALTEDUSDT', status='SETTLING'),
+        symbol('MOCK000BUSD', quote='BUSD'),
+    ]
+    return {'timezone': 'UTC', 'serverTime': int(tm.time()*1000), 'symbols': symbols}
+
+
+def mock_quote_volume(pair: str):
+    """ Deterministic 24h quote volume of a pair, between 1M and 500M """
+    return 1e6 * (1 + zlib.crc32(pair.encode()) % 500)
+
+
+def synthetic_candle(pair: str, open_time: int, interval_ms: int):
+    """ Deterministic OHLCV candle for a pair, formatted like a Binance kline """
+    seed = zlib.crc32(pair.encode())
+    phase = (seed % 1000) / 159.0
+    base = 1 + seed % 5000
+    i = open_time // interval_ms
+
+    def price(k):
+        return base * (1 + 0.08*math.sin(k/41 + phase) + 0.02*math.sin(k/5.3 + 2*phase))
+
+    open_price, close_price = price(i), price(i + 1)
+    wick = 0.004 * abs(math.sin(i*12.9898 + phase))
+    high_price = max(open_price, close_price) * (1 + wick)
+    low_price = min(open_price, close_price) * (1 - wick)
+    volume = 1000 + 500*abs(math.sin(i*78.233 + phase))
+    return [
+        open_time, f'{open_price:.4f}', f'{high_price:.4f}', f'{low_price:.4f}', f'{close_price:.4f}',
+        f'{volume:.3f}', open_time + interval_ms - 1, f'{volume*close_price:.3f}', int(volume),
+        f'{volume/2:.3f}', f'{volume*close_price/2:.3f}', '0'
+    ]
+
+
+def synthetic_klines(pair: str, interval: str, limit=500, startTime=None, endTime=None, now_ms=None):
+    """ Candles matching Binance window semantics (most recent ones if no bound is given) """
+    interval_ms = INTERVALS_MS[interval]
+    now_ms = now_ms or int(tm.time()*1000)
+    last_open = (now_ms // interval_ms) * interval_ms
+    if endTime is not None:
+        last_open = min(last_open, (endTime // interval_ms) * interval_ms)
+    if startTime is not None:
+        first_open = -(-startTime // interval_ms) * interval_ms
+        last_open = min(last_open, first_open + (limit - 1)*interval_ms)
+    else:
+        first_open = last_open - (limit - 1)*interval_ms
+    return [synthetic_candle(pair, t, interval_ms) for t in range(first_open, last_open + 1, interval_ms)]
+
+
+class MockExchangeHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        self.server.request_count += 1
+        if self.server.latency:
+            tm.sleep(self.server.latency)
+        if url.path in ('/fapi/v1/continuousKlines', '/fapi/v1/klines'):
+            body = synthetic_klines(
+                query.get('pair') or query.get('symbol'),
+                query['interval'],
+                limit=int(query.get('limit', 500)),
+                startTime=int(query['startTime']) if 'startTime' in query else None,
+                endTime=int(query['endTime']) if 'endTime' in query else None,
+            )
+        elif url.path == '/fapi/v1/ticker/price':
+            pair = query['symbol']
+            body = {'symbol': pair, 'price': synthetic_klines(pair, '1m', limit=1)[-1][4]}
+        elif url.path == '/fapi/v1/exchangeInfo':
+            body = mock_exchange_info(self.server.n_pairs)
+        elif url.path == '/fapi/v1/ticker/24hr':
+            body = [
+                {'symbol': symbol['symbol'], 'quoteVolume': f"{mock_quote_volume(symbol['symbol']):.2f}"}
+                for symbol in mock_exchange_info(self.server.n_pairs)['symbols']
+            ]
+        elif url.path in ('/fapi/v1/time', '/api/v3/time'):
+            body = {'serverTime': int(tm.time()*1000) + self.server.clock_offset}
+        elif url.path == '/fapi/v2/balance':
+            timestamp = int(query['timestamp'])
+            server_time = int(tm.time()*1000) + self.server.clock_offset
+            if timestamp >= server_time + 1000 or server_time - timestamp > int(query.get('recvWindow', 5000)):
+                body = {'code': -1021, 'msg': "Timestamp for this request is outside of the recvWindow."}
+            else:
+                body = [{
+                    'accountAlias': 'mock', 'asset': 'USDT', 'balance': '1000.0', 'crossWalletBalance': '1000.0',
+                    'crossUnPnl': '0.0', 'availableBalance': '1000.0', 'maxWithdrawAmount': '1000.0',
+                    'marginAvailable': True, 'updateTime': server_time
+                }]
+        elif url.path == '/fapi/v1/ping':
+            body = {}
+        else:
+            self.send_error(404)
+            return
+        payload = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        return
+
+
+class MockExchange:
+    """ Threaded local HTTP server answering like the Binance futures API """
+
+    def __init__(self, latency=0.05, clock_offset=0, n_pairs=4):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), MockExchangeHandler)
+        self.server.daemon_threads = True
+        self.server.latency = latency
+        # Milliseconds the server clock is ahead of the local one
+        self.server.clock_offset = clock_offset
+        # Perpetual pairs listed by the exchange info
+        self.server.n_pairs = n_pairs
+        self.server.request_count = 0
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.server.server_address
+        return f'http://{host}:{port}'
+
+    @property
+    def request_count(self):
+        return self.server.request_count
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def prepare_workspace():
+    """
+    Create a throw-away working directory with dummy keys and a data file, chdir into it
+    and make the repository importable. Must be called before importing the scanner modules.
+    """
+    workspace = Path(tempfile.mkdtemp(prefix='preburst_'))
+    (workspace / 'keys').mkdir()
+    for name in ('api_public_key', 'api_private_key', 'telegram_token'):
+        (workspace / 'keys' / name).write_text('mock')
+    (workspace / 'files' / 'images').mkdir(parents=True)
+    os.chdir(workspace)
+    sys.path.insert(0, str(ROOT))
+    import pandas as pd
+    next_timestamp = pd.Timestamp(int(tm.time()), unit='s').ceil('4h')
+    data = {'next timestamp': next_timestamp, 'universe': [], 'nThreads': 0, 'opportunities': dict()}
+    with open(workspace / 'files' / 'data.pickle', 'wb') as _file:
+        pickle.dump(data, _file)
+    return workspace
+
+
+# WEBSOCKET STAND-IN
+# ------------------
+
+def synthetic_stream_events(pairs: list, timeframe: str, n_candles: int, now_ms=None):
+    """
+    Combined stream messages reporting the last n closed candles of each pair, in time order,
+    formatted like Binance continuous kline events.
+    """
+    interval_ms = INTERVALS_MS[timeframe]
+    now_ms = now_ms or int(tm.time()*1000)
+    end_time = (now_ms // interval_ms) * interval_ms - 1
+    events = []
+    for pair in pairs:
+        for kline in synthetic_klines(pair, timeframe, limit=n_candles, endTime=end_time):
+            events.append({
+                'stream': f'{pair.lower()}_perpetual@continuousKline_{timeframe}',
+                'data': {
+                    'e': 'continuous_kline', 'E': kline[6] + 1, 'ps': pair, 'ct': 'PERPETUAL',
+                    'k': {
+                        't': kline[0], 'T': kline[6], 'i': timeframe, 'f': 0, 'L': 0,
+                        'o': kline[1], 'c': kline[4], 'h': kline[2], 'l': kline[3], 'v': kline[5],
+                        'n': kline[8], 'x': True, 'q': kline[7], 'V': kline[9], 'Q': kline[10], 'B': '0'
+                    }
+                }
+            })
+    return sorted(events, key=lambda event: event['data']['k']['t'])
+
+
+def load_recording(path: Path):
+    """ Read stream messages recorded one JSON object per line """
+    with open(path, 'r') as _file:
+        return [json.loads(line) for line in _file if line.strip()]
+
+
+class ReplayStreamServer:
+    """
+    Local websocket server answering like the Binance combined stream endpoint.
+    Each client receives, in order, the recorded events of the streams it subscribed to,
+    `delay` seconds apart, then the connection stays open until the client leaves.
+    """
+
+    def __init__(self, events: list, delay=0.0):
+        self.events = events
+        self.delay = delay
+        self.sent = 0
+        self.port = None
+        self.ready = threading.Event()
+        self.thread = threading.Thread(target=self._serve, daemon=True)
+
+    @property
+    def url(self):
+        return f'ws://127.0.0.1:{self.port}/stream'
+
+    async def handler(self, request):
+        from aiohttp import web
+        streams = set(request.query.get('streams', '').split('/'))
+        websocket = web.WebSocketResponse()
+        await websocket.prepare(request)
+        for event in self.events:
+            if event['stream'] in streams:
+                await websocket.send_str(json.dumps(event))
+                self.sent += 1
+                await asyncio.sleep(self.delay)
+        async for _ in websocket:
+            pass
+        return websocket
+
+    def _serve(self):
+        from aiohttp import web
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        app = web.Application()
+        app.router.add_get('/stream', self.handler)
+        self.runner = web.AppRunner(app)
+        self.loop.run_until_complete(self.runner.setup())
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        self.loop.run_until_complete(site.start())
+        self.port = site._server.sockets[0].getsockname()[1]
+        self.ready.set()
+        self.loop.run_forever()
+
+    def __enter__(self):
+        self.thread.start()
+        self.ready.wait()
+        return self
+
+    def __exit__(self, *args):
+        asyncio.run_coroutine_threadsafe(self.runner.cleanup(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
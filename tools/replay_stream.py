@@ -0,0 +1,69 @@
+# PreBurst Signals Telegram Bot
+#
+# Antoine Beretto
+# GitHub: @augustin999
+#
+# April 2021
+#
+# Run the stream scanner against a local websocket replaying kline events,
+# with the mock exchange serving the REST warm-up. Events are either synthetic
+# closed candles or a recording (one combined stream message per line).
+#
+# Usage: python tools/replay_stream.py [n_pairs] [recording.jsonl]
+
+import asyncio
+import sys
+import time as tm
+
+from mock_exchange import (
+    MockExchange, ReplayStreamServer, load_recording, mock_pairs, prepare_workspace, synthetic_stream_events
+)
+
+prepare_workspace()
+
+from scanner import futures_api, kline_stream, utils
+from scanner.http_client import HttpClient
+
+N_CANDLES = 5
+
+
+async def replay(scanner: kline_stream.StreamScanner, server: ReplayStreamServer, n_events: int):
+    """ Stop the scanner once every event has been sent and handled """
+    task = asyncio.ensure_future(scanner.run())
+    while server.sent < n_events or scanner.stream.tasks:
+        await asyncio.sleep(0.1)
+    scanner.stop()
+    task.cancel()
+
+
+if __name__ == '__main__':
+    n_pairs = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    if len(sys.argv) > 2:
+        events = load_recording(sys.argv[2])
+        universe = sorted({event['data']['ps'] for event in events})
+    else:
+        universe = mock_pairs(n_pairs)
+        events = synthetic_stream_events(universe, utils.TIMEFRAME, N_CANDLES)
+    for pair in universe:
+        # Around the lower third of the synthetic spans, so that some alerts fire
+        utils.BB_SPAN_THRESHOLDS.setdefault(utils.TIMEFRAME, dict()).setdefault(pair, 0.04)
+
+    opportunities = []
+
+    def on_opportunity(pair, opportunity):
+        opportunities.append(pair)
+        print(f"{pair}: opportunity at {opportunity['time']}, price {opportunity['price']}")
+        png = opportunity['chart'].result()
+        print(f'{pair}: chart rendered ({len(png)//1024} kB)')
+
+    with MockExchange(latency=0.01) as exchange, ReplayStreamServer(events) as server:
+        futures_api.CLIENT = HttpClient(exchange.url)
+        scanner = kline_stream.StreamScanner(universe, on_opportunity, url=server.url)
+        start = tm.perf_counter()
+        try:
+            asyncio.run(replay(scanner, server, len(events)))
+        except asyncio.CancelledError:
+            pass
+        elapsed = tm.perf_counter() - start
+        print(f'{len(events)} events for {len(universe)} pairs in {elapsed:.2f} s')
+        print(f'{exchange.request_count} REST requests (warm-up), {len(opportunities)} opportunities')